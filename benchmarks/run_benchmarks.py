@@ -0,0 +1,247 @@
+# benchmarks/run_benchmarks.py
+"""
+Stage benchmarks on synthetic campaign data.
+
+    python -m benchmarks.run_benchmarks                    # run and compare with the baseline
+    python -m benchmarks.run_benchmarks --save             # run and record a new baseline
+    python -m benchmarks.run_benchmarks --rows 1000 1000000 --threshold 0.2
+
+Each stage is timed over --repeat runs (median and min wall time) and run once
+more under tracemalloc for its peak allocation. A stage regresses when its median
+time exceeds the baseline by more than --threshold, or its peak memory by more
+than --mem-threshold; the exit status is 1 if any stage regressed.
+Baselines are machine-specific: record one per machine/CI runner.
+
+The in-memory analysis path (clean_data -> compute_kpis -> run_ab_tests ->
+build_chart_specs) is also checked without a baseline: its peak allocation must
+stay within --max-frame-ratio times the cleaned frame's size, plus a fixed
+bootstrap chunk budget. The path holds the cleaned frame plus, at any one time,
+one stage's row-level temporaries (int64 group codes and a float64 measure or
+two), about one more frame; a single extra full-frame copy breaks the default
+ratio of 2. tests/test_memory.py runs the same check under pytest.
+"""
+from __future__ import annotations
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from src.data_processing.synthetic import DirtyValues, write_campaign_csv
+from src.data_processing.loader import load_data
+from src.data_processing.cleaner import clean_data
+from src.analysis_engine.aggregates import aggregate_groups
+from src.analysis_engine.metrics import compute_kpis
+from src.analysis_engine.statistic_test import run_ab_tests
+from src.analysis_engine.charts import build_chart_specs, render_charts
+from src.reporting.ai_report import _build_fallback_slide_structure
+from src.reporting.export import export_report
+
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+DEFAULT_ROWS = [1_000, 10_000, 100_000]
+PIPELINE_MAX_ROWS = 1_000_000  # run_pipeline also renders and exports; skip it above this size
+MAX_FRAME_RATIO = 2.0  # analysis path peak allocation / cleaned frame size
+FRAME_SLACK_MB = 8.0  # fixed allocations (group tables, chart specs) on top of the ratio
+PATH_BOOTSTRAP_BYTES = 8 * 1024 * 1024  # bootstrap chunk budget on the analysis path
+
+# Realistic defect rates for the synthetic exports
+DIRTY = DirtyValues(blank_rate=0.002, zero_reach_rate=0.002, bad_date_rate=0.001, duplicate_rate=0.001)
+
+
+@contextlib.contextmanager
+def _chdir(path: Path):
+    cwd = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(cwd)
+
+
+def measure(fn: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    """Wall time over `repeat` runs plus the tracemalloc peak of one extra run."""
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "time_s": statistics.median(times),
+        "time_min_s": min(times),
+        "peak_mb": peak / 1e6,
+        "repeat": repeat,
+    }
+
+
+def _analysis_path(raw: pd.DataFrame) -> None:
+    """Everything run_pipeline does in memory with the cleaned frame, end to end."""
+    clean = clean_data(raw, save=False)
+    agg = aggregate_groups(clean)
+    metrics = compute_kpis(clean)
+    run_ab_tests(clean, agg=agg, bootstrap_max_bytes=PATH_BOOTSTRAP_BYTES)
+    build_chart_specs(clean, metrics, agg=agg)
+
+
+def bench_size(n_rows: int, repeat: int, workdir: Path) -> Dict[str, Dict[str, float]]:
+    """Benchmark every stage on one synthetic export of n_rows rows."""
+    n_campaigns = max(1, n_rows // 2000)  # keep (campaign, date) keys unique
+    csv_path = workdir / f"campaign_{n_rows}.csv"
+    write_campaign_csv(csv_path, n_rows, n_campaigns=n_campaigns, dirty=DIRTY)
+
+    # Stage inputs are prepared outside the timed region.
+    raw = load_data(str(csv_path))
+    clean = clean_data(raw, save=False)
+    frame_mb = clean.memory_usage(deep=True).sum() / 1e6
+    metrics = compute_kpis(clean)
+    stats = run_ab_tests(clean)
+    charts = render_charts(build_chart_specs(clean, metrics, agg=aggregate_groups(clean)),
+                           workdir / "charts", max_workers=1)["paths"]
+    report = _build_fallback_slide_structure(metrics, stats, charts)
+
+    stages: Dict[str, Callable[[], Any]] = {
+        "load_data": lambda: load_data(str(csv_path)),
+        "clean_data": lambda: clean_data(raw, save=False),
+        "compute_kpis": lambda: compute_kpis(clean),
+        "run_ab_tests": lambda: run_ab_tests(clean),
+        "export": lambda: export_report(report, charts, {"pptx": None, "pdf": None}),
+        "analysis_path": lambda: _analysis_path(raw),
+    }
+    if n_rows <= PIPELINE_MAX_ROWS:
+        from src.pipe import run_pipeline
+        pipeline_dir = workdir / f"pipeline_{n_rows}"
+        pipeline_dir.mkdir(exist_ok=True)
+
+        def pipeline():
+            with _chdir(pipeline_dir):
+                run_pipeline(csv_path=str(csv_path), use_cache=False, chart_workers=1)
+        stages["run_pipeline"] = pipeline
+
+    results = {}
+    for name, fn in stages.items():
+        results[f"{name}[{n_rows}]"] = measure(fn, repeat)
+        r = results[f"{name}[{n_rows}]"]
+        r["frame_mb"] = frame_mb
+        print(f"  {name:<14} rows={n_rows:<10} median={r['time_s']:.4f}s  peak={r['peak_mb']:.1f}MB", flush=True)
+    return results
+
+
+def compare(current: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            threshold: float, mem_threshold: float) -> List[str]:
+    """Names of the benchmarks whose time or memory regressed beyond the thresholds."""
+    regressions = []
+    print(f"\n{'benchmark':<28}{'time':>10}{'base':>10}{'ratio':>8}{'peak MB':>10}{'base':>10}{'ratio':>8}")
+    for name, r in current.items():
+        b = baseline.get(name)
+        if b is None:
+            print(f"{name:<28}{r['time_s']:>10.4f}{'-':>10}{'':>8}{r['peak_mb']:>10.1f}{'-':>10}")
+            continue
+        t_ratio = r["time_s"] / b["time_s"] if b["time_s"] else np.inf
+        m_ratio = r["peak_mb"] / b["peak_mb"] if b["peak_mb"] else np.inf
+        flag = ""
+        if t_ratio > 1 + threshold or m_ratio > 1 + mem_threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<28}{r['time_s']:>10.4f}{b['time_s']:>10.4f}{t_ratio:>8.2f}"
+              f"{r['peak_mb']:>10.1f}{b['peak_mb']:>10.1f}{m_ratio:>8.2f}{flag}")
+    return regressions
+
+
+def frame_limit_mb(frame_mb: float, max_ratio: float = MAX_FRAME_RATIO) -> float:
+    """
+    Allowed analysis path peak: max_ratio x the cleaned frame plus the bootstrap
+    chunk budget (counted twice: a chunk and the replicate buffers around it) and
+    FRAME_SLACK_MB.
+    """
+    return max_ratio * frame_mb + 2 * PATH_BOOTSTRAP_BYTES / 1e6 + FRAME_SLACK_MB
+
+
+def check_frame_ratio(current: Dict[str, Dict[str, float]], max_ratio: float) -> List[str]:
+    """Names of the analysis_path benchmarks whose peak allocation exceeds frame_limit_mb."""
+    violations = []
+    print(f"\n{'memory check':<28}{'peak MB':>10}{'frame MB':>10}{'ratio':>8}{'limit MB':>10}")
+    for name, r in current.items():
+        if not name.startswith("analysis_path["):
+            continue
+        limit = frame_limit_mb(r["frame_mb"], max_ratio)
+        ratio = r["peak_mb"] / r["frame_mb"] if r["frame_mb"] else np.inf
+        flag = ""
+        if r["peak_mb"] > limit:
+            violations.append(name)
+            flag = "  OVER"
+        print(f"{name:<28}{r['peak_mb']:>10.1f}{r['frame_mb']:>10.1f}{ratio:>8.2f}{limit:>10.1f}{flag}")
+    return violations
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS, help="synthetic export sizes")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed relative time increase")
+    parser.add_argument("--mem-threshold", type=float, default=0.10, help="allowed relative peak memory increase")
+    parser.add_argument("--max-frame-ratio", type=float, default=MAX_FRAME_RATIO,
+                        help="allowed analysis path peak / cleaned frame size (0 disables the check)")
+    parser.add_argument("--output", type=Path, help="also write the results JSON here")
+    args = parser.parse_args(argv)
+
+    os.environ.pop("OPENAI_API_KEY", None)  # time the deterministic report path, never the network
+
+    results: Dict[str, Dict[str, float]] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.rows:
+            print(f"Benchmarking {n} rows…", flush=True)
+            results.update(bench_size(n, args.repeat, Path(tmp)))
+
+    doc = {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(doc, indent=2))
+
+    regressions = check_frame_ratio(results, args.max_frame_ratio) if args.max_frame_ratio else []
+
+    if args.save:
+        args.baseline.write_text(json.dumps(doc, indent=2))
+        print(f"\nBaseline written to {args.baseline}")
+    elif not args.baseline.exists():
+        print(f"\nNo baseline at {args.baseline}; run with --save to record one.")
+    else:
+        baseline = json.loads(args.baseline.read_text())["results"]
+        regressions += compare(results, baseline, args.threshold, args.mem_threshold)
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s): " + ", ".join(regressions))
+        return 1
+    print("\nNo regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
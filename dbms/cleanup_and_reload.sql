@@ -1,45 +1,113 @@
 -- cleanup_and_reload.sql
--- Run this with:
---   sqlite3 sql.db ".read sql/cleanup_and_reload.sql"
--- IMPORTANT: Edit the .import path below to your actual CSV path before running.
+-- Idempotent reload: upserts the processed CSV into campaign_data on the natural
+-- key (campaign_name, date) and refreshes only the rollup partitions that changed.
+-- Re-running it on unchanged data writes nothing. Run from the repo root with:
+--   sqlite3 sql.db ".read dbms/cleanup_and_reload.sql"
+-- (src/data_processing/database.py load_frame does the same from Python.)
 
 .echo on
 .mode csv
 .headers on
 
--- 1) Start clean
+-- 1) Empty the staging table only; campaign_data keeps its history
 DELETE FROM raw_campaign_data;
-DELETE FROM campaign_data;
 
--- 2) Import CSV (EDIT THIS PATH)
-.import /Users/cathelenegeorge/Desktop/AB_Testing/data/processed/cleaned_campaign.csv raw_campaign_data
+-- 2) Import CSV (path relative to the repo root)
+.import data/processed/cleaned_campaign.csv raw_campaign_data
 
 -- 3) Drop any header rows that slipped into RAW
 DELETE FROM raw_campaign_data
 WHERE TRIM(COALESCE("Date", '')) = 'Date'
    OR TRIM(COALESCE("group", '')) = 'group';
 
--- 4) Insert DISTINCT clean rows
+-- 4) Stage typed rows, one per natural key (the last imported row wins)
+DROP TABLE IF EXISTS temp._staging;
+CREATE TEMP TABLE _staging AS
+SELECT
+    "Campaign Name"                    AS campaign_name,
+    SUBSTR(TRIM("Date"), 1, 10)        AS date,
+    CAST("Spend [USD]" AS REAL)        AS spend_usd,
+    CAST("# of Impressions" AS INT)    AS impressions,
+    CAST("Reach" AS INT)               AS reach,
+    CAST("# of Website Clicks" AS INT) AS website_clicks,
+    CAST("# of Searches" AS INT)       AS searches,
+    CAST("# of View Content" AS INT)   AS view_content,
+    CAST("# of Add to Cart" AS INT)    AS add_to_cart,
+    CAST("# of Purchase" AS INT)       AS purchases,
+    "group"                            AS group_name
+FROM raw_campaign_data
+WHERE TRIM(COALESCE("Date", '')) <> ''
+  AND rowid IN (
+    SELECT MAX(rowid) FROM raw_campaign_data
+    GROUP BY "Campaign Name", SUBSTR(TRIM("Date"), 1, 10)
+  );
+
+-- 5) Classify against the table: insert (new key), update (values changed), skip
+ALTER TABLE _staging ADD COLUMN action TEXT;
+UPDATE _staging AS s SET action = COALESCE(
+    (SELECT CASE
+              WHEN (c.spend_usd, c.impressions, c.reach, c.website_clicks, c.searches,
+                    c.view_content, c.add_to_cart, c.purchases, c.group_name)
+                IS (s.spend_usd, s.impressions, s.reach, s.website_clicks, s.searches,
+                    s.view_content, s.add_to_cart, s.purchases, s.group_name)
+              THEN 'skip' ELSE 'update' END
+     FROM campaign_data c
+     WHERE c.campaign_name = s.campaign_name AND c.date = s.date),
+    'insert');
+
+-- 6) Partitions to re-roll: written rows, plus the old partition of updated rows
+DROP TABLE IF EXISTS temp._touched;
+CREATE TEMP TABLE _touched AS
+SELECT group_name, date FROM _staging WHERE action <> 'skip'
+UNION
+SELECT c.group_name, c.date
+FROM _staging s JOIN campaign_data c ON c.campaign_name = s.campaign_name AND c.date = s.date
+WHERE s.action = 'update';
+
+-- 7) Upsert changed rows
 INSERT INTO campaign_data (
     campaign_name, date, spend_usd, impressions, reach,
     website_clicks, searches, view_content, add_to_cart, purchases, group_name
 )
-SELECT DISTINCT
-    "Campaign Name",
-    TRIM("Date"),
-    CAST("Spend [USD]" AS REAL),
-    CAST("# of Impressions" AS INT),
-    CAST("Reach" AS INT),
-    CAST("# of Website Clicks" AS INT),
-    CAST("# of Searches" AS INT),
-    CAST("# of View Content" AS INT),
-    CAST("# of Add to Cart" AS INT),
-    CAST("# of Purchase" AS INT),
-    "group"
-FROM raw_campaign_data
-WHERE TRIM(COALESCE("Date", '')) <> '';
+SELECT campaign_name, date, spend_usd, impressions, reach,
+       website_clicks, searches, view_content, add_to_cart, purchases, group_name
+FROM _staging
+WHERE action <> 'skip'
+ON CONFLICT (campaign_name, date) DO UPDATE SET
+    spend_usd      = excluded.spend_usd,
+    impressions    = excluded.impressions,
+    reach          = excluded.reach,
+    website_clicks = excluded.website_clicks,
+    searches       = excluded.searches,
+    view_content   = excluded.view_content,
+    add_to_cart    = excluded.add_to_cart,
+    purchases      = excluded.purchases,
+    group_name     = excluded.group_name;
+
+-- 8) Refresh KPI rollups for the touched partitions only
+DELETE FROM daily_rollup WHERE (group_name, date) IN (SELECT group_name, date FROM _touched);
+INSERT INTO daily_rollup
+SELECT c.date, c.group_name, COUNT(*), SUM(c.spend_usd), SUM(c.impressions), SUM(c.reach), SUM(c.website_clicks),
+       SUM(c.searches), SUM(c.view_content), SUM(c.add_to_cart), SUM(c.purchases),
+       SUM(c.reach <> 0), TOTAL(1.0 * c.purchases / NULLIF(c.reach, 0)),
+       TOTAL((1.0 * c.purchases / NULLIF(c.reach, 0)) * (1.0 * c.purchases / NULLIF(c.reach, 0)))
+FROM _touched t JOIN campaign_data c ON c.group_name = t.group_name AND c.date = t.date
+GROUP BY c.group_name, c.date;
+
+DELETE FROM group_rollup WHERE group_name IN (SELECT group_name FROM _touched);
+INSERT INTO group_rollup
+SELECT group_name, SUM(rows), SUM(spend_usd), SUM(impressions), SUM(reach), SUM(website_clicks),
+       SUM(searches), SUM(view_content), SUM(add_to_cart), SUM(purchases),
+       SUM(rpu_n), SUM(rpu_sum), SUM(rpu_sumsq)
+FROM daily_rollup
+WHERE group_name IN (SELECT group_name FROM _touched)
+GROUP BY group_name;
 
--- 5) Verify counts
+-- 9) Report what the load did
 SELECT
-  (SELECT COUNT(*) FROM raw_campaign_data)   AS raw_rows,
-  (SELECT COUNT(*) FROM campaign_data)       AS clean_rows;
+  (SELECT COUNT(*) FROM raw_campaign_data)                    AS raw_rows,
+  (SELECT COUNT(*) FROM _staging WHERE action = 'insert')     AS inserted,
+  (SELECT COUNT(*) FROM _staging WHERE action = 'update')     AS updated,
+  (SELECT COUNT(*) FROM _staging WHERE action = 'skip')       AS skipped,
+  (SELECT COUNT(*) FROM _touched)                             AS partitions_refreshed,
+  (SELECT COUNT(*) FROM campaign_data)                        AS clean_rows;
@@ -7,6 +7,8 @@ PRAGMA foreign_keys = ON;
 -- 1) Drop existing tables if they exist (safe for re-runs)
 DROP TABLE IF EXISTS raw_campaign_data;
 DROP TABLE IF EXISTS campaign_data;
+DROP TABLE IF EXISTS daily_rollup;
+DROP TABLE IF EXISTS group_rollup;
 
 -- 2) Create RAW table that mirrors the CSV headers exactly (including spaces/#).
 --    This lets us import the CSV with .import without worrying about column order.
@@ -39,8 +41,47 @@ CREATE TABLE campaign_data (
     purchases           INTEGER NOT NULL,
     group_name          TEXT NOT NULL
 );
+CREATE INDEX idx_campaign_group_date ON campaign_data (group_name, date);
+-- Natural key: one row per campaign and day (cleanup_and_reload.sql upserts on it)
+CREATE UNIQUE INDEX ux_campaign_key ON campaign_data (campaign_name, date);
 
--- 4) After loading into raw_campaign_data (see load_data.sql), populate campaign_data via:
+-- 4) KPI rollups (same schema as src/data_processing/database.py, which keeps them
+--    up to date per touched (group, date) partition). RPU = purchases / reach.
+CREATE TABLE daily_rollup (
+    date            DATE NOT NULL,
+    group_name      TEXT NOT NULL,
+    rows            INTEGER NOT NULL,
+    spend_usd       REAL NOT NULL,
+    impressions     INTEGER NOT NULL,
+    reach           INTEGER NOT NULL,
+    website_clicks  INTEGER NOT NULL,
+    searches        INTEGER NOT NULL,
+    view_content    INTEGER NOT NULL,
+    add_to_cart     INTEGER NOT NULL,
+    purchases       INTEGER NOT NULL,
+    rpu_n           INTEGER NOT NULL,
+    rpu_sum         REAL NOT NULL,
+    rpu_sumsq       REAL NOT NULL,
+    PRIMARY KEY (group_name, date)
+) WITHOUT ROWID;
+
+CREATE TABLE group_rollup (
+    group_name      TEXT PRIMARY KEY,
+    rows            INTEGER NOT NULL,
+    spend_usd       REAL NOT NULL,
+    impressions     INTEGER NOT NULL,
+    reach           INTEGER NOT NULL,
+    website_clicks  INTEGER NOT NULL,
+    searches        INTEGER NOT NULL,
+    view_content    INTEGER NOT NULL,
+    add_to_cart     INTEGER NOT NULL,
+    purchases       INTEGER NOT NULL,
+    rpu_n           INTEGER NOT NULL,
+    rpu_sum         REAL NOT NULL,
+    rpu_sumsq       REAL NOT NULL
+) WITHOUT ROWID;
+
+-- 5) After loading into raw_campaign_data (see load_data.sql), populate campaign_data via:
 -- INSERT INTO campaign_data (...columns...)
 -- SELECT ... FROM raw_campaign_data;
 -- (That statement lives in load_data.sql so you can re-run it after each import.)
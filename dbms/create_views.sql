@@ -1,22 +1,23 @@
 -- database: ../sql.db
 -- create_views.sql
 -- Create reusable views for quick exploration.
+-- Both views read the pre-aggregated rollup tables (see create_table.sql), so a
+-- query costs O(groups) / O(days x groups) instead of a scan of campaign_data.
 
 DROP VIEW IF EXISTS vw_group_kpis;
 CREATE VIEW vw_group_kpis AS
 WITH base AS (
   SELECT
     group_name,
-    SUM(spend_usd)        AS spend_usd,
-    SUM(impressions)      AS impressions,
-    SUM(reach)            AS reach,
-    SUM(website_clicks)   AS clicks,
-    SUM(searches)         AS searches,
-    SUM(view_content)     AS view_content,
-    SUM(add_to_cart)      AS add_to_cart,
-    SUM(purchases)        AS purchases
-  FROM campaign_data
-  GROUP BY group_name
+    spend_usd,
+    impressions,
+    reach,
+    website_clicks        AS clicks,
+    searches,
+    view_content,
+    add_to_cart,
+    purchases
+  FROM group_rollup
 )
 SELECT
   group_name,
@@ -41,12 +42,11 @@ WITH daily AS (
   SELECT
     date,
     group_name,
-    SUM(spend_usd)      AS spend_usd,
-    SUM(impressions)    AS impressions,
-    SUM(website_clicks) AS clicks,
-    SUM(purchases)      AS purchases
-  FROM campaign_data
-  GROUP BY date, group_name
+    spend_usd,
+    impressions,
+    website_clicks      AS clicks,
+    purchases
+  FROM daily_rollup
 )
 SELECT
   date,
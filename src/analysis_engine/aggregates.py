@@ -0,0 +1,264 @@
+# src/analysis_engine/aggregates.py
+from __future__ import annotations
+from dataclasses import dataclass, field, fields
+from typing import Dict, Any, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_numeric_dtype
+
+REVENUE_CANDIDATES = ['Revenue', 'Revenue [USD]', 'revenue', 'revenue_usd']
+
+# Summed measure columns -> GroupStats attribute
+SUM_COLS = {
+    'Spend [USD]': 'spend',
+    '# of Impressions': 'impressions',
+    'Reach': 'reach',
+    '# of Website Clicks': 'clicks',
+    '# of Searches': 'searches',
+    '# of View Content': 'view_content',
+    '# of Add to Cart': 'add_to_cart',
+    '# of Purchase': 'purchases',
+}
+
+@dataclass
+class GroupStats:
+    """Additive per-group sufficient statistics: column sums plus row-level RPU moments."""
+    rows: int = 0
+    spend: float = 0.0
+    impressions: float = 0.0
+    reach: float = 0.0
+    clicks: float = 0.0
+    searches: float = 0.0
+    view_content: float = 0.0
+    add_to_cart: float = 0.0
+    purchases: float = 0.0
+    revenue: float = 0.0
+    rpu_n: int = 0
+    rpu_sum: float = 0.0
+    rpu_sumsq: float = 0.0
+
+    def merge(self, other: GroupStats) -> GroupStats:
+        return GroupStats(**{f.name: getattr(self, f.name) + getattr(other, f.name) for f in fields(self)})
+
+    @property
+    def rpu_mean(self) -> float:
+        return self.rpu_sum / self.rpu_n if self.rpu_n else np.nan
+
+    @property
+    def rpu_var(self) -> float:
+        """Sample variance (ddof=1) of row-level RPU."""
+        if self.rpu_n < 2:
+            return np.nan
+        return max(self.rpu_sumsq - self.rpu_sum ** 2 / self.rpu_n, 0.0) / (self.rpu_n - 1)
+
+@dataclass
+class SufficientStats:
+    """
+    Mergeable per-group aggregates of a campaign frame.
+      - revenue_col     : revenue column summed into GroupStats.revenue (None => estimate from purchases)
+      - rpu_revenue_col : revenue behind the RPU moments (None => '# of Purchase' proxy)
+    """
+    groups: Dict[str, GroupStats] = field(default_factory=dict)
+    revenue_col: Optional[str] = None
+    rpu_revenue_col: Optional[str] = None
+
+    def merge(self, other: SufficientStats) -> SufficientStats:
+        groups = dict(self.groups)
+        for g, s in other.groups.items():
+            groups[g] = groups[g].merge(s) if g in groups else s
+        return SufficientStats(
+            groups=dict(sorted(groups.items())),
+            revenue_col=self.revenue_col or other.revenue_col,
+            rpu_revenue_col=self.rpu_revenue_col or other.rpu_revenue_col,
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "groups": {g: s.__dict__ for g, s in self.groups.items()},
+            "revenue_col": self.revenue_col,
+            "rpu_revenue_col": self.rpu_revenue_col,
+        }
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> SufficientStats:
+        return cls(
+            groups={g: GroupStats(**s) for g, s in d.get("groups", {}).items()},
+            revenue_col=d.get("revenue_col"),
+            rpu_revenue_col=d.get("rpu_revenue_col"),
+        )
+
+def as_numeric(s: pd.Series) -> pd.Series:
+    """Coerce a measure column to numbers, skipping the parse when it is already numeric."""
+    return s if is_numeric_dtype(s) else pd.to_numeric(s, errors="coerce")
+
+def _measure(s: pd.Series) -> np.ndarray:
+    """
+    A measure column as float64 for summing: compact integer widths would overflow
+    and float32 would accumulate rounding error (see schema.compact_dtypes).
+    """
+    return as_numeric(s).to_numpy(dtype="float64", na_value=np.nan)
+
+def _factorize(s: pd.Series) -> Tuple[np.ndarray, pd.Index]:
+    """
+    pd.factorize(s, sort=True), without its hash table (sized to the row count) where
+    the codes are known: categoricals use their own codes, and integer and datetime
+    columns spanning a narrow range (dates, day numbers) use offsets from the
+    minimum in steps of the values' common divisor. The uniques then cover every
+    category or the whole range, unobserved values included.
+    """
+    dtype = s.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        uniques = pd.Categorical.from_codes(np.arange(len(dtype.categories)), dtype=dtype)
+        return s.cat.codes.to_numpy().astype(np.int64), pd.CategoricalIndex(uniques)
+    if isinstance(dtype, np.dtype) and dtype.kind in "iM" and len(s):
+        v = s.to_numpy().view(np.int64)
+        missing = s.isna().to_numpy() if dtype.kind == "M" else None
+        if missing is not None and not missing.any():
+            missing = None
+        ok = v if missing is None else v[~missing]
+        if len(ok):
+            lo, hi = int(ok.min()), int(ok.max())
+            if -(1 << 62) < lo and hi < (1 << 62):
+                step = int(np.gcd.reduce(ok - lo)) or 1
+                span = (hi - lo) // step + 1
+                if span <= 4 * len(s) + 1024:
+                    codes = v - lo
+                    codes //= step
+                    if missing is not None:
+                        codes[missing] = -1
+                    uniques = np.arange(span, dtype=np.int64) * step + lo
+                    return codes, pd.Index(uniques.view(dtype) if dtype.kind == "M" else uniques.astype(dtype))
+    codes, uniques = pd.factorize(s, sort=True)
+    return codes, uniques
+
+def _group_codes(df: pd.DataFrame, keys: List[str]) -> Tuple[np.ndarray, pd.Index]:
+    """
+    Row codes over keys (-1 where a key is missing) and the index of the observed key
+    combinations, numbered as groupby(observed=True, sort=True).ngroup() would.
+    Each key is factorized on its own and the codes are combined arithmetically, so
+    the row-sized temporaries are a few integer code arrays rather than groupby's
+    hash tables over every key.
+    """
+    codes = np.zeros(len(df), dtype=np.int64)
+    missing = np.zeros(len(df), dtype=bool)
+    levels = []
+    size = 1
+    for k in keys:
+        c, uniques = _factorize(df[k])
+        missing |= c < 0
+        size *= max(len(uniques), 1)
+        if size > np.iinfo(np.int64).max // 2:
+            # Too many combinations to number arithmetically
+            grouper = df.groupby([df[k] for k in keys], observed=True, sort=True)
+            return grouper.ngroup().fillna(-1).to_numpy(dtype=np.int64), grouper.size().index
+        codes *= max(len(uniques), 1)
+        codes += c
+        levels.append(uniques)
+    valid = codes[~missing] if missing.any() else codes
+    if size <= 4 * len(df) + 1024:
+        present = np.flatnonzero(np.bincount(valid, minlength=size))
+        remap = np.full(size, -1, dtype=np.int64)
+        remap[present] = np.arange(len(present))
+        codes = remap[codes]  # missing rows hold arbitrary codes: reset below
+    else:
+        present, inverse = np.unique(valid, return_inverse=True)
+        if missing.any():
+            codes[~missing] = inverse
+        else:
+            codes = inverse.astype(np.int64, copy=False)
+    codes[missing] = -1
+
+    shape = [max(len(u), 1) for u in levels]
+    parts = np.unravel_index(present, shape) if len(keys) > 1 else [present]
+    arrays = [pd.Index(u).take(p) for u, p in zip(levels, parts)]
+    index = pd.MultiIndex.from_arrays(arrays, names=keys) if len(keys) > 1 else arrays[0].rename(keys[0])
+    return codes, index
+
+def sum_columns(df: pd.DataFrame, keys: List[str], columns: List[str]) -> pd.DataFrame:
+    """
+    groupby(keys, observed=True, sort=True)[columns].sum() as float64, one column at
+    a time (see _sum_by): NaN keys are dropped and NaN values skipped.
+    """
+    codes, index = _group_codes(df, keys)
+    valid = codes >= 0
+    if valid.all():
+        valid = None
+    else:
+        codes = codes[valid]
+    sums = {}
+    for c in columns:
+        values = _measure(df[c])
+        if valid is not None:
+            values = values[valid]
+        sums[c] = np.bincount(codes, weights=np.nan_to_num(values, nan=0.0), minlength=len(index))
+    return pd.DataFrame(sums, index=index)
+
+def _sum_by(df: pd.DataFrame, keys: List[str], revenue_col: Optional[str]) -> Tuple[pd.DataFrame, Optional[str], Optional[str]]:
+    """
+    Sums over keys of the measure columns, row counts and RPU moments.
+    The grouping is factorized once (_group_codes); each measure is then upcast and
+    summed on its own (np.bincount over the group codes), so peak memory stays at
+    one float64 column instead of a float64 copy of every measure. NaN keys are
+    dropped and NaN values skipped, as in groupby().sum().
+    """
+    kpi_revenue_col = next((c for c in REVENUE_CANDIDATES if c in df.columns), None)
+    rpu_revenue_col = revenue_col if revenue_col and revenue_col in df.columns else None
+
+    codes, index = _group_codes(df, keys)
+    valid = codes >= 0
+    if valid.all():
+        valid = None
+    else:
+        codes = codes[valid]
+
+    def total(values: np.ndarray) -> np.ndarray:
+        if valid is not None:
+            values = values[valid]
+        return np.bincount(codes, weights=np.nan_to_num(values, nan=0.0), minlength=len(index))
+
+    sums = {attr: total(_measure(df[c])) for c, attr in SUM_COLS.items() if c in df.columns}
+    if kpi_revenue_col:
+        sums['revenue'] = total(_measure(df[kpi_revenue_col]))
+
+    reach = _measure(df['Reach'])  # may be a view of df: not modified in place
+    rpu = _measure(df[rpu_revenue_col] if rpu_revenue_col else df['# of Purchase']) / np.where(reach != 0, reach, np.nan)
+    del reach
+    sums['rows'] = np.bincount(codes, minlength=len(index))
+    sums['rpu_n'] = total((~np.isnan(rpu)).astype(np.float64)).astype(np.int64)
+    sums['rpu_sum'] = total(rpu)
+    rpu *= rpu
+    sums['rpu_sumsq'] = total(rpu)
+
+    return pd.DataFrame(sums, index=index), kpi_revenue_col, rpu_revenue_col
+
+def _group_stats(row: pd.Series) -> GroupStats:
+    return GroupStats(**{k: (int(v) if k in ('rows', 'rpu_n') else float(v)) for k, v in row.items()})
+
+def aggregate_groups(df: pd.DataFrame, revenue_col: Optional[str] = None) -> SufficientStats:
+    """
+    Reduce a cleaned frame to per-group sufficient statistics in one groupby pass.
+    revenue_col selects the revenue behind row-level RPU (revenue / Reach), as in
+    run_ab_tests; KPI revenue uses the first of REVENUE_CANDIDATES present.
+    Non-numeric measure columns are coerced; numeric ones are used as-is.
+    """
+    sums, kpi_revenue_col, rpu_revenue_col = _sum_by(df, ['group'], revenue_col)
+    groups = {g: _group_stats(row) for g, row in sums.iterrows()}
+    return SufficientStats(groups=groups, revenue_col=kpi_revenue_col, rpu_revenue_col=rpu_revenue_col)
+
+def aggregate_experiments(
+    df: pd.DataFrame,
+    experiment_key: List[str],
+    revenue_col: Optional[str] = None
+) -> Dict[Tuple, SufficientStats]:
+    """
+    Per-experiment sufficient statistics from a single groupby over
+    experiment_key + ['group']. Keys of the result are tuples of experiment_key values.
+    """
+    sums, kpi_revenue_col, rpu_revenue_col = _sum_by(df, list(experiment_key) + ['group'], revenue_col)
+    out: Dict[Tuple, SufficientStats] = {}
+    for idx, row in sums.iterrows():
+        exp, g = tuple(idx[:-1]), idx[-1]
+        if exp not in out:
+            out[exp] = SufficientStats(revenue_col=kpi_revenue_col, rpu_revenue_col=rpu_revenue_col)
+        out[exp].groups[g] = _group_stats(row)
+    return out
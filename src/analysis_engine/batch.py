@@ -0,0 +1,173 @@
+# src/analysis_engine/batch.py
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Literal, Optional, Tuple
+import logging
+import os
+import time
+import numpy as np
+import pandas as pd
+from scipy.stats import norm, t as student_t
+
+from src.analysis_engine.aggregates import SufficientStats, aggregate_experiments
+from src.analysis_engine.metrics import compute_kpis_from_stats
+from src.analysis_engine.proportions import Correction, prop_test_matrix
+
+logger = logging.getLogger(__name__)
+
+RESULT_COLUMNS = ["test", "metric_A", "metric_B", "diff", "ci_low", "ci_high",
+                  "statistic", "pvalue", "pvalue_adj", "error"]
+
+CR_TESTS = {
+    "cr_click_based": ("Clicks", "clicks"),
+    "cr_reach_based": ("Reach", "reach"),
+}
+
+def _welch_arrays(nA, mA, vA, nB, mB, vB, z: float):
+    """Vectorized Welch t-test (A vs B, as ttest_ind) with a normal-approx CI for B - A."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sA, sB = vA / nA, vB / nB
+        se = np.sqrt(sA + sB)
+        tstat = (mA - mB) / se
+        dof = (sA + sB) ** 2 / (sA ** 2 / (nA - 1) + sB ** 2 / (nB - 1))
+        pvalue = 2 * student_t.sf(np.abs(tstat), dof)
+    diff = mB - mA
+    ok = (nA >= 2) & (nB >= 2)
+    nan = np.full_like(diff, np.nan)
+    return (np.where(ok, tstat, nan), np.where(ok, pvalue, nan), diff,
+            np.where(ok, diff - z * se, nan), np.where(ok, diff + z * se, nan), ok)
+
+def _evaluate_chunk(items: List[Tuple[Tuple, SufficientStats]], start: int, avg_order_value: float,
+                    alpha: float, conv_denominator: str,
+                    correction: Correction) -> Tuple[pd.DataFrame, List[Dict[str, Any]]]:
+    """
+    Evaluate a chunk of experiments with array kernels. Returns one tidy row per
+    experiment and test, identified by the experiment's integer position '_exp'
+    (start + its index in the chunk), and the compute_kpis dict of every experiment.
+    """
+    kpis = [compute_kpis_from_stats(a, avg_order_value=avg_order_value) for _, a in items]
+    complete = np.array([{"A", "B"}.issubset(a.groups) for _, a in items], dtype=bool)
+    positions = start + np.arange(len(items))
+    good = [item for item, ok in zip(items, complete) if ok]
+    frames = [pd.DataFrame({"_exp": positions[~complete], "test": None,
+                            "error": "Both groups A and B required in 'group' column."})]
+    if not good:
+        return pd.concat(frames, ignore_index=True), kpis
+
+    keys = positions[complete]
+    def arr(attr: str) -> np.ndarray:
+        return np.array([[getattr(a.groups[g], attr) for g in ("A", "B")] for _, a in good], dtype=float)
+
+    purchases = arr("purchases")
+
+    # --- Conversion rate tests: all experiments x metrics in one kernel call ---
+    names = [n for n, (den, _) in CR_TESTS.items() if conv_denominator in (den, "Both")]
+    if names:
+        nobs = np.stack([arr(CR_TESTS[n][1]) for n in names], axis=-1)          # (E, 2, M)
+        counts = np.repeat(purchases[..., None], len(names), axis=-1)
+        res = prop_test_matrix(counts, nobs, control=0, alpha=alpha, correction=correction)
+        for j, name in enumerate(names):
+            frames.append(pd.DataFrame({
+                "_exp": keys, "test": name,
+                "metric_A": res["rate"][:, 0, j], "metric_B": res["rate"][:, 1, j],
+                "diff": res["diff"][:, 0, j],
+                "ci_low": res["diff_ci_low"][:, 0, j], "ci_high": res["diff_ci_high"][:, 0, j],
+                "statistic": res["statistic"][:, 0, j], "pvalue": res["pvalue"][:, 0, j],
+                "pvalue_adj": res["pvalue_adj"][:, 0, j],
+                "error": np.where(np.isnan(res["pvalue"][:, 0, j]),
+                                  "Zero/invalid denominator for one or both groups.", None),
+            }))
+
+    # --- RPU Welch t-test from aggregated moments ---
+    n = arr("rpu_n")
+    s1, s2 = arr("rpu_sum"), arr("rpu_sumsq")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = s1 / n
+        var = np.maximum(s2 - s1 ** 2 / n, 0.0) / (n - 1)
+    tstat, pval, mdiff, lo, hi, ok = _welch_arrays(n[:, 0], mean[:, 0], var[:, 0], n[:, 1], mean[:, 1], var[:, 1],
+                                                   z=norm.isf(alpha / 2))
+    frames.append(pd.DataFrame({
+        "_exp": keys, "test": "rpu_ttest", "metric_A": mean[:, 0], "metric_B": mean[:, 1],
+        "diff": mdiff, "ci_low": lo, "ci_high": hi, "statistic": tstat, "pvalue": pval,
+        "error": np.where(ok, None, "Insufficient rows for RPU t-test."),
+    }))
+
+    # --- ROI (KPI definition of compute_kpis) ---
+    spend = arr("spend")
+    revenue = arr("revenue") if good[0][1].revenue_col else purchases * avg_order_value
+    with np.errstate(divide="ignore", invalid="ignore"):
+        roi = np.where(spend != 0, (revenue - spend) / spend, np.nan)
+    frames.append(pd.DataFrame({
+        "_exp": keys, "test": "roi", "metric_A": roi[:, 0], "metric_B": roi[:, 1],
+        "diff": roi[:, 1] - roi[:, 0], "error": None,
+    }))
+
+    out = pd.concat([f for f in frames if len(f)], ignore_index=True)
+    order = np.argsort(out["_exp"].to_numpy(dtype=np.int64), kind="stable")
+    return out.take(order).reset_index(drop=True), kpis
+
+def run_experiments(
+    df: pd.DataFrame,
+    experiment_key: str | List[str],
+    avg_order_value: float = 50.0,
+    alpha: float = 0.05,
+    conv_denominator: Literal["Clicks", "Reach", "Both"] = "Both",
+    revenue_col: Optional[str] = None,
+    max_workers: Optional[int] = None,
+    chunk_size: int = 50_000,
+    correction: Correction = "holm"
+) -> Dict[str, Any]:
+    """
+    Evaluate every experiment in df (one per distinct experiment_key value) with
+    the KPI and A/B test definitions of compute_kpis / run_ab_tests.
+
+      - One groupby over experiment_key + ['group'] builds all per-experiment aggregates
+      - Each chunk of chunk_size experiments is tested with array kernels
+        (prop_test_matrix for CRs, a vectorized Welch test for RPU); several chunks
+        run on a process pool (max_workers=1 evaluates inline)
+      - pvalue_adj applies `correction` to the CR tests within each experiment
+      - RPU CIs are the normal approximation (no per-experiment bootstrap)
+
+    Returns:
+      'results'             : tidy DataFrame, one row per experiment and test
+                              (cr_click_based, cr_reach_based, rpu_ttest, roi)
+      'kpis'                : {experiment key tuple: compute_kpis dict}
+      'n_experiments'       : number of experiments evaluated
+      'elapsed_s'           : wall-clock seconds
+      'experiments_per_sec' : throughput
+    """
+    keys = [experiment_key] if isinstance(experiment_key, str) else list(experiment_key)
+    t0 = time.perf_counter()
+
+    aggs = list(aggregate_experiments(df, keys, revenue_col=revenue_col).items())
+    starts = list(range(0, len(aggs), chunk_size))
+    chunks = [aggs[i:i + chunk_size] for i in starts]
+    args = (avg_order_value, alpha, conv_denominator, correction)
+
+    workers = max_workers or os.cpu_count() or 1
+    if workers == 1 or len(chunks) <= 1:
+        parts = [_evaluate_chunk(c, i, *args) for c, i in zip(chunks, starts)]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+            parts = list(pool.map(_evaluate_chunk, chunks, starts, *[[a] * len(chunks) for a in args]))
+
+    results = pd.concat([r for r, _ in parts], ignore_index=True) if parts else pd.DataFrame(columns=["_exp"])
+    results = results.reindex(columns=["_exp"] + RESULT_COLUMNS)
+    # Rows carry integer experiment positions; the key columns are looked up once at the end
+    exp = results.pop("_exp").to_numpy(dtype=np.int64)
+    key_frame = pd.DataFrame([k for k, _ in aggs], columns=keys) if aggs else pd.DataFrame(columns=keys)
+    key_cols = key_frame.take(exp).set_axis(results.index)
+    results = pd.concat([key_cols, results], axis=1)
+    kpis = {k: m for (k, _), m in zip(aggs, (m for _, chunk_kpis in parts for m in chunk_kpis))}
+
+    elapsed = time.perf_counter() - t0
+    throughput = len(aggs) / elapsed if elapsed > 0 else float("inf")
+    logger.info(f"Evaluated {len(aggs)} experiments in {elapsed:.2f}s ({throughput:.0f} experiments/s)")
+
+    return {
+        "results": results,
+        "kpis": kpis,
+        "n_experiments": len(aggs),
+        "elapsed_s": elapsed,
+        "experiments_per_sec": throughput,
+    }
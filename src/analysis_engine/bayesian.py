@@ -0,0 +1,231 @@
+# src/analysis_engine/bayesian.py
+from __future__ import annotations
+from typing import Any, Dict, List, Literal, Optional, Tuple
+import numpy as np
+from scipy.stats import beta as beta_dist, t as t_dist
+
+from src.analysis_engine.aggregates import SufficientStats
+
+QUAD_NODES = 2048       # quantile nodes of the P(Y > X) quadrature
+N_SAMPLES = 50_000      # posterior draws for intervals / losses without a closed form
+BETA_PRIOR = (1.0, 1.0)  # uniform prior on conversion rates
+
+
+def prob_greater(y, x, n_nodes: int = QUAD_NODES) -> np.ndarray:
+    """
+    P(Y > X) for independent continuous Y, X (frozen scipy distributions with
+    array parameters, broadcast together): the integral of F_X(F_Y^-1(u)) over
+    u in (0, 1), by the midpoint rule on n_nodes quantiles of Y. The integrand
+    is bounded and monotone, so the error is at most 1 / n_nodes even when the
+    posteriors barely overlap, and much smaller when they do.
+    """
+    u = (np.arange(n_nodes) + 0.5) / n_nodes
+    with np.errstate(invalid="ignore"):
+        return x.cdf(y.ppf(u)).mean(axis=-1)
+
+
+def _expand(*arrays: np.ndarray) -> List[np.ndarray]:
+    """Add a trailing axis for the quadrature nodes."""
+    return [np.asarray(a, dtype=float)[..., None] for a in arrays]
+
+
+def beta_binomial_matrix(
+    counts: np.ndarray,
+    nobs: np.ndarray,
+    control: int = 0,
+    prior: Tuple[float, float] = BETA_PRIOR,
+    cred: float = 0.95,
+    n_nodes: int = QUAD_NODES,
+    n_samples: int = N_SAMPLES,
+    random_state: Optional[int] = 42
+) -> Dict[str, np.ndarray]:
+    """
+    Beta-Binomial posteriors of every arm against the control arm, for every metric.
+    counts / nobs have shape (arms, metrics); per-comparison outputs have shape
+    (arms - 1, metrics), arms ordered as in the input minus the control.
+
+    Closed form / quadrature:
+      - posterior Beta(prior_a + counts, prior_b + nobs - counts): mean and equal-tailed interval
+      - prob_better   : P(p_arm > p_control) (prob_greater)
+      - expected_loss : E[max(p_control - p_arm, 0)], the rate given up by choosing the arm,
+                        via E[(X - Y)+] = E[X] P(X' > Y) - E[Y] P(X > Y') with X' ~ Beta(a + 1, b)
+      - expected_loss_control : the same for keeping the control
+    Sampled (n_samples draws of all arms at once, fixed seed):
+      - diff_ci_low / diff_ci_high : interval of p_arm - p_control
+    Arms with nobs 0 or counts above nobs give NaN.
+    """
+    counts = np.asarray(counts, dtype=float)
+    nobs = np.asarray(nobs, dtype=float)
+    valid = (nobs > 0) & (counts >= 0) & (counts <= nobs)
+    a = np.where(valid, prior[0] + counts, np.nan)
+    b = np.where(valid, prior[1] + nobs - counts, np.nan)
+    mean = a / (a + b)
+    tail = (1 - cred) / 2
+    with np.errstate(invalid="ignore"):
+        lo, hi = beta_dist.ppf(tail, a, b), beta_dist.ppf(1 - tail, a, b)
+
+    arms = [i for i in range(counts.shape[0]) if i != control]
+    a0, b0 = a[control:control + 1], b[control:control + 1]
+    a1, b1 = a[arms], b[arms]
+    m0, m1 = mean[control:control + 1], mean[arms]
+    A0, B0, A1, B1 = _expand(a0, b0, a1, b1)
+
+    p_arm = prob_greater(beta_dist(A1, B1), beta_dist(A0, B0), n_nodes)
+    # E[(X0 - X1)+] = m0 P(X0' > X1) - m1 P(X0 > X1'), primes size-biased by one success
+    loss_arm = m0 * prob_greater(beta_dist(A0 + 1, B0), beta_dist(A1, B1), n_nodes) \
+        - m1 * prob_greater(beta_dist(A0, B0), beta_dist(A1 + 1, B1), n_nodes)
+    loss_control = m1 * prob_greater(beta_dist(A1 + 1, B1), beta_dist(A0, B0), n_nodes) \
+        - m0 * prob_greater(beta_dist(A1, B1), beta_dist(A0 + 1, B0), n_nodes)
+
+    rng = np.random.default_rng(random_state)
+    ok = valid.all(axis=0)  # rng.beta rejects NaN parameters
+    draws = np.full((n_samples,) + a.shape, np.nan)
+    draws[..., ok] = rng.beta(a[:, ok], b[:, ok], size=(n_samples,) + a[:, ok].shape)
+    diff = draws[:, arms] - draws[:, control:control + 1]
+    diff_lo, diff_hi = np.quantile(diff, [tail, 1 - tail], axis=0)
+
+    return {
+        "mean": mean,
+        "ci_low": lo,
+        "ci_high": hi,
+        "prob_better": p_arm,
+        "expected_loss": np.maximum(loss_arm, 0),
+        "expected_loss_control": np.maximum(loss_control, 0),
+        "diff": m1 - m0,
+        "diff_ci_low": diff_lo,
+        "diff_ci_high": diff_hi,
+    }
+
+
+def normal_gamma_matrix(
+    n: np.ndarray,
+    mean: np.ndarray,
+    var: np.ndarray,
+    control: int = 0,
+    cred: float = 0.95,
+    n_nodes: int = QUAD_NODES,
+    n_samples: int = N_SAMPLES,
+    random_state: Optional[int] = 42
+) -> Dict[str, np.ndarray]:
+    """
+    Normal model with unknown mean and precision for a per-row metric (RPU), from
+    per-arm row count, mean and sample variance (shape (arms,)).
+
+    Under the reference prior the Normal-Gamma posterior has precision
+    tau ~ Gamma((n - 1) / 2, rate (n - 1) var / 2) and mu | tau ~ N(mean, 1 / (n tau)),
+    so mu's marginal is Student-t(n - 1, mean, sqrt(var / n)):
+      - mean / ci_low / ci_high and prob_better come from that t (quadrature)
+      - expected_loss, expected_loss_control and the diff interval use n_samples
+        draws of (tau, mu) for all arms at once, with a fixed seed
+    Arms with fewer than 2 rows or no spread give NaN.
+    """
+    n = np.asarray(n, dtype=float)
+    mean = np.asarray(mean, dtype=float)
+    var = np.asarray(var, dtype=float)
+    valid = (n >= 2) & (var > 0)
+    df = np.where(valid, n - 1, np.nan)
+    scale = np.where(valid, np.sqrt(var / n), np.nan)
+    loc = np.where(valid, mean, np.nan)
+    tail = (1 - cred) / 2
+    with np.errstate(invalid="ignore"):
+        lo, hi = t_dist.ppf(tail, df, loc, scale), t_dist.ppf(1 - tail, df, loc, scale)
+
+    arms = [i for i in range(n.shape[0]) if i != control]
+    D0, L0, S0 = _expand(df[control], loc[control], scale[control])
+    D1, L1, S1 = _expand(df[arms], loc[arms], scale[arms])
+    p_arm = prob_greater(t_dist(D1, L1, S1), t_dist(D0, L0, S0), n_nodes)
+
+    rng = np.random.default_rng(random_state)
+    mu = np.full((n_samples,) + n.shape, np.nan)
+    k = np.flatnonzero(valid)
+    if len(k):
+        tau = rng.gamma(df[k] / 2, 2 / (df[k] * var[k]), size=(n_samples, len(k)))
+        mu[:, k] = loc[k] + rng.standard_normal((n_samples, len(k))) / np.sqrt(n[k] * tau)
+    diff = mu[:, arms] - mu[:, [control]]
+    diff_lo, diff_hi = np.quantile(diff, [tail, 1 - tail], axis=0)
+
+    return {
+        "mean": loc,
+        "ci_low": lo,
+        "ci_high": hi,
+        "prob_better": p_arm,
+        "expected_loss": np.maximum(-diff, 0).mean(axis=0),
+        "expected_loss_control": np.maximum(diff, 0).mean(axis=0),
+        "diff": loc[arms] - loc[control],
+        "diff_ci_low": diff_lo,
+        "diff_ci_high": diff_hi,
+    }
+
+
+def _num(x: float) -> Optional[float]:
+    return None if not np.isfinite(x) else float(x)
+
+
+def _report(res: Dict[str, np.ndarray], groups: List[str], control: int, j: Any, model: str) -> Dict[str, Any]:
+    """One metric of a *_matrix result as {group: ...} dicts; j indexes the metric axis."""
+    others = [g for i, g in enumerate(groups) if i != control]
+    return {
+        "model": model,
+        "posterior_mean": {g: _num(res["mean"][i][j]) for i, g in enumerate(groups)},
+        "credible_interval_95": {g: [_num(res["ci_low"][i][j]), _num(res["ci_high"][i][j])]
+                                 for i, g in enumerate(groups)},
+        "vs_control": {
+            g: {
+                "prob_better": _num(res["prob_better"][k][j]),
+                "expected_loss": _num(res["expected_loss"][k][j]),
+                "expected_loss_control": _num(res["expected_loss_control"][k][j]),
+                "diff": _num(res["diff"][k][j]),
+                "diff_ci_95": [_num(res["diff_ci_low"][k][j]), _num(res["diff_ci_high"][k][j])],
+            }
+            for k, g in enumerate(others)
+        },
+    }
+
+
+def bayesian_ab(
+    agg: SufficientStats,
+    control: str = "A",
+    conv_denominator: Literal["Clicks", "Reach", "Both"] = "Both",
+    prior: Tuple[float, float] = BETA_PRIOR,
+    n_samples: int = N_SAMPLES,
+    random_state: Optional[int] = 42
+) -> Dict[str, Any]:
+    """
+    Bayesian counterpart of run_ab_tests_from_stats for every group against the control:
+      - cr_click_based / cr_reach_based : Beta-Binomial on Purchases / Clicks or / Reach
+        (as conv_denominator selects)
+      - rpu : Normal-Gamma on row-level RPU moments
+
+    Each entry: {'model', 'posterior_mean', 'credible_interval_95' (per group),
+    'vs_control': {group: {'prob_better', 'expected_loss', 'expected_loss_control',
+    'diff', 'diff_ci_95'}}}. prob_better is P(group beats control); expected_loss is
+    what choosing the group costs in expectation if it is in fact worse (in rate or
+    RPU units), expected_loss_control the same for keeping the control. All arms and
+    both CR definitions are evaluated in one array pass; sampled quantities are
+    reproducible for a given random_state.
+    """
+    groups = sorted(agg.groups)
+    if control not in groups or len(groups) < 2:
+        return {"error": f"Bayesian analysis needs the control group {control!r} and at least one other group."}
+    ctrl = groups.index(control)
+    stats = [agg.groups[g] for g in groups]
+
+    names = {"Clicks": ["cr_click_based"], "Reach": ["cr_reach_based"]}.get(
+        conv_denominator, ["cr_click_based", "cr_reach_based"])
+    bases = {"cr_click_based": "clicks", "cr_reach_based": "reach"}
+    counts = np.array([[s.purchases] * len(names) for s in stats], dtype=float)
+    nobs = np.array([[getattr(s, bases[name]) for name in names] for s in stats], dtype=float)
+    cr = beta_binomial_matrix(counts, nobs, control=ctrl, prior=prior,
+                              n_samples=n_samples, random_state=random_state)
+
+    out: Dict[str, Any] = {}
+    model = f"Beta-Binomial, Beta({prior[0]:g}, {prior[1]:g}) prior"
+    for j, name in enumerate(names):
+        out[name] = _report(cr, groups, ctrl, j, model)
+
+    rpu = normal_gamma_matrix([s.rpu_n for s in stats], [s.rpu_mean for s in stats],
+                              [s.rpu_var for s in stats], control=ctrl,
+                              n_samples=n_samples, random_state=random_state)
+    out["rpu"] = _report({k: v[..., None] for k, v in rpu.items()}, groups, ctrl, 0,
+                         "Normal-Gamma on row-level RPU, reference prior")
+    return out
@@ -0,0 +1,354 @@
+# src/analysis_engine/charts.py
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+import hashlib
+import json
+import logging
+import os
+import numpy as np
+import pandas as pd
+
+from src.analysis_engine.aggregates import REVENUE_CANDIDATES, SufficientStats, aggregate_groups, as_numeric, sum_columns
+from src.analysis_engine.funnel import FUNNEL_STAGES, funnel_arrays
+
+logger = logging.getLogger(__name__)
+
+CHARTS_DIR = Path("reports/charts")
+MANIFEST_NAME = ".manifest.json"
+# Digest of this module: editing the drawing code re-renders every chart
+RENDER_VERSION = hashlib.sha256(Path(__file__).read_bytes()).hexdigest()[:16]
+
+PALETTE = ["#4C72B0", "#DD8452", "#55A868", "#C44E52", "#8172B3", "#937860"]
+
+# Time-series charts: measure column -> (chart name, file stem, y label)
+TIME_SERIES = {
+    "# of Purchase": ("Purchases Over Time", "ts_purchases_by_group", "Purchases"),
+    "# of Impressions": ("Impressions Over Time", "ts_impressions_by_group", "Impressions"),
+    "Spend [USD]": ("Spend Over Time", "ts_spend_by_group", "Spend (USD)"),
+    "# of Website Clicks": ("Website Clicks Over Time", "ts_clicks_by_group", "Website Clicks"),
+}
+
+# Finest revenue histogram kept by ChartStats: at most HIST_GRID bins whose width is
+# the smallest power of two (not below HIST_MIN_WIDTH, well under a cent, while
+# int64 bin indices still cover values up to ~1e15) that spans the values
+HIST_GRID = 4096
+HIST_MIN_WIDTH = 2.0 ** -10
+
+
+def _hist_width(lo: int, hi: int, width: float) -> float:
+    """Double width until bin indices lo..hi (at the given width) fit in HIST_GRID bins."""
+    while hi - lo >= HIST_GRID:
+        lo, hi, width = lo // 2, hi // 2, width * 2
+    return width
+
+
+def _coarsen(hist: Dict[int, int], factor: int) -> Dict[int, int]:
+    """Merge every `factor` adjacent bins (floor(i / factor) == floor(x / (factor * width)))."""
+    if factor == 1:
+        return dict(hist)
+    out: Dict[int, int] = {}
+    for i, n in hist.items():
+        out[i // factor] = out.get(i // factor, 0) + n
+    return out
+
+
+@dataclass
+class ChartStats:
+    """
+    Mergeable inputs of the data-driven charts, so streaming chunks and incremental
+    folds draw the same charts as the full frame without reading it back.
+      - daily       : {group: {ISO date: sums of the TIME_SERIES measures}}
+      - hist        : {bin index: rows} of revenue_col, bin i covering [i, i + 1) * hist_width
+      - revenue_col : column behind the revenue distribution ('# of Purchase' proxy by default)
+    Merging coarsens the finer histogram to the wider power-of-two width, so the
+    merged bins are exactly those of the concatenated rows.
+    """
+    daily: Dict[str, Dict[str, List[float]]] = field(default_factory=dict)
+    hist: Dict[int, int] = field(default_factory=dict)
+    hist_width: float = HIST_MIN_WIDTH
+    revenue_col: str = "# of Purchase"
+
+    def merge(self, other: ChartStats) -> ChartStats:
+        daily = {g: dict(days) for g, days in self.daily.items()}
+        for g, days in other.daily.items():
+            mine = daily.setdefault(g, {})
+            for day, sums in days.items():
+                mine[day] = [a + b for a, b in zip(mine[day], sums)] if day in mine else list(sums)
+        daily = {g: dict(sorted(days.items())) for g, days in sorted(daily.items())}
+
+        width = max(self.hist_width, other.hist_width)
+        hist = _coarsen(self.hist, round(width / self.hist_width))
+        for i, n in _coarsen(other.hist, round(width / other.hist_width)).items():
+            hist[i] = hist.get(i, 0) + n
+        if hist:
+            wider = _hist_width(min(hist), max(hist), width)
+            hist, width = _coarsen(hist, round(wider / width)), wider
+        revenue_col = self.revenue_col if self.hist else other.revenue_col
+        return ChartStats(daily=daily, hist=dict(sorted(hist.items())), hist_width=width, revenue_col=revenue_col)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "daily": self.daily,
+            "hist": {str(i): n for i, n in self.hist.items()},
+            "hist_width": self.hist_width,
+            "revenue_col": self.revenue_col,
+        }
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> ChartStats:
+        return cls(
+            daily=d.get("daily", {}),
+            hist={int(i): int(n) for i, n in d.get("hist", {}).items()},
+            hist_width=float(d.get("hist_width", HIST_MIN_WIDTH)),
+            revenue_col=d.get("revenue_col", "# of Purchase"),
+        )
+
+
+def chart_stats(df: pd.DataFrame, revenue_col: Optional[str] = None) -> ChartStats:
+    """
+    ChartStats of a cleaned frame: one (Date, group) aggregation for all time-series
+    measures and one binning pass over the revenue column (revenue_col, else the
+    first REVENUE_CANDIDATES column present, as aggregate_groups, else purchases).
+    """
+    if not (revenue_col and revenue_col in df.columns):
+        revenue_col = next((c for c in REVENUE_CANDIDATES if c in df.columns), "# of Purchase")
+
+    # NaT dates are dropped through their codes, without a filtered copy of the frame
+    sums = sum_columns(df, ["Date", "group"], list(TIME_SERIES))
+    daily: Dict[str, Dict[str, List[float]]] = {}
+    dates = pd.to_datetime(sums.index.get_level_values("Date")).strftime("%Y-%m-%d")
+    for day, g, row in zip(dates, sums.index.get_level_values("group"), sums.to_numpy().tolist()):
+        daily.setdefault(str(g), {})[day] = row
+
+    values = as_numeric(df[revenue_col]).to_numpy(dtype=float, na_value=np.nan)
+    values = values[np.isfinite(values)]
+    hist: Dict[int, int] = {}
+    width = HIST_MIN_WIDTH
+    if len(values):
+        lo, hi = values.min(), values.max()
+        # Start one power of two below the bound on the fitting width, then double
+        if hi > lo:
+            width = max(HIST_MIN_WIDTH, 2.0 ** np.floor(np.log2((hi - lo) / (HIST_GRID + 1))))
+        width = _hist_width(int(np.floor(lo / width)), int(np.floor(hi / width)), width)
+        idx, counts = np.unique(np.floor(values / width).astype(np.int64), return_counts=True)
+        hist = dict(zip(idx.tolist(), counts.tolist()))
+    return ChartStats(daily=dict(sorted(daily.items())), hist=hist, hist_width=width, revenue_col=revenue_col)
+
+
+def _histogram(stats: ChartStats, max_bins: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Display bins from the fine histogram: Sturges' rule on the row count, capped at
+    max_bins, each display bin a whole number of fine bins.
+    """
+    n = sum(stats.hist.values())
+    if not n:
+        return np.zeros(0), np.zeros(1)
+    idx = np.fromiter(stats.hist.keys(), dtype=np.int64, count=len(stats.hist))
+    counts = np.fromiter(stats.hist.values(), dtype=np.int64, count=len(stats.hist))
+    lo, span = idx.min(), idx.max() - idx.min() + 1
+    bins = min(max_bins, int(np.ceil(np.log2(n))) + 1)
+    step = -(-span // bins)
+    n_bins = -(-span // step)
+    binned = np.bincount((idx - lo) // step, weights=counts, minlength=n_bins)
+    edges = (lo + np.arange(n_bins + 1) * step) * stats.hist_width
+    return binned, edges
+
+
+def _spec(name: str, stem: str, kind: str, title: str, data: Dict[str, Any], **style) -> Dict[str, Any]:
+    return {"name": name, "file": f"{stem}.png", "kind": kind, "title": title, "data": data, **style}
+
+
+def build_chart_specs(
+    data: pd.DataFrame | ChartStats,
+    metrics: Dict[str, Any],
+    agg: Optional[SufficientStats] = None,
+    revenue_col: Optional[str] = None,
+    hist_bins: int = 50
+) -> List[Dict[str, Any]]:
+    """
+    Pre-aggregate everything the report charts need into small, picklable specs.
+      - Time series and the revenue distribution come from ChartStats: data itself,
+        or chart_stats of a cleaned frame (revenue_col as there)
+      - Funnels, pies and the conversion-rate bars come from the group aggregates
+        (agg, or one aggregate_groups scan of the frame)
+      - The revenue distribution is binned here; workers only draw the counts
+    Chart names match the keys the report uses.
+    """
+    if isinstance(data, ChartStats):
+        if agg is None:
+            raise ValueError("agg is required when charts are built from ChartStats.")
+        stats = data
+    else:
+        stats = chart_stats(data, revenue_col=revenue_col)
+        agg = agg if agg is not None else aggregate_groups(data)
+    groups = sorted(agg.groups)
+    specs: List[Dict[str, Any]] = []
+
+    cr = {g: (s.purchases / s.reach if s.reach else 0.0) for g, s in agg.groups.items()}
+    specs.append(_spec("Conversion Rate by Group", "conversion_rate_by_group", "bar", "Conversion Rate by Group",
+                       {"labels": groups, "values": [cr[g] for g in groups]},
+                       xlabel="Group", ylabel="Conversion Rate (purchases / reach)", figsize=(6, 4)))
+
+    # Revenue distribution (row level, so binned before leaving this process)
+    counts, edges = _histogram(stats, hist_bins)
+    specs.append(_spec("Revenue Distribution", "revenue_distribution", "hist",
+                       "Revenue (or Purchase Proxy) Distribution",
+                       {"counts": counts.tolist(), "edges": edges.tolist()},
+                       xlabel=stats.revenue_col, ylabel="Count", figsize=(8, 4)))
+
+    roi = {g: metrics["groups"].get(g, {}).get("roi") for g in groups}
+    specs.append(_spec("Return of Investment ", "roi_comparison", "bar", "ROI by Group",
+                       {"labels": groups, "values": [np.nan if roi[g] is None else roi[g] for g in groups]},
+                       xlabel="Group", ylabel="ROI ( (revenue - spend) / spend )", figsize=(6, 4)))
+
+    # Time series: the (Date, group) sums of every measure
+    for j, (name, stem, ylabel) in enumerate(TIME_SERIES.values()):
+        series = {}
+        for g in groups:
+            days = stats.daily.get(g, {})
+            series[g] = {"x": list(days), "y": [sums[j] for sums in days.values()]}
+        specs.append(_spec(name, stem, "lines", f"{ylabel} over Time by Group", series,
+                           xlabel="Date", ylabel=ylabel, figsize=(9, 4)))
+
+    # Same arrays as funnel_analysis: stage volumes and stage-to-stage rates
+    funnel = funnel_arrays(agg, groups)
+    n_steps = len(FUNNEL_STAGES) - 1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        step_rates = funnel["counts"][:, :n_steps] / funnel["nobs"][:, :n_steps]
+    for i, g in enumerate(groups):
+        specs.append(_spec(f"Conversion Funnel — Group {g}", f"funnel_group_{g}", "funnel",
+                           f"Conversion Funnel - Group {g}",
+                           {"labels": funnel["stages"],
+                            "values": funnel["volumes"][i].tolist(),
+                            "rates": [None] + [float(r) if np.isfinite(r) else None for r in step_rates[i]]},
+                           figsize=(8, 5)))
+    for g in groups:
+        s = agg.groups[g]
+        specs.append(_spec(f"Spend vs Purchases — Group {g}", f"pie_spend_vs_purchases_group_{g}", "pie",
+                           f"Group {g}: Spend vs Purchases",
+                           {"labels": ["Total Spend", "Total Purchases"], "values": [s.spend, s.purchases]},
+                           figsize=(6, 6)))
+    return specs
+
+
+def spec_digest(spec: Dict[str, Any]) -> str:
+    """Hash of everything that determines a chart's pixels."""
+    canonical = json.dumps({"v": RENDER_VERSION, **spec}, sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def render_chart(spec: Dict[str, Any], out_dir: str) -> str:
+    """
+    Draw one spec to <out_dir>/<file> with the object-oriented Agg API.
+    No pyplot global state is touched, so this is safe in worker processes.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize=spec.get("figsize", (6, 4)))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    kind, data = spec["kind"], spec["data"]
+
+    if kind == "bar":
+        ax.bar(data["labels"], data["values"], color=PALETTE[:len(data["labels"])])
+    elif kind == "hist":
+        edges = np.asarray(data["edges"])
+        if len(data["counts"]):
+            ax.bar(edges[:-1], data["counts"], width=np.diff(edges), align="edge",
+                   color=PALETTE[0], edgecolor="white", linewidth=0.5)
+    elif kind == "lines":
+        for i, (g, s) in enumerate(data.items()):
+            ax.plot(np.array(s["x"], dtype="datetime64[D]"), s["y"], marker="o", markersize=3,
+                    color=PALETTE[i % len(PALETTE)], label=str(g))
+        ax.legend(title="Group")
+        fig.autofmt_xdate()
+    elif kind == "funnel":
+        values = np.asarray(data["values"], dtype=float)
+        y = np.arange(len(values))[::-1]
+        ax.barh(y, values, left=(values.max() - values) / 2 if len(values) else 0, color=PALETTE[0])
+        ax.set_yticks(y, data["labels"])
+        ax.set_xticks([])
+        ax.set_xlim(0, values.max() * 1.3 if len(values) and values.max() > 0 else 1)
+        rates = data.get("rates") or [None] * len(values)
+        for yi, v, r in zip(y, values, rates):
+            label = f"{v:,.0f}" if r is None else f"{v:,.0f} ({r:.1%})"
+            ax.text((values.max() + v) / 2 + values.max() * 0.01, yi, label, ha="left", va="center")
+    elif kind == "pie":
+        ax.pie(data["values"], labels=data["labels"], colors=["#636EFA", "#EF553B"],
+               autopct="%1.1f%%", startangle=90, wedgeprops={"width": 0.65})
+        ax.set_aspect("equal")
+    else:
+        raise ValueError(f"Unknown chart kind: {kind!r}")
+
+    ax.set_title(spec["title"])
+    if kind not in ("pie", "funnel"):
+        ax.set_xlabel(spec.get("xlabel", ""))
+        ax.set_ylabel(spec.get("ylabel", ""))
+        ax.grid(axis="y", alpha=0.3)
+    fig.tight_layout()
+
+    path = Path(out_dir) / spec["file"]
+    tmp = path.with_name(path.stem + ".tmp.png")
+    fig.savefig(tmp)
+    os.replace(tmp, path)
+    return str(path)
+
+
+def _load_manifest(out_dir: Path) -> Dict[str, str]:
+    try:
+        with open(out_dir / MANIFEST_NAME) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def render_charts(
+    specs: List[Dict[str, Any]],
+    out_dir: str | Path = CHARTS_DIR,
+    max_workers: Optional[int] = None,
+    force: bool = False
+) -> Dict[str, Any]:
+    """
+    Render chart specs to PNGs, in parallel worker processes.
+      - A chart is skipped when its spec digest matches the manifest in out_dir and
+        the PNG still exists (force=True re-renders everything)
+      - max_workers=1 renders inline
+
+    Returns:
+      'paths'    : {chart name: PNG path} for every spec
+      'rendered' : names drawn in this call
+      'skipped'  : names whose inputs were unchanged
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest = _load_manifest(out_dir)
+
+    digests = {s["file"]: spec_digest(s) for s in specs}
+    todo = [s for s in specs
+            if force or manifest.get(s["file"]) != digests[s["file"]] or not (out_dir / s["file"]).exists()]
+
+    workers = min(max_workers or os.cpu_count() or 1, len(todo))
+    if workers <= 1:
+        for s in todo:
+            render_chart(s, str(out_dir))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(render_chart, todo, [str(out_dir)] * len(todo)))
+
+    manifest.update({s["file"]: digests[s["file"]] for s in todo})
+    tmp = out_dir / (MANIFEST_NAME + ".tmp")
+    with open(tmp, "w") as fh:
+        json.dump(manifest, fh, indent=2, sort_keys=True)
+    os.replace(tmp, out_dir / MANIFEST_NAME)
+
+    rendered = {s["name"] for s in todo}
+    logger.info(f"Rendered {len(rendered)} charts, {len(specs) - len(rendered)} unchanged.")
+    return {
+        "paths": {s["name"]: str(out_dir / s["file"]) for s in specs},
+        "rendered": [s["name"] for s in specs if s["name"] in rendered],
+        "skipped": [s["name"] for s in specs if s["name"] not in rendered],
+    }
@@ -0,0 +1,117 @@
+# src/analysis_engine/funnel.py
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+from src.analysis_engine.aggregates import SufficientStats
+from src.analysis_engine.proportions import Correction, prop_test_matrix
+
+# Main path, in order: (label, GroupStats attribute)
+FUNNEL_STAGES = [
+    ("Impressions", "impressions"),
+    ("Website Clicks", "clicks"),
+    ("View Content", "view_content"),
+    ("Add to Cart", "add_to_cart"),
+    ("Purchase", "purchases"),
+]
+# Steps off the main path: (label, GroupStats attribute, attribute of the stage it branches from)
+FUNNEL_BRANCHES = [
+    ("Search", "searches", "clicks"),
+]
+
+
+def funnel_steps() -> List[Tuple[str, str, str]]:
+    """(step label, numerator attribute, denominator attribute) for every tested step."""
+    steps = [(f"{a} → {b}", attr_b, attr_a)
+             for (a, attr_a), (b, attr_b) in zip(FUNNEL_STAGES, FUNNEL_STAGES[1:])]
+    steps.append((f"{FUNNEL_STAGES[0][0]} → {FUNNEL_STAGES[-1][0]}", FUNNEL_STAGES[-1][1], FUNNEL_STAGES[0][1]))
+    labels = {attr: label for label, attr in FUNNEL_STAGES}
+    steps += [(f"{labels[parent]} → {label}", attr, parent) for label, attr, parent in FUNNEL_BRANCHES]
+    return steps
+
+
+def funnel_arrays(agg: SufficientStats, groups: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    The funnel as arrays over (groups, ...), built once from the group aggregates:
+      - volumes : (groups, stages) counts of FUNNEL_STAGES
+      - counts  : (groups, steps) numerators of funnel_steps()
+      - nobs    : (groups, steps) denominators of funnel_steps()
+    Both the tests (funnel_analysis) and the funnel charts read these arrays.
+    """
+    groups = sorted(agg.groups) if groups is None else groups
+    steps = funnel_steps()
+    stats = [agg.groups[g] for g in groups]
+    volumes = np.array([[getattr(s, attr) for _, attr in FUNNEL_STAGES] for s in stats], dtype=float)
+    counts = np.array([[getattr(s, num) for _, num, _ in steps] for s in stats], dtype=float)
+    nobs = np.array([[getattr(s, den) for _, _, den in steps] for s in stats], dtype=float)
+    return {
+        "groups": groups,
+        "stages": [label for label, _ in FUNNEL_STAGES],
+        "steps": [label for label, _, _ in steps],
+        "volumes": volumes.reshape(len(groups), len(FUNNEL_STAGES)),
+        "counts": counts.reshape(len(groups), len(steps)),
+        "nobs": nobs.reshape(len(groups), len(steps)),
+    }
+
+
+def _num(x: float) -> Optional[float]:
+    return None if not np.isfinite(x) else float(x)
+
+
+def funnel_analysis(
+    agg: SufficientStats,
+    control: str = "A",
+    alpha: float = 0.05,
+    correction: Correction = "holm"
+) -> Dict[str, Any]:
+    """
+    Stage-to-stage conversion, drop-off and per-step significance for every group.
+    All arms and steps are tested against the control in one prop_test_matrix call
+    (two-proportion z-tests; pvalue_adj corrects across all arm x step comparisons).
+
+    Returns
+      - groups, stages, volumes {group: [stage counts]}
+      - steps: one entry per funnel_steps() step with per-group rate, drop_off
+        (1 - rate), Wilson rate CI, and for non-control groups diff / diff CI /
+        pvalue / pvalue_adj against the control
+    Tests of steps with an empty base (or a count above its base) are NaN and are
+    left out of the correction; values that are not finite are reported as None.
+    """
+    arrays = funnel_arrays(agg)
+    groups = arrays["groups"]
+    if control not in groups or len(groups) < 2:
+        return {"error": f"Funnel tests need the control group {control!r} and at least one other group."}
+
+    ctrl = groups.index(control)
+    res = prop_test_matrix(arrays["counts"], arrays["nobs"], control=ctrl, alpha=alpha, correction=correction)
+    others = [g for i, g in enumerate(groups) if i != ctrl]
+
+    steps = []
+    for j, label in enumerate(arrays["steps"]):
+        step = {
+            "step": label,
+            "rate": {g: _num(res["rate"][i, j]) for i, g in enumerate(groups)},
+            "drop_off": {g: _num(1 - res["rate"][i, j]) for i, g in enumerate(groups)},
+            "rate_ci_95": {g: [_num(res["rate_ci_low"][i, j]), _num(res["rate_ci_high"][i, j])]
+                           for i, g in enumerate(groups)},
+            "tests": {
+                g: {
+                    "diff": _num(res["diff"][k, j]),
+                    "diff_ci_95": [_num(res["diff_ci_low"][k, j]), _num(res["diff_ci_high"][k, j])],
+                    "pvalue": _num(res["pvalue"][k, j]),
+                    "pvalue_adj": _num(res["pvalue_adj"][k, j]),
+                    "significant": bool(res["pvalue_adj"][k, j] < alpha),
+                }
+                for k, g in enumerate(others)
+            },
+        }
+        steps.append(step)
+
+    return {
+        "control": control,
+        "groups": groups,
+        "stages": arrays["stages"],
+        "volumes": {g: arrays["volumes"][i].tolist() for i, g in enumerate(groups)},
+        "steps": steps,
+        "correction": correction,
+    }
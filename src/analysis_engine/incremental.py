@@ -0,0 +1,198 @@
+# src/analysis_engine/incremental.py
+from __future__ import annotations
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Literal, Optional, Tuple
+import hashlib
+import io
+import json
+import logging
+import os
+import pandas as pd
+
+from src.analysis_engine.aggregates import SufficientStats, aggregate_groups
+from src.analysis_engine.charts import ChartStats, chart_stats
+
+logger = logging.getLogger(__name__)
+
+STATE_PATH = Path("data/processed/kpi_state.json")
+TAIL_BYTES = 4096  # bytes before the offset whose digest identifies the folded prefix
+KEY_WINDOW_DAYS = 31  # days up to the watermark whose row keys are kept to report re-sent rows
+
+OnDuplicate = Literal["warn", "raise", "ignore"]
+
+@dataclass
+class IncrementalState:
+    """
+    Persisted aggregate state:
+      - agg         : merged per-group statistics
+      - charts      : merged chart inputs (daily sums, revenue histogram)
+      - offset      : byte offset in the raw CSV just past the last folded line
+      - tail_digest : sha256 of the TAIL_BYTES before offset, to detect a rewritten file
+      - recent_keys : {ISO date: hashed (Campaign Name, Date) keys} of the folded rows
+                      within KEY_WINDOW_DAYS of the watermark, to report re-sent rows
+      - watermark   : ISO date of the newest folded row
+    """
+    agg: SufficientStats = field(default_factory=SufficientStats)
+    charts: ChartStats = field(default_factory=ChartStats)
+    offset: int = 0
+    tail_digest: Optional[str] = None
+    recent_keys: Dict[str, List[str]] = field(default_factory=dict)
+    watermark: Optional[str] = None
+    rows_folded: int = 0
+    rows_repeated: int = 0
+
+def load_state(path: str | Path = STATE_PATH) -> IncrementalState:
+    """Read the state file; a missing file yields an empty state."""
+    p = Path(path)
+    if not p.exists():
+        return IncrementalState()
+    with open(p) as fh:
+        d = json.load(fh)
+    # A state written before chart inputs were kept lacks them for the folded rows:
+    # read it without an offset, so read_new_rows rebuilds it
+    offset = int(d.get("offset", 0)) if "charts" in d else 0
+    return IncrementalState(
+        agg=SufficientStats.from_dict(d.get("agg", {})),
+        charts=ChartStats.from_dict(d.get("charts", {})),
+        offset=offset,
+        tail_digest=d.get("tail_digest"),
+        recent_keys={day: list(keys) for day, keys in d.get("recent_keys", {}).items()},
+        watermark=d.get("watermark"),
+        rows_folded=int(d.get("rows_folded", 0)),
+        rows_repeated=int(d.get("rows_repeated", 0)),
+    )
+
+def save_state(state: IncrementalState, path: str | Path = STATE_PATH) -> str:
+    """Write the state file atomically (temp file + rename) so a crash never leaves it half-written."""
+    p = Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_suffix(p.suffix + ".tmp")
+    with open(tmp, "w") as fh:
+        json.dump({
+            "agg": state.agg.to_dict(),
+            "charts": state.charts.to_dict(),
+            "offset": state.offset,
+            "tail_digest": state.tail_digest,
+            "recent_keys": state.recent_keys,
+            "watermark": state.watermark,
+            "rows_folded": state.rows_folded,
+            "rows_repeated": state.rows_repeated,
+        }, fh, indent=2)
+    os.replace(tmp, p)
+    return str(p)
+
+def reset_state(path: str | Path = STATE_PATH) -> None:
+    """Discard the state file, so the next incremental run folds the raw CSV from its first row."""
+    Path(path).unlink(missing_ok=True)
+
+def _tail_digest(fh, offset: int) -> str:
+    start = max(offset - TAIL_BYTES, 0)
+    fh.seek(start)
+    return hashlib.sha256(fh.read(offset - start)).hexdigest()
+
+def read_new_rows(
+    csv_path: str | Path,
+    state: IncrementalState,
+    dtype=None
+) -> Tuple[pd.DataFrame, int, str, bool]:
+    """
+    Parse only the lines of the raw CSV past state.offset; the header line is re-read
+    so the new rows get the file's column names. Everything up to EOF is read, a last
+    line without a trailing newline included (data/raw/campaign_data.csv ends without
+    one); lines appended later start past the returned offset.
+
+    If the file is shorter than the offset or the bytes before it no longer match
+    state.tail_digest, the file was rewritten rather than appended to (as is a state
+    with folded rows but no offset, written before offsets were tracked): every row
+    is read again and restarted=True tells the caller to rebuild the state.
+
+    Returns (new rows, offset after them, tail digest at that offset, restarted).
+    """
+    with open(csv_path, "rb") as fh:
+        header = fh.readline()
+        size = fh.seek(0, os.SEEK_END)
+        offset = state.offset
+        if offset:
+            restarted = offset > size or _tail_digest(fh, offset) != state.tail_digest
+        else:
+            restarted = state.rows_folded > 0
+        if restarted or offset < len(header):
+            offset = len(header)
+        fh.seek(offset)
+        data = fh.read()
+        end = offset + len(data)
+        digest = _tail_digest(fh, end)
+    # An append after an unterminated last line starts with its newline: a blank line to read_csv
+    df = pd.read_csv(io.BytesIO(header + data), dtype=dtype)
+    return df, end, digest, restarted
+
+def row_keys(df: pd.DataFrame) -> pd.Series:
+    """(Campaign Name, Date) of each cleaned row as one string; None where Date is missing."""
+    date = df["Date"].dt.strftime("%Y-%m-%d")
+    keys = df["Campaign Name"].astype(str) + "|" + date
+    return keys.where(df["Date"].notna(), None)
+
+def _hash_key(key: str) -> str:
+    return hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+
+def fold_new_rows(
+    df: pd.DataFrame,
+    path: str | Path = STATE_PATH,
+    revenue_col: Optional[str] = None,
+    rebuild: bool = False,
+    offset: Optional[int] = None,
+    tail_digest: Optional[str] = None,
+    on_duplicate: OnDuplicate = "warn"
+) -> Tuple[IncrementalState, pd.DataFrame]:
+    """
+    Fold new cleaned rows (see read_new_rows) into the persisted state.
+      - Every row is folded, as the full mode sums every row of the export, so the
+        merged statistics equal aggregate_groups over all rows read so far
+      - A (Campaign Name, Date) key repeated within df, or already folded for a date
+        within KEY_WINDOW_DAYS of the watermark, is reported per on_duplicate ("warn",
+        "ignore", or "raise", which folds nothing). Only hashes of those recent keys
+        are kept, so the state and the cost stay O(window + new rows)
+      - Only the new rows are aggregated, for the KPIs / tests and for the charts
+      - offset / tail_digest record the read position in the raw CSV
+      - rebuild=True discards the stored state and folds df from scratch
+
+    Returns (updated IncrementalState, rows folded in this call); feed state.agg to
+    compute_kpis_from_stats / run_ab_tests_from_stats and state.charts to build_chart_specs.
+    """
+    state = IncrementalState() if rebuild else load_state(path)
+
+    keys = row_keys(df).dropna()
+    hashed = keys.map(_hash_key)
+    seen = {h for day_keys in state.recent_keys.values() for h in day_keys}
+    dup = hashed.isin(seen) | hashed.duplicated()
+    if dup.any():
+        repeated: List[str] = sorted(set(keys[dup]))
+        shown = ", ".join(repr(k) for k in repeated[:10]) + (" …" if len(repeated) > 10 else "")
+        message = f"{int(dup.sum())} row(s) repeat an already folded (Campaign Name, Date) key: {shown}"
+        if on_duplicate == "raise":
+            raise ValueError(message)
+        if on_duplicate == "warn":
+            logger.warning(message + " (folded, as in the full mode)")
+        state.rows_repeated += int(dup.sum())
+
+    if len(df):
+        state.agg = state.agg.merge(aggregate_groups(df, revenue_col=revenue_col))
+        state.charts = state.charts.merge(chart_stats(df))
+        newest = df["Date"].max()
+        if pd.notna(newest):
+            newest = newest.date().isoformat()
+            state.watermark = max(state.watermark, newest) if state.watermark else newest
+        state.rows_folded += len(df)
+
+        days = df.loc[hashed.index, "Date"].dt.strftime("%Y-%m-%d")
+        for day, day_keys in hashed.groupby(days):
+            state.recent_keys[day] = sorted(set(state.recent_keys.get(day, [])) | set(day_keys))
+    if state.watermark:
+        cutoff = (pd.Timestamp(state.watermark) - pd.Timedelta(days=KEY_WINDOW_DAYS)).date().isoformat()
+        state.recent_keys = {day: k for day, k in sorted(state.recent_keys.items()) if day >= cutoff}
+    if offset is not None:
+        state.offset, state.tail_digest = offset, tail_digest
+    save_state(state, path)
+
+    return state, df
@@ -1,6 +1,10 @@
 # src/analysis_engine/metrics.py
+import numpy as np
 import pandas as pd
-from typing import Dict, Any
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+from src.analysis_engine.aggregates import SufficientStats, aggregate_groups
 
 def compute_kpis(df: pd.DataFrame, avg_order_value: float = 50.0) -> Dict[str, Any]:
     """
@@ -8,42 +12,32 @@ def compute_kpis(df: pd.DataFrame, avg_order_value: float = 50.0) -> Dict[str, A
     avg_order_value: fallback to compute revenue = purchases * aov if revenue is absent.
     Returns a dict with group-level metrics and overall metrics.
     """
+    return compute_kpis_from_stats(aggregate_groups(df), avg_order_value=avg_order_value)
 
-    df = df.copy()
-    # If a revenue column exists, use it. Otherwise estimate revenue from purchases.
-    revenue_col = None
-    for candidate in ['Revenue', 'Revenue [USD]', 'revenue', 'revenue_usd']:
-        if candidate in df.columns:
-            revenue_col = candidate
-            break
-
-    if revenue_col is None:
-        df['revenue_est'] = df['# of Purchase'] * avg_order_value
-        revenue_col = 'revenue_est'
-
-    # compute per-row metrics
-    df['conversion_rate'] = df['# of Purchase'] / df['Reach']  # purchases per reached user
-    df['revenue_per_user'] = df[revenue_col] / df['Reach']
-    df['cost_per_purchase'] = df['Spend [USD]'] / (df['# of Purchase'].replace(0, pd.NA))
-
-    # Aggregations by group
-    agg_funcs = {
-        'Spend [USD]': 'sum',
-        '# of Impressions': 'sum',
-        'Reach': 'sum',
-        '# of Purchase': 'sum',
-        revenue_col: 'sum',
-    }
-
-    group_agg = df.groupby('group').agg(agg_funcs).rename(columns={revenue_col: 'revenue'})
+def compute_kpis_from_db(db_path: str | Path = None, avg_order_value: float = 50.0,
+                         start: Optional[str] = None, end: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Same KPI dict as compute_kpis, read from the SQLite rollups maintained by
+    src.data_processing.database (optionally over an inclusive Date range).
+    If db_path is None, uses DB_PATH.
+    """
+    from src.data_processing.database import DB_PATH, read_group_stats
+    agg = read_group_stats(db_path or DB_PATH, start=start, end=end)
+    return compute_kpis_from_stats(agg, avg_order_value=avg_order_value)
 
+def compute_kpis_from_stats(agg: SufficientStats, avg_order_value: float = 50.0) -> Dict[str, Any]:
+    """
+    Same KPI dict as compute_kpis, derived from per-group sufficient statistics
+    (aggregate_groups, clean_data_stream) without touching row-level data.
+    """
     result = {}
-    for group, row in group_agg.iterrows():
-        spend = row['Spend [USD]']
-        revenue = row['revenue']
-        purchases = row['# of Purchase']
-        reach = row['Reach']
-        impressions = row['# of Impressions']
+    for group, s in agg.groups.items():
+        # If a revenue column was aggregated, use it. Otherwise estimate revenue from purchases.
+        spend = s.spend
+        revenue = s.revenue if agg.revenue_col else s.purchases * avg_order_value
+        purchases = s.purchases
+        reach = s.reach
+        impressions = s.impressions
 
         cr = purchases / reach if reach > 0 else 0
         rpu = revenue / reach if reach > 0 else 0
@@ -56,10 +50,15 @@ def compute_kpis(df: pd.DataFrame, avg_order_value: float = 50.0) -> Dict[str, A
             'purchases': int(purchases),
             'reach': int(reach),
             'impressions': int(impressions),
+            'clicks': int(s.clicks),
+            'rows': int(s.rows),
             'conversion_rate': float(cr),
             'revenue_per_user': float(rpu),
             'roi': float(roi) if roi is not None else None,
-            'cost_per_purchase': float(cpp) if cpp is not None else None
+            'cost_per_purchase': float(cpp) if cpp is not None else None,
+            # Row-level RPU (unit of the RPU t-test), used by the power planner
+            'rpu_row_mean': float(s.rpu_mean) if s.rpu_n else None,
+            'rpu_row_std': float(np.sqrt(s.rpu_var)) if s.rpu_n >= 2 else None
         }
 
     # Lift calculations (B vs A)
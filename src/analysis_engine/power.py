@@ -0,0 +1,217 @@
+# src/analysis_engine/power.py
+from __future__ import annotations
+from typing import Any, Dict, Optional, Sequence
+import numpy as np
+import pandas as pd
+from scipy.stats import norm, t as t_dist
+
+from src.analysis_engine.bootstrap import DEFAULT_MAX_BYTES
+
+PLAN_TESTS = ["cr_click_based", "cr_reach_based", "rpu_ttest"]
+N_SIMS = 2000           # simulated experiments per RPU scenario and candidate size
+# Candidate RPU sample sizes, as multiples of the normal-approximation size
+RPU_FACTORS = np.geomspace(0.5, 4.0, 25)
+
+
+def proportion_sample_size(p1, p2, alpha=0.05, power=0.8) -> np.ndarray:
+    """
+    Units per group for a two-sided two-proportion z-test (pooled SE under H0, as
+    _prop_test) to detect p1 -> p2 with the given power; equal allocation.
+    All arguments broadcast, so a grid of scenarios is one array expression.
+    """
+    p1, p2 = np.asarray(p1, dtype=float), np.asarray(p2, dtype=float)
+    za, zb = norm.isf(np.asarray(alpha, dtype=float) / 2), norm.ppf(power)
+    p_bar = (p1 + p2) / 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        n = (za * np.sqrt(2 * p_bar * (1 - p_bar)) + zb * np.sqrt(p1 * (1 - p1) + p2 * (1 - p2))) ** 2 / (p2 - p1) ** 2
+    valid = (p1 > 0) & (p1 < 1) & (p2 > 0) & (p2 < 1) & (p1 != p2)
+    return np.where(valid, np.ceil(n), np.nan)
+
+
+def rpu_sample_size(
+    mean_a, mean_b, std_a, std_b, alpha=0.05, power=0.8,
+    n_sims: int = N_SIMS,
+    random_state: Optional[int] = 42,
+    max_bytes: int = DEFAULT_MAX_BYTES
+) -> np.ndarray:
+    """
+    Rows per group for the Welch t-test on row-level RPU to reach `power`, by
+    simulation: every scenario (broadcast of the arguments) is tested at the
+    RPU_FACTORS multiples of its normal-approximation size n0, each with n_sims
+    simulated experiments, and the smallest passing size is interpolated on the
+    log scale. NaN when even the largest candidate falls short.
+
+    The simulated experiments share one set of standard normal draws (common random
+    numbers, fixed seed): sample means are normal, sample variances use the
+    Wilson-Hilferty normal approximation of the chi-square, so the cost does not
+    grow with n; the critical value uses the Welch df of the true variances.
+    Scenarios are processed in chunks of at most max_bytes.
+    """
+    mean_a, mean_b, std_a, std_b, alpha, power = np.broadcast_arrays(
+        *(np.asarray(v, dtype=float) for v in (mean_a, mean_b, std_a, std_b, alpha, power)))
+    shape = mean_a.shape
+    flat = [v.ravel() for v in (mean_a, mean_b, std_a, std_b, alpha, power)]
+    delta = flat[1] - flat[0]
+    var_sum = flat[2] ** 2 + flat[3] ** 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        n0 = (norm.isf(flat[4] / 2) + norm.ppf(flat[5])) ** 2 * var_sum / delta ** 2
+    n0 = np.where((delta != 0) & (var_sum > 0), np.maximum(n0, 2.0), np.nan)
+
+    rng = np.random.default_rng(random_state)
+    z_mean_a, z_mean_b, z_var_a, z_var_b = rng.standard_normal((4, n_sims))
+
+    out = np.full(len(n0), np.nan)
+    k = len(RPU_FACTORS)
+    step = max(1, int(max_bytes // (8 * 8 * k * n_sims)))  # ~8 float64 temporaries per cell
+    for lo in range(0, len(n0), step):
+        sl = slice(lo, lo + step)
+        ok = np.isfinite(n0[sl])
+        if not ok.any():
+            continue
+        ma, mb, sa, sb, al, pw = (v[sl][ok] for v in flat)
+        n = np.maximum(np.ceil(n0[sl][ok, None] * RPU_FACTORS), 2.0)[..., None]  # (scen, k, 1)
+        dof = n - 1
+        def chi2(z):  # chi-square(dof) / dof, Wilson-Hilferty
+            c = 2 / (9 * dof)
+            return np.maximum(1 - c + z * np.sqrt(c), 0) ** 3
+        va = (sa ** 2)[:, None, None] * chi2(z_var_a)
+        vb = (sb ** 2)[:, None, None] * chi2(z_var_b)
+        diff = (mb - ma)[:, None, None] + (sa[:, None, None] * z_mean_a - sb[:, None, None] * z_mean_b) / np.sqrt(n)
+        # Critical value at the Welch-Satterthwaite df of the true variances: one per
+        # (scenario, size), not per simulated experiment
+        va_, vb_ = (sa ** 2)[:, None, None], (sb ** 2)[:, None, None]
+        welch_df = (va_ + vb_) ** 2 / ((va_ ** 2 + vb_ ** 2) / dof)
+        crit = t_dist.isf(al[:, None, None] / 2, welch_df)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            reject = np.abs(diff) > crit * np.sqrt((va + vb) / n)
+        achieved = reject.mean(axis=-1)  # (scen, k)
+        n = n[..., 0]
+
+        passed = achieved >= pw[:, None]
+        first = np.argmax(passed, axis=1)
+        found = passed.any(axis=1)
+        # Log-linear interpolation between the last failing and the first passing size
+        prev = np.maximum(first - 1, 0)
+        rows = np.arange(len(first))
+        p_lo, p_hi = achieved[rows, prev], achieved[rows, first]
+        n_lo, n_hi = n[rows, prev], n[rows, first]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            frac = np.clip((pw - p_lo) / (p_hi - p_lo), 0, 1)
+        n_req = np.where(first > 0, np.exp(np.log(n_lo) + frac * (np.log(n_hi) - np.log(n_lo))), n_hi)
+        res = np.full(ok.sum(), np.nan)
+        res[found] = np.ceil(n_req[found])
+        out[np.arange(lo, min(lo + step, len(n0)))[ok]] = res
+    return out.reshape(shape)
+
+
+def _baseline(metrics: Dict[str, Any], group: str, days: Optional[float]) -> Dict[str, float]:
+    """Per-unit rates of one group from the compute_kpis dict."""
+    g = metrics["groups"][group]
+    reach, clicks, rows = g["reach"], g.get("clicks", 0), g.get("rows", 0)
+    span = days if days else rows  # one row per day, as the campaign export
+    nan = float("nan")
+    return {
+        "cr_reach": g["purchases"] / reach if reach else nan,
+        "cr_click": g["purchases"] / clicks if clicks else nan,
+        "click_rate": clicks / reach if reach else nan,
+        "daily_reach": reach / span if span else nan,
+        "daily_rows": rows / span if span else nan,
+        "reach_per_row": reach / rows if rows else nan,
+        "rpu_mean": g.get("rpu_row_mean") if g.get("rpu_row_mean") is not None else nan,
+        "rpu_std": g.get("rpu_row_std") if g.get("rpu_row_std") is not None else nan,
+        "days": span or nan,
+    }
+
+
+def plan_grid(
+    metrics: Dict[str, Any],
+    mde: Sequence[float] | float = 0.05,
+    alpha: Sequence[float] | float = 0.05,
+    power: Sequence[float] | float = 0.8,
+    relative: bool = True,
+    tests: Sequence[str] = PLAN_TESTS,
+    control: str = "A",
+    arm: str = "B",
+    days: Optional[float] = None,
+    n_sims: int = N_SIMS,
+    random_state: Optional[int] = 42
+) -> pd.DataFrame:
+    """
+    Sample sizes for every (test, mde, alpha, power) combination, from the current
+    per-group rates of a compute_kpis dict. The arm is assumed to move the control's
+    rate (or row-level RPU mean) by mde, relative (default) or absolute.
+
+      - cr_click_based : clicks per group from proportion_sample_size; reach = clicks / click rate
+      - cr_reach_based : reach per group from proportion_sample_size; clicks = reach x click rate
+      - rpu_ttest      : rows per group from rpu_sample_size (simulated Welch test);
+                         reach = rows x reach per row
+
+    days is the number of days the current data spans (default: each group's row
+    count, one row per day). days_needed is the experiment length at the current
+    daily reach (rows) of the slower group; additional_days subtracts the days
+    already run. One row per scenario; NaN where a test is undefined or, for RPU,
+    the size exceeds the simulated range.
+    """
+    base = {g: _baseline(metrics, g, days) for g in (control, arm)}
+    c = base[control]
+    grid = pd.MultiIndex.from_product([np.atleast_1d(mde), np.atleast_1d(alpha), np.atleast_1d(power)],
+                                      names=["mde", "alpha", "power"]).to_frame(index=False)
+    m, a, pw = (grid[k].to_numpy(dtype=float) for k in ("mde", "alpha", "power"))
+
+    def target(x0: float) -> np.ndarray:
+        return x0 * (1 + m) if relative else x0 + m
+
+    daily_reach = min(b["daily_reach"] for b in base.values())
+    daily_rows = min(b["daily_rows"] for b in base.values())
+    frames = []
+    for test in tests:
+        if test == "cr_click_based":
+            n = proportion_sample_size(c["cr_click"], target(c["cr_click"]), a, pw)
+            clicks, reach = n, n / c["click_rate"]
+            days_needed = reach / daily_reach
+        elif test == "cr_reach_based":
+            n = proportion_sample_size(c["cr_reach"], target(c["cr_reach"]), a, pw)
+            reach, clicks = n, n * c["click_rate"]
+            days_needed = reach / daily_reach
+        elif test == "rpu_ttest":
+            n = rpu_sample_size(c["rpu_mean"], target(c["rpu_mean"]), c["rpu_std"], base[arm]["rpu_std"],
+                                a, pw, n_sims=n_sims, random_state=random_state)
+            reach = n * c["reach_per_row"]
+            clicks = reach * c["click_rate"]
+            days_needed = n / daily_rows
+        else:
+            raise ValueError(f"Unknown test {test!r}; expected one of {PLAN_TESTS}")
+        days_needed = np.ceil(days_needed)
+        frames.append(grid.assign(test=test, n_per_group=n, reach_per_group=np.ceil(reach),
+                                  clicks_per_group=np.ceil(clicks), days_needed=days_needed,
+                                  additional_days=np.maximum(days_needed - c["days"], 0)))
+    cols = ["test", "mde", "alpha", "power", "n_per_group", "reach_per_group", "clicks_per_group",
+            "days_needed", "additional_days"]
+    return pd.concat(frames, ignore_index=True)[cols]
+
+
+def plan_sample_size(
+    metrics: Dict[str, Any],
+    mde: float = 0.05,
+    alpha: float = 0.05,
+    power: float = 0.8,
+    relative: bool = True,
+    control: str = "A",
+    arm: str = "B",
+    days: Optional[float] = None,
+    random_state: Optional[int] = 42
+) -> Dict[str, Any]:
+    """
+    One plan_grid scenario as {test: {'n_per_group', 'reach_per_group',
+    'clicks_per_group', 'days_needed', 'additional_days'}} (None where undefined).
+    """
+    if not {control, arm}.issubset(metrics.get("groups", {})):
+        return {"error": f"Groups {control!r} and {arm!r} required in metrics."}
+    grid = plan_grid(metrics, mde, alpha, power, relative=relative, control=control, arm=arm,
+                     days=days, random_state=random_state)
+    out: Dict[str, Any] = {"mde": mde, "relative": relative, "alpha": alpha, "power": power}
+    for row in grid.to_dict("records"):
+        test = row.pop("test")
+        out[test] = {k: (None if not np.isfinite(v) else float(v)) for k, v in row.items()
+                     if k not in ("mde", "alpha", "power")}
+    return out
@@ -0,0 +1,113 @@
+# src/analysis_engine/proportions.py
+from __future__ import annotations
+from typing import Dict, Literal, Optional
+import numpy as np
+from scipy.stats import norm
+
+Correction = Optional[Literal["holm", "bh"]]
+
+
+def wilson_ci(counts: np.ndarray, nobs: np.ndarray, alpha: float = 0.05):
+    """Elementwise Wilson score interval (same as proportion_confint(method='wilson'))."""
+    counts = np.asarray(counts, dtype=float)
+    nobs = np.asarray(nobs, dtype=float)
+    z = norm.isf(alpha / 2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = counts / nobs
+        denom = 1 + z ** 2 / nobs
+        center = (p + z ** 2 / (2 * nobs)) / denom
+        half = z * np.sqrt(p * (1 - p) / nobs + z ** 2 / (4 * nobs ** 2)) / denom
+    return center - half, center + half
+
+
+def adjust_pvalues(pvalues: np.ndarray, method: Correction = "holm") -> np.ndarray:
+    """
+    Multiple-comparison adjustment over the last axis (one family per row).
+      - method="holm" : Holm step-down (FWER)
+      - method="bh"   : Benjamini-Hochberg step-up (FDR)
+    NaN p-values are excluded from the family and stay NaN.
+    """
+    p = np.asarray(pvalues, dtype=float)
+    if method is None:
+        return p.copy()
+
+    nan = np.isnan(p)
+    m = (~nan).sum(axis=-1, keepdims=True)
+    order = np.argsort(np.where(nan, np.inf, p), axis=-1)
+    p_sorted = np.take_along_axis(np.where(nan, np.inf, p), order, axis=-1)
+    rank = np.arange(p.shape[-1])  # 0-based position in the sorted family
+
+    with np.errstate(invalid="ignore"):  # inf placeholders for NaN slots
+        if method == "holm":
+            adj = np.maximum.accumulate((m - rank) * p_sorted, axis=-1)
+        elif method == "bh":
+            scaled = m / (rank + 1) * p_sorted
+            adj = np.flip(np.minimum.accumulate(np.flip(scaled, axis=-1), axis=-1), axis=-1)
+        else:
+            raise ValueError(f"Unknown correction method: {method!r}")
+
+    out = np.empty_like(adj)
+    np.put_along_axis(out, order, np.minimum(adj, 1.0), axis=-1)
+    out[nan] = np.nan
+    return out
+
+
+def prop_test_matrix(
+    counts: np.ndarray,
+    nobs: np.ndarray,
+    control: int = 0,
+    alpha: float = 0.05,
+    correction: Correction = "holm"
+) -> Dict[str, np.ndarray]:
+    """
+    Two-proportion z-tests of every arm against the control arm, for every metric,
+    in one NumPy pass.
+
+    counts / nobs have shape (..., arms, metrics); leading axes (e.g. experiments)
+    are independent. Per-comparison outputs have shape (..., arms - 1, metrics),
+    with arms ordered as in the input minus the control.
+
+    Conventions match _prop_test / proportions_ztest:
+      - statistic = (rate_control - rate_arm) / pooled SE
+      - diff = rate_arm - rate_control, with a pooled-SE normal CI
+      - per-arm Wilson CIs
+    pvalue_adj applies `correction` across all arm x metric comparisons of a family.
+    """
+    counts = np.asarray(counts, dtype=float)
+    nobs = np.asarray(nobs, dtype=float)
+    z_crit = norm.isf(alpha / 2)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rate = counts / nobs
+        rate_lo, rate_hi = wilson_ci(counts, nobs, alpha=alpha)
+
+        arms = [i for i in range(counts.shape[-2]) if i != control]
+        c0, n0 = counts[..., control:control + 1, :], nobs[..., control:control + 1, :]
+        c1, n1 = counts[..., arms, :], nobs[..., arms, :]
+        p0, p1 = c0 / n0, c1 / n1
+
+        pooled = (c0 + c1) / (n0 + n1)
+        se = np.sqrt(pooled * (1 - pooled) * (1 / n0 + 1 / n1))
+        statistic = (p0 - p1) / se
+        pvalue = 2 * norm.sf(np.abs(statistic))
+        diff = p1 - p0
+
+    valid = (n0 > 0) & (n1 > 0)
+    statistic = np.where(valid, statistic, np.nan)
+    pvalue = np.where(valid, pvalue, np.nan)
+
+    shape = pvalue.shape
+    flat = pvalue.reshape(shape[:-2] + (-1,))
+    pvalue_adj = adjust_pvalues(flat, correction).reshape(shape)
+
+    return {
+        "rate": rate,
+        "rate_ci_low": rate_lo,
+        "rate_ci_high": rate_hi,
+        "diff": diff,
+        "diff_ci_low": diff - z_crit * se,
+        "diff_ci_high": diff + z_crit * se,
+        "statistic": statistic,
+        "pvalue": pvalue,
+        "pvalue_adj": pvalue_adj,
+    }
@@ -0,0 +1,115 @@
+# src/analysis_engine/sequential.py
+from __future__ import annotations
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Any, Optional
+import json
+import math
+import os
+
+SEQUENTIAL_STATE_PATH = Path("data/processed/sequential_state.json")
+
+@dataclass
+class SequentialState:
+    """
+    Running mSPRT state for one two-proportion comparison (B - A), normal approximation
+    with a N(0, tau^2) mixture over the difference.
+
+    Each look costs O(1): it stores cumulative counts, the running minimum of 1/Lambda
+    (the always-valid p-value) and the running intersection of confidence sequences,
+    so the guarantees hold no matter how often results are checked. If the sequences
+    of two looks are disjoint the effect has drifted; drift is flagged and the
+    sequence restarts from the latest look.
+
+    source identifies the data the cumulative totals come from (see observe_totals),
+    so a state is never continued with totals of another input.
+    """
+    numA: float = 0.0
+    denA: float = 0.0
+    numB: float = 0.0
+    denB: float = 0.0
+    looks: int = 0
+    pvalue: float = 1.0
+    cs_low: float = -math.inf
+    cs_high: float = math.inf
+    drift: bool = False
+    source: Optional[str] = None
+
+    def update(self, numA: float, denA: float, numB: float, denB: float,
+               alpha: float = 0.05, tau: float = 0.01) -> Dict[str, Any]:
+        """Fold one new batch of counts (increments, not totals) and return the current result."""
+        self.numA += numA
+        self.denA += denA
+        self.numB += numB
+        self.denB += denB
+        self.looks += 1
+
+        if self.denA > 0 and self.denB > 0:
+            pA, pB = self.numA / self.denA, self.numB / self.denB
+            var = pA * (1 - pA) / self.denA + pB * (1 - pB) / self.denB
+            if var > 0:
+                diff = pB - pA
+                t2 = tau ** 2
+                log_lr = 0.5 * math.log(var / (var + t2)) + t2 * diff ** 2 / (2 * var * (var + t2))
+                self.pvalue = min(self.pvalue, math.exp(-log_lr) if log_lr < 700 else 0.0)
+
+                half = math.sqrt(var * (var + t2) / t2 * (2 * math.log(1 / alpha) + math.log((var + t2) / var)))
+                low, high = max(self.cs_low, diff - half), min(self.cs_high, diff + half)
+                if low > high:
+                    # Disjoint sequences mean the effect is not stationary; restart from this look.
+                    low, high = diff - half, diff + half
+                    self.drift = True
+                self.cs_low, self.cs_high = low, high
+
+        return self.result(alpha)
+
+    def observe_totals(self, numA: float, denA: float, numB: float, denB: float,
+                       alpha: float = 0.05, tau: float = 0.01,
+                       source: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Look at cumulative totals; only the increment since the last look is folded in.
+          - source (e.g. the raw export's path) is stored on the first look; totals
+            from a different source raise ValueError
+          - totals below the stored ones (a smaller or different file) raise ValueError
+          - unchanged totals (a rerun on the same data) return the current result
+            without counting a look
+        """
+        if source is not None:
+            if self.source is not None and source != self.source:
+                raise ValueError(f"Sequential state was built from {self.source!r}, not {source!r}; "
+                                 "remove the state file to start a new sequence.")
+            self.source = source
+        inc = (numA - self.numA, denA - self.denA, numB - self.numB, denB - self.denB)
+        if min(inc) < 0:
+            raise ValueError("Cumulative totals decreased since the last look; the data no longer extends "
+                             "the sequence (remove the state file to start a new one).")
+        if not any(inc):
+            return self.result(alpha)
+        return self.update(*inc, alpha=alpha, tau=tau)
+
+    def result(self, alpha: float = 0.05) -> Dict[str, Any]:
+        return {
+            "always_valid_pvalue": float(min(self.pvalue, 1.0)),
+            "confidence_sequence": (float(self.cs_low), float(self.cs_high)),
+            "looks": int(self.looks),
+            "stop_early": bool(self.pvalue < alpha),
+            "drift_detected": bool(self.drift),
+        }
+
+def load_sequential_state(path: str | Path = SEQUENTIAL_STATE_PATH) -> Dict[str, SequentialState]:
+    """Read per-test states ({test name: SequentialState}); a missing file yields {}."""
+    p = Path(path)
+    if not p.exists():
+        return {}
+    with open(p) as fh:
+        return {k: SequentialState(**v) for k, v in json.load(fh).items()}
+
+def save_sequential_state(states: Dict[str, SequentialState],
+                          path: str | Path = SEQUENTIAL_STATE_PATH) -> str:
+    p = Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_suffix(p.suffix + ".tmp")
+    with open(tmp, "w") as fh:
+        json.dump({k: v.__dict__ for k, v in states.items()}, fh, indent=2)
+    os.replace(tmp, p)
+    return str(p)
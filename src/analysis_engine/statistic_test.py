@@ -4,9 +4,16 @@ from dataclasses import dataclass
 from typing import Dict, Any, Optional, Tuple, Literal
 import numpy as np
 import pandas as pd
-from scipy.stats import ttest_ind
+from scipy.stats import norm, ttest_ind_from_stats
 from statsmodels.stats.proportion import proportions_ztest, proportion_confint
 
+from src.analysis_engine.aggregates import SufficientStats, aggregate_groups, as_numeric
+from src.analysis_engine.bayesian import bayesian_ab
+from src.analysis_engine.funnel import funnel_analysis
+from src.analysis_engine.bootstrap import BootstrapMethod, DEFAULT_MAX_BYTES, bootstrap_mean_diff_ci
+from src.analysis_engine.sequential import SequentialState
+from src.analysis_engine.variance_reduction import variance_reduced_rpu
+
 @dataclass
 class PropTestResult:
     statistic: float
@@ -43,10 +50,10 @@ def _prop_test(numA: float, denA: float, numB: float, denB: float,
         # z-test
         stat, pval = proportions_ztest(count=[numA, numB], nobs=[denA, denB])
 
-        # diff CI (normal approx)
+        # diff CI (normal approx, at alpha as prop_test_matrix)
         pooled = (numA + numB) / (denA + denB)
         se_diff = np.sqrt(pooled * (1 - pooled) * (1 / denA + 1 / denB))
-        z = 1.96
+        z = norm.isf(alpha / 2)
         diff = crB - crA
         diff_ci = (float(diff - z * se_diff), float(diff + z * se_diff))
 
@@ -75,49 +82,11 @@ def _prop_test(numA: float, denA: float, numB: float, denB: float,
             "denominator": denominator
         }
 
-def run_ab_tests(
-    df: pd.DataFrame,
-    revenue_col: Optional[str] = None,
-    alpha: float = 0.05,
-    conv_denominator: Literal["Clicks", "Reach", "Both"] = "Clicks",
-    bootstrap_rpu: bool = True,
-    bootstrap_iter: int = 5000,
-    random_state: Optional[int] = 42
-) -> Dict[str, Any]:
-    """
-    Run A/B tests with configurable conversion-rate definition:
-
-      - conv_denominator="Clicks" : CR = Purchases / Clicks
-      - conv_denominator="Reach"  : CR = Purchases / Reach
-      - conv_denominator="Both"   : Returns both CR tests
-
-    Also runs a Welch t-test on RPU (revenue per reach) with optional bootstrap CI.
-
-    Expected columns in df:
-      'group' in {'A','B'},
-      '# of Purchase', '# of Website Clicks', 'Reach'
-      Optional revenue column (revenue_col); if absent, uses purchases as proxy.
-    """
+def _cr_tests(numA: float, clicksA: float, reachA: float,
+              numB: float, clicksB: float, reachB: float,
+              conv_denominator: str, alpha: float) -> Dict[str, Any]:
+    """Click- and/or reach-based conversion-rate tests keyed as in run_ab_tests."""
     out: Dict[str, Any] = {}
-    dx = df.copy()
-
-    # Validate groups
-    groups = set(dx.get("group", pd.Series(dtype=object)).unique())
-    if not {"A", "B"}.issubset(groups):
-        return {"error": "Both groups A and B required in 'group' column."}
-
-    A = dx[dx["group"] == "A"].copy()
-    B = dx[dx["group"] == "B"].copy()
-
-    # Aggregate counts
-    numA = float(pd.to_numeric(A["# of Purchase"], errors="coerce").sum())
-    numB = float(pd.to_numeric(B["# of Purchase"], errors="coerce").sum())
-    clicksA = float(pd.to_numeric(A["# of Website Clicks"], errors="coerce").sum())
-    clicksB = float(pd.to_numeric(B["# of Website Clicks"], errors="coerce").sum())
-    reachA  = float(pd.to_numeric(A["Reach"], errors="coerce").sum())
-    reachB  = float(pd.to_numeric(B["Reach"], errors="coerce").sum())
-
-    # --- Conversion rate tests ---
     if conv_denominator in ("Clicks", "Both"):
         out["cr_click_based"] = _prop_test(
             numA, clicksA, numB, clicksB,
@@ -129,60 +98,188 @@ def run_ab_tests(
             numA, reachA, numB, reachB,
             numerator="# of Purchase", denominator="Reach", alpha=alpha
         )
+    return out
 
-    # --- RPU test (revenue per reach, row-level) ---
-    if revenue_col and revenue_col in dx.columns:
-        dx["_revenue"] = pd.to_numeric(dx[revenue_col], errors="coerce")
-        note = f"Used revenue column '{revenue_col}'."
-    else:
-        dx["_revenue"] = pd.to_numeric(dx["# of Purchase"], errors="coerce")
-        note = "No revenue_col provided—using '# of Purchase' as proxy revenue."
+def _rpu_note(agg: SufficientStats) -> str:
+    if agg.rpu_revenue_col:
+        return f"Used revenue column '{agg.rpu_revenue_col}'."
+    return "No revenue_col provided—using '# of Purchase' as proxy revenue."
+
+def run_ab_tests_from_stats(
+    agg: SufficientStats,
+    alpha: float = 0.05,
+    conv_denominator: Literal["Clicks", "Reach", "Both"] = "Clicks",
+    sequential: Optional[Dict[str, SequentialState]] = None,
+    sequential_tau: float = 0.01,
+    funnel: bool = True,
+    bayesian: bool = False,
+    random_state: Optional[int] = 42,
+    sequential_source: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Tests of run_ab_tests computed from per-group sufficient statistics
+    (aggregate_groups, clean_data_stream) without row-level data.
+    The RPU Welch t-test uses the aggregated RPU moments; its CI is the normal
+    approximation, since a bootstrap needs the raw rows.
 
-    reach_nonzero = pd.to_numeric(dx["Reach"], errors="coerce").replace(0, np.nan)
-    dx["_rpu"] = dx["_revenue"] / reach_nonzero
+    If sequential is given ({test name: SequentialState}, updated in place and
+    created as needed), each CR test also reports mSPRT always_valid_pvalue,
+    confidence_sequence, looks and stop_early, valid under continuous monitoring.
+    sequential_source names the input the totals come from; totals of another
+    input, or lower than at the last look, raise ValueError (see observe_totals).
 
-    rpu_A = dx.loc[dx["group"] == "A", "_rpu"].dropna()
-    rpu_B = dx.loc[dx["group"] == "B", "_rpu"].dropna()
+    funnel=True adds out["funnel"]: conversion, drop-off and tests of every funnel
+    step for every group against A (see funnel_analysis). bayesian=True adds
+    out["bayesian"]: posteriors, P(group beats A) and expected loss for the same CR
+    definitions and RPU (see bayesian_ab; random_state seeds its posterior draws).
+    """
+    out: Dict[str, Any] = {}
+    if not {"A", "B"}.issubset(agg.groups):
+        return {"error": "Both groups A and B required in 'group' column."}
 
-    if (len(rpu_A) >= 2) and (len(rpu_B) >= 2):
-        tstat, tpval = ttest_ind(rpu_A, rpu_B, equal_var=False, nan_policy="omit")
+    A, B = agg.groups["A"], agg.groups["B"]
 
-        # Normal approx CI for mean difference
-        z = 1.96
-        mean_diff = float(rpu_B.mean() - rpu_A.mean())
-        se_diff = np.sqrt(rpu_A.var(ddof=1) / len(rpu_A) + rpu_B.var(ddof=1) / len(rpu_B))
-        ci = (float(mean_diff - z * se_diff), float(mean_diff + z * se_diff))
+    # --- Conversion rate tests ---
+    out.update(_cr_tests(A.purchases, A.clicks, A.reach, B.purchases, B.clicks, B.reach,
+                         conv_denominator, alpha))
+
+    # --- Sequential (always-valid) view of the same CR tests ---
+    if sequential is not None:
+        denominators = {"cr_click_based": (A.clicks, B.clicks), "cr_reach_based": (A.reach, B.reach)}
+        for name, (denA, denB) in denominators.items():
+            if name in out and "error" not in out[name]:
+                state = sequential.setdefault(name, SequentialState())
+                out[name].update(state.observe_totals(A.purchases, denA, B.purchases, denB,
+                                                      alpha=alpha, tau=sequential_tau,
+                                                      source=sequential_source))
+
+    # --- RPU test (revenue per reach, row-level moments) ---
+    if (A.rpu_n >= 2) and (B.rpu_n >= 2):
+        tstat, tpval = ttest_ind_from_stats(
+            A.rpu_mean, np.sqrt(A.rpu_var), A.rpu_n,
+            B.rpu_mean, np.sqrt(B.rpu_var), B.rpu_n,
+            equal_var=False
+        )
 
-        # Bootstrap CI (optional)
-        if bootstrap_rpu:
-            rng = np.random.default_rng(random_state)
-            boots = []
-            nA, nB = len(rpu_A), len(rpu_B)
-            rA, rB = rpu_A.to_numpy(), rpu_B.to_numpy()
-            for _ in range(bootstrap_iter):
-                mA = rng.choice(rA, size=nA, replace=True).mean()
-                mB = rng.choice(rB, size=nB, replace=True).mean()
-                boots.append(mB - mA)
-            lo = float(np.percentile(boots, 2.5))
-            hi = float(np.percentile(boots, 97.5))
-            ci = (lo, hi)
-            note += " CI via bootstrap of row-level RPU means."
+        # Normal approx CI for mean difference, at alpha
+        z = norm.isf(alpha / 2)
+        mean_diff = float(B.rpu_mean - A.rpu_mean)
+        se_diff = np.sqrt(A.rpu_var / A.rpu_n + B.rpu_var / B.rpu_n)
+        ci = (float(mean_diff - z * se_diff), float(mean_diff + z * se_diff))
 
         out["rpu_ttest"] = RPUTestResult(
             tstatistic=float(tstat),
             pvalue=float(tpval),
-            rpu_A_mean=float(rpu_A.mean()),
-            rpu_B_mean=float(rpu_B.mean()),
+            rpu_A_mean=float(A.rpu_mean),
+            rpu_B_mean=float(B.rpu_mean),
             mean_diff=float(mean_diff),
             ci_95=ci,
-            note=note
+            note=_rpu_note(agg)
         ).__dict__
     else:
         out["rpu_ttest"] = {
             "error": "Insufficient rows for RPU t-test.",
-            "len_A": int(len(rpu_A)),
-            "len_B": int(len(rpu_B)),
+            "len_A": int(A.rpu_n),
+            "len_B": int(B.rpu_n),
             "note": "Need at least 2 non-NaN rows per group."
         }
 
+    # --- Funnel: every step, every group, one vectorized pass ---
+    if funnel:
+        out["funnel"] = funnel_analysis(agg, control="A", alpha=alpha)
+
+    # --- Bayesian view: closed-form / quadrature posteriors, sampling where needed ---
+    if bayesian:
+        out["bayesian"] = bayesian_ab(agg, control="A", conv_denominator=conv_denominator,
+                                      random_state=random_state)
+
+    return out
+
+def _row_rpu(df: pd.DataFrame, group: str, revenue_col: Optional[str]) -> np.ndarray:
+    """Non-NaN row-level RPU values of one group (input to the bootstrap)."""
+    # Filter the two columns needed, not the whole frame
+    mask = (df["group"] == group).to_numpy(dtype=bool, na_value=False)
+    revenue = as_numeric((df[revenue_col] if revenue_col else df["# of Purchase"])[mask])
+    reach = as_numeric(df["Reach"][mask])
+    rpu = (revenue / reach.where(reach != 0)).to_numpy(dtype=float, na_value=np.nan)
+    return rpu[~np.isnan(rpu)]
+
+def run_ab_tests(
+    df: pd.DataFrame,
+    revenue_col: Optional[str] = None,
+    alpha: float = 0.05,
+    conv_denominator: Literal["Clicks", "Reach", "Both"] = "Clicks",
+    bootstrap_rpu: bool = True,
+    bootstrap_iter: int = 5000,
+    random_state: Optional[int] = 42,
+    bootstrap_method: BootstrapMethod = "percentile",
+    bootstrap_max_bytes: int = DEFAULT_MAX_BYTES,
+    agg: Optional[SufficientStats] = None,
+    sequential: Optional[Dict[str, SequentialState]] = None,
+    sequential_tau: float = 0.01,
+    funnel: bool = True,
+    bayesian: bool = False,
+    variance_reduction: bool = False,
+    pre_period_end: Optional[str] = None,
+    sequential_source: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Run A/B tests with configurable conversion-rate definition:
+
+      - conv_denominator="Clicks" : CR = Purchases / Clicks
+      - conv_denominator="Reach"  : CR = Purchases / Reach
+      - conv_denominator="Both"   : Returns both CR tests
+
+    Also runs a Welch t-test on RPU (revenue per reach) with optional bootstrap CI.
+    bootstrap_method selects "percentile", "bca" or "studentized" intervals; replicates
+    are drawn in chunks bounded by bootstrap_max_bytes.
+
+    Counts and RPU moments come from aggregate_groups(df); pass agg to reuse an
+    aggregation already computed for compute_kpis_from_stats. Only the bootstrap
+    revisits row-level data. sequential / sequential_tau / sequential_source add
+    always-valid results, funnel the per-step funnel tests and bayesian the
+    Bayesian mode (see run_ab_tests_from_stats).
+
+    variance_reduction=True adds out["rpu_variance_reduction"]: the RPU difference
+    post-stratified by weekday / date and, with pre_period_end (rows before it only
+    build the CUPED covariate), CUPED-adjusted, each with the variance reduction
+    against the unadjusted estimate (see variance_reduced_rpu).
+
+    Expected columns in df:
+      'group' in {'A','B'},
+      '# of Purchase', '# of Website Clicks', 'Reach'
+      Optional revenue column (revenue_col); if absent, uses purchases as proxy.
+    """
+    # Validate groups
+    groups = set(df.get("group", pd.Series(dtype=object)).unique())
+    if not {"A", "B"}.issubset(groups):
+        return {"error": "Both groups A and B required in 'group' column."}
+
+    if agg is None:
+        agg = aggregate_groups(df, revenue_col=revenue_col)
+    out = run_ab_tests_from_stats(agg, alpha=alpha, conv_denominator=conv_denominator,
+                                  sequential=sequential, sequential_tau=sequential_tau, funnel=funnel,
+                                  bayesian=bayesian, random_state=random_state,
+                                  sequential_source=sequential_source)
+
+    # Bootstrap CI (optional)
+    rpu = out["rpu_ttest"]
+    if bootstrap_rpu and "error" not in rpu:
+        rpu["ci_95"] = bootstrap_mean_diff_ci(
+            _row_rpu(df, "A", agg.rpu_revenue_col), _row_rpu(df, "B", agg.rpu_revenue_col),
+            n_iter=bootstrap_iter, random_state=random_state,
+            method=bootstrap_method, max_bytes=bootstrap_max_bytes
+        )
+        if not np.isfinite(rpu["ci_95"]).all():
+            rpu["note"] += f" {bootstrap_method.capitalize()} bootstrap CI undefined: no resample has a positive standard error."
+        elif bootstrap_method == "percentile":
+            rpu["note"] += " CI via bootstrap of row-level RPU means."
+        else:
+            rpu["note"] += f" CI via {bootstrap_method} bootstrap of row-level RPU means."
+
+    # Variance reduction (CUPED / post-stratification) from per-(group, Date) moments
+    if variance_reduction:
+        out["rpu_variance_reduction"] = variance_reduced_rpu(
+            df, revenue_col=agg.rpu_revenue_col, pre_period_end=pre_period_end, alpha=alpha)
+
     return out
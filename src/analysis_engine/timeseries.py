@@ -0,0 +1,223 @@
+# src/analysis_engine/timeseries.py
+from __future__ import annotations
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import json
+import os
+import numpy as np
+import pandas as pd
+
+from src.analysis_engine.aggregates import _sum_by
+
+TS_STATE_PATH = Path("data/processed/ts_state.json")
+TS_MEASURES = ["spend", "impressions", "reach", "clicks", "purchases", "revenue"]
+TS_KPIS = ["cr", "ctr", "cpa", "roi", "lift"]
+DEFAULT_WINDOW = 7      # days in a rolling window
+CONTROL_GROUP = "A"     # lift is relative to this group's CR
+
+
+def daily_totals(df: pd.DataFrame, revenue_col: Optional[str] = None, avg_order_value: float = 50.0) -> pd.DataFrame:
+    """
+    Per-day, per-group sums of TS_MEASURES from one groupby over (Date, group).
+    Wide frame: index = every calendar day from the first to the last Date (days
+    without rows are zeros, so rolling windows are calendar windows), columns =
+    (measure, group). Revenue is purchases * avg_order_value when the frame has no
+    revenue column, as in compute_kpis. Rows without a Date are ignored.
+    """
+    sums, kpi_revenue_col, _ = _sum_by(df, ["Date", "group"], revenue_col)
+    if not kpi_revenue_col:
+        sums["revenue"] = sums["purchases"] * avg_order_value
+    wide = sums[TS_MEASURES].unstack("group", fill_value=0.0)
+    wide.index = pd.DatetimeIndex(wide.index, name="Date")
+    wide.columns = wide.columns.set_levels(wide.columns.levels[1].astype(str), level=1)
+    return wide.asfreq("D", fill_value=0.0)
+
+
+def _empty_kpis(groups: List[str], index: Optional[pd.Index] = None) -> pd.DataFrame:
+    """A KPI frame without rows (or columns, when no group is known yet)."""
+    columns = pd.MultiIndex.from_product([TS_MEASURES + TS_KPIS, groups], names=["metric", "group"])
+    index = index if index is not None else pd.DatetimeIndex([], name="Date")
+    return pd.DataFrame(index=index, columns=columns, dtype=float)
+
+
+def with_kpis(totals: pd.DataFrame, control: str = CONTROL_GROUP) -> pd.DataFrame:
+    """
+    Add KPI columns to a (measure, group) totals frame, all ratios of sums:
+      - cr   : purchases / reach (as compute_kpis)
+      - ctr  : clicks / impressions
+      - cpa  : spend / purchases
+      - roi  : (revenue - spend) / spend
+      - lift : cr / cr of the control group - 1 (NaN without a control group)
+    Undefined ratios (zero denominators) are NaN.
+    """
+    if totals.columns.empty:
+        return _empty_kpis([], totals.index)
+    m = {k: totals[k] for k in TS_MEASURES}
+    out = dict(m)
+    out["cr"] = m["purchases"] / m["reach"].where(m["reach"] > 0)
+    out["ctr"] = m["clicks"] / m["impressions"].where(m["impressions"] > 0)
+    out["cpa"] = m["spend"] / m["purchases"].where(m["purchases"] > 0)
+    out["roi"] = (m["revenue"] - m["spend"]) / m["spend"].where(m["spend"] != 0)
+    if control in out["cr"].columns:
+        out["lift"] = out["cr"].div(out["cr"][control], axis=0) - 1
+    else:
+        out["lift"] = out["cr"] * np.nan
+    return pd.concat(out, axis=1, names=["metric", "group"])
+
+
+def kpi_timeseries(
+    df: pd.DataFrame,
+    window: int = DEFAULT_WINDOW,
+    freq: str = "W",
+    control: str = CONTROL_GROUP,
+    revenue_col: Optional[str] = None,
+    avg_order_value: float = 50.0
+) -> Dict[str, pd.DataFrame]:
+    """
+    Time series of measures and KPIs per group, from one (Date, group) aggregation:
+      - daily      : each calendar day
+      - weekly     : resampled to freq (pandas offset alias, default weeks ending Sunday)
+      - rolling    : trailing `window` calendar days
+      - cumulative : from the first day up to each day
+    Each frame has a Date index and (metric, group) columns (see with_kpis); rolling
+    and resampled KPIs are ratios of summed measures, not means of daily ratios.
+    """
+    daily = daily_totals(df, revenue_col=revenue_col, avg_order_value=avg_order_value)
+    return {
+        "daily": with_kpis(daily, control),
+        "weekly": with_kpis(daily.resample(freq).sum(), control),
+        "rolling": with_kpis(daily.rolling(window, min_periods=1).sum(), control),
+        "cumulative": with_kpis(daily.cumsum(), control),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Incremental rolling state
+# ---------------------------------------------------------------------------
+
+@dataclass
+class RollingState:
+    """
+    Running window and cumulative totals per group, so appending a day costs
+    O(window) at most instead of recomputing the series.
+      - days       : the last `window` daily totals, oldest first ({group: [TS_MEASURES]})
+      - rolling    : sums over `days`
+      - cumulative : sums over every folded day
+      - last_date  : ISO date of the newest folded day
+    """
+    window: int = DEFAULT_WINDOW
+    control: str = CONTROL_GROUP
+    last_date: Optional[str] = None
+    days: List[Dict[str, List[float]]] = field(default_factory=list)
+    rolling: Dict[str, List[float]] = field(default_factory=dict)
+    cumulative: Dict[str, List[float]] = field(default_factory=dict)
+
+    def push(self, day: Dict[str, List[float]]) -> None:
+        """Fold one calendar day: add it to the running sums and evict the day leaving the window."""
+        for g, values in day.items():
+            for totals in (self.rolling, self.cumulative):
+                acc = totals.setdefault(g, [0.0] * len(TS_MEASURES))
+                for i, v in enumerate(values):
+                    acc[i] += v
+        self.days.append(day)
+        if len(self.days) > self.window:
+            for g, values in self.days.pop(0).items():
+                acc = self.rolling[g]
+                for i, v in enumerate(values):
+                    acc[i] -= v
+
+
+def _frame(rows: List[Tuple[pd.Timestamp, Dict[str, List[float]]]]) -> pd.DataFrame:
+    """(date, {group: [TS_MEASURES]}) snapshots -> (measure, group) totals frame."""
+    groups = sorted({g for _, snap in rows for g in snap})
+    columns = pd.MultiIndex.from_product([TS_MEASURES, groups], names=[None, "group"])
+    data = np.zeros((len(rows), len(columns)))
+    for r, (_, snap) in enumerate(rows):
+        for j, g in enumerate(groups):
+            if g in snap:
+                data[r, j::len(groups)] = snap[g]
+    return pd.DataFrame(data, index=pd.DatetimeIndex([d for d, _ in rows], name="Date"), columns=columns)
+
+
+def update_rolling(state: RollingState, daily: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """
+    Fold the days of a daily_totals frame newer than state.last_date into state.
+    Each new day (and each empty day in a gap since last_date) costs O(groups x
+    measures) plus one eviction, independent of the history length; a gap longer
+    than the window just empties the window. Returns the rolling and cumulative
+    KPI rows of the new days (same layout as kpi_timeseries).
+    """
+    if state.last_date is not None:
+        daily = daily[daily.index > pd.Timestamp(state.last_date)]
+    if daily.empty:
+        groups = sorted(state.cumulative)
+        return {"rolling": _empty_kpis(groups), "cumulative": _empty_kpis(groups)}
+
+    groups = list(daily.columns.get_level_values("group").unique())
+    values = daily.to_numpy()
+    measure_pos = {g: [daily.columns.get_loc((m, g)) for m in TS_MEASURES] for g in groups}
+
+    # Empty days between the previous fold and the first new day still move the window
+    if state.last_date is not None:
+        gap = (daily.index[0] - pd.Timestamp(state.last_date)).days - 1
+        for _ in range(min(gap, state.window)):
+            state.push({})
+
+    rolling_rows, cumulative_rows = [], []
+    for r, date in enumerate(daily.index):
+        state.push({g: values[r, measure_pos[g]].tolist() for g in groups})
+        rolling_rows.append((date, {g: list(v) for g, v in state.rolling.items()}))
+        cumulative_rows.append((date, {g: list(v) for g, v in state.cumulative.items()}))
+    state.last_date = daily.index[-1].date().isoformat()
+
+    return {"rolling": with_kpis(_frame(rolling_rows), state.control),
+            "cumulative": with_kpis(_frame(cumulative_rows), state.control)}
+
+
+def load_rolling_state(path: str | Path = TS_STATE_PATH, window: int = DEFAULT_WINDOW,
+                       control: str = CONTROL_GROUP) -> RollingState:
+    """Read the state file; a missing file yields an empty state with the given window."""
+    p = Path(path)
+    if not p.exists():
+        return RollingState(window=window, control=control)
+    with open(p) as fh:
+        d = json.load(fh)
+    return RollingState(**d)
+
+
+def save_rolling_state(state: RollingState, path: str | Path = TS_STATE_PATH) -> str:
+    """Write the state file atomically (temp file + rename)."""
+    p = Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_suffix(p.suffix + ".tmp")
+    with open(tmp, "w") as fh:
+        json.dump(state.__dict__, fh)
+    os.replace(tmp, p)
+    return str(p)
+
+
+def fold_timeseries(
+    df: pd.DataFrame,
+    path: str | Path = TS_STATE_PATH,
+    window: int = DEFAULT_WINDOW,
+    control: str = CONTROL_GROUP,
+    revenue_col: Optional[str] = None,
+    avg_order_value: float = 50.0,
+    rebuild: bool = False
+) -> Dict[str, pd.DataFrame]:
+    """
+    Incremental counterpart of kpi_timeseries' rolling and cumulative series: fold
+    the days of df newer than the persisted state (only those rows are aggregated)
+    and return the KPI rows of the new days. rebuild=True starts from an empty state;
+    so does a stored state with a different window or control group.
+    """
+    state = RollingState(window=window, control=control) if rebuild else load_rolling_state(path, window, control)
+    if state.window != window or state.control != control:
+        state = RollingState(window=window, control=control)
+    if state.last_date is not None:
+        keep = df["Date"] > pd.Timestamp(state.last_date)
+        df = df if keep.all() else df[keep]
+    out = update_rolling(state, daily_totals(df, revenue_col=revenue_col, avg_order_value=avg_order_value))
+    save_rolling_state(state, path)
+    return out
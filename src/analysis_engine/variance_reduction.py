@@ -0,0 +1,317 @@
+# src/analysis_engine/variance_reduction.py
+from __future__ import annotations
+from typing import Any, Dict, Literal, Optional, Tuple
+import numpy as np
+import pandas as pd
+from scipy.stats import norm, t as t_dist
+
+from src.analysis_engine.aggregates import _measure
+
+Strata = Optional[Literal["weekday", "date"]]
+
+# Per-cell sufficient statistics of y (row-level RPU) and x (covariate)
+MOMENTS = ["n", "sy", "sx", "syy", "sxx", "sxy"]
+BALANCE_ALPHA = 0.05    # CUPED is refused when arm means of the covariate differ at this level
+MAX_SHIFT_SE = 1.0      # best_method ignores estimates moving the diff by more unadjusted SEs
+# name -> (strata, CUPED); the cuped methods need a covariate
+METHODS = {
+    "unadjusted": (None, False),
+    "stratified_weekday": ("weekday", False),
+    "stratified_date": ("date", False),
+    "cuped": (None, True),
+}
+
+
+def row_rpu(df: pd.DataFrame, revenue_col: Optional[str] = None) -> np.ndarray:
+    """Row-level RPU as in the RPU t-test: revenue (or purchases) / Reach, NaN where undefined."""
+    revenue = _measure(df[revenue_col] if revenue_col and revenue_col in df.columns else df["# of Purchase"])
+    reach = _measure(df["Reach"])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return revenue / np.where(reach != 0, reach, np.nan)
+
+
+def pre_period_covariate(df: pd.DataFrame, y: np.ndarray, pre_period_end: pd.Timestamp) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    CUPED covariate from the rows dated before pre_period_end, which must be the
+    experiment start (those rows are pre-treatment): each later row gets its
+    campaign's mean pre-period y on the same weekday, falling back to the
+    campaign's pre-period mean, then to the overall pre-period mean. The covariate
+    is only valid if it is balanced across arms; see covariate_balance.
+    Returns (x for every row, mask of the rows on or after pre_period_end).
+    """
+    dates = df["Date"]
+    pre = (dates < pre_period_end).to_numpy(dtype=bool, na_value=False) & ~np.isnan(y)
+    post = (dates >= pre_period_end).to_numpy(dtype=bool, na_value=False)
+    if not pre.any():
+        raise ValueError(f"No usable rows dated before pre_period_end={pre_period_end.date()}.")
+
+    campaign = pd.factorize(df["Campaign Name"])[0]
+    weekday = dates.dt.dayofweek.to_numpy(dtype="float64", na_value=np.nan)
+    known = (campaign >= 0) & ~np.isnan(weekday)
+    key = np.where(known, campaign * 7 + np.nan_to_num(weekday).astype(np.int64), -1)
+    n_campaigns = campaign.max() + 1
+
+    def mean_by(codes: np.ndarray, size: int) -> np.ndarray:
+        ok = pre & (codes >= 0)
+        n = np.bincount(codes[ok], minlength=size)
+        s = np.bincount(codes[ok], weights=y[ok], minlength=size)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(n > 0, s / n, np.nan)
+
+    by_day = np.append(mean_by(key, n_campaigns * 7), np.nan)[key]  # key -1 picks the NaN
+    by_campaign = np.append(mean_by(campaign, n_campaigns), np.nan)[campaign]
+    x = np.where(np.isnan(by_day), by_campaign, by_day)
+    return np.where(np.isnan(x), y[pre].mean(), x), post
+
+
+def moment_table(
+    df: pd.DataFrame,
+    revenue_col: Optional[str] = None,
+    covariate: Optional[str] = None,
+    pre_period_end: Optional[str] = None
+) -> Tuple[pd.DataFrame, pd.DataFrame, Optional[str]]:
+    """
+    Sufficient statistics of y = row-level RPU and a covariate x per (group, Date):
+    n, sy, sx, syy, sxx, sxy, from one factorized grouping and a bincount per moment.
+    The covariate is the column `covariate` if given, else the pre-period covariate of
+    pre_period_end (only later rows are then analysed), else none (x = 0).
+    The table is additive: tables of disjoint rows merge by summing, and every
+    estimate of variance_reduced_rpu is computed from it alone.
+    units holds n and sx per (group, Campaign Name), the randomization units the
+    covariate balance is tested on (covariate_balance).
+    Returns (table, units, covariate description or None).
+    """
+    y = row_rpu(df, revenue_col)
+    rows = np.ones(len(df), dtype=bool)
+    if covariate is not None:
+        x, label = _measure(df[covariate]), covariate
+    elif pre_period_end is not None:
+        end = pd.Timestamp(pre_period_end)
+        x, rows = pre_period_covariate(df, y, end)
+        label = f"campaign x weekday mean RPU before {end.date()}"
+    else:
+        x, label = np.zeros(len(df)), None
+
+    grouper = df.groupby([df["group"], df["Date"]], observed=True, sort=True)
+    index = grouper.size().index
+    codes = grouper.ngroup().fillna(-1).to_numpy(dtype=np.int64)
+    ok = rows & (codes >= 0) & ~np.isnan(y) & ~np.isnan(x)
+    c, yy, xx = codes[ok], y[ok], x[ok]
+
+    def total(values: Optional[np.ndarray] = None) -> np.ndarray:
+        return np.bincount(c, weights=values, minlength=len(index)).astype(np.float64)
+
+    table = pd.DataFrame({"n": total(), "sy": total(yy), "sx": total(xx), "syy": total(yy * yy),
+                          "sxx": total(xx * xx), "sxy": total(xx * yy)}, index=index)
+
+    by_unit = df.groupby([df["group"], df["Campaign Name"]], observed=True, sort=True)
+    unit_codes = by_unit.ngroup().fillna(-1).to_numpy(dtype=np.int64)[ok]
+    size = len(by_unit.size())
+    units = pd.DataFrame({"n": np.bincount(unit_codes, minlength=size).astype(np.float64),
+                          "sx": np.bincount(unit_codes, weights=xx, minlength=size)},
+                         index=by_unit.size().index)
+    return table[table["n"] > 0], units[units["n"] > 0], label
+
+
+def _collapse(n: np.ndarray) -> np.ndarray:
+    """
+    Block id of each stratum (column of the groups x strata row counts n): adjacent
+    strata are merged until every group has at least 2 rows in the block, so its
+    within-block variance exists; an incomplete tail joins the previous block.
+    """
+    block = np.empty(n.shape[1], dtype=np.int64)
+    acc = np.zeros(n.shape[0])
+    b = 0
+    for j in range(n.shape[1]):
+        block[j] = b
+        acc += n[:, j]
+        if (acc >= 2).all():
+            b += 1
+            acc[:] = 0
+    if acc.any() and b > 0:
+        block[block == b] = b - 1
+    return block
+
+
+def _estimate(table: pd.DataFrame, strata: Strata, cuped: bool) -> Dict[str, Any]:
+    """
+    Per-group mean and variance of the (post-stratified, CUPED-adjusted) estimator:
+      - cells (group, stratum); sparse strata (some group with fewer than 2 rows,
+        e.g. dates of one row per arm) are merged with their neighbours in stratum
+        order (_collapse), and the stratum weights are w_s = n_s / n
+      - CUPED: theta = pooled within-cell cov(x, y) / var(x), fitted on residuals
+        around each (group, stratum) mean and never on arm differences; a cell's
+        mean is shifted by -theta (mean x of the cell - mean x of the stratum) and
+        its variance becomes var(y) - 2 theta cov(x, y) + theta^2 var(x)
+      - mean_g = sum_s w_s mean_gs, var_g = sum_s w_s^2 var_gs / n_gs
+    Without strata and CUPED this is the plain mean and var / n.
+    """
+    dates = table.index.get_level_values("Date")
+    if strata == "weekday":
+        key = dates.dayofweek
+    elif strata == "date":
+        key = dates
+    else:
+        key = np.zeros(len(table), dtype=np.int64)
+    cells = table.groupby([table.index.get_level_values("group").astype(str), key]).sum()
+    wide = {m: cells[m].unstack(fill_value=0.0) for m in MOMENTS}
+    groups = list(wide["n"].index)
+    n_strata = wide["n"].shape[1]
+    if strata is not None:
+        block = _collapse(wide["n"].to_numpy())
+        wide = {m: w.T.groupby(block).sum().T for m, w in wide.items()}
+
+    keep = (wide["n"] >= 2).all(axis=0).to_numpy()
+    n, sy, sx, syy, sxx, sxy = (wide[m].to_numpy()[:, keep] for m in MOMENTS)
+    if not keep.any():
+        return {"groups": groups, "strata": 0, "collapsed_from": n_strata, "rows": 0, "theta": None,
+                "mean": np.full(len(groups), np.nan), "var": np.full(len(groups), np.nan)}
+
+    Syy, Sxx, Sxy = syy - sy * sy / n, sxx - sx * sx / n, sxy - sx * sy / n
+    theta = float(Sxy.sum() / Sxx.sum()) if cuped and Sxx.sum() > 0 else 0.0
+    x_stratum = sx.sum(axis=0) / n.sum(axis=0)
+    mean = sy / n - theta * (sx / n - x_stratum)
+    var = np.maximum(Syy - 2 * theta * Sxy + theta ** 2 * Sxx, 0) / (n - 1)
+    w = n.sum(axis=0) / n.sum()
+    return {
+        "groups": groups,
+        "strata": int(keep.sum()),
+        "collapsed_from": n_strata,
+        "rows": int(n.sum()),
+        "theta": theta if cuped else None,
+        "mean": (w * mean).sum(axis=1),
+        "var": (w ** 2 * var / n).sum(axis=1),
+    }
+
+
+def _num(x: float) -> Optional[float]:
+    return None if not np.isfinite(x) else float(x)
+
+
+def covariate_balance(units: pd.DataFrame, control: str = "A") -> Dict[str, Dict[str, Any]]:
+    """
+    Welch test of the covariate's arm mean against the control's, per arm, over
+    campaign means (rows of one campaign share its covariate, so they are not
+    independent). A pre-treatment covariate is balanced by randomization; a
+    significant difference means it carries arm identity, and CUPED would subtract
+    part of the treatment effect. Arms with fewer than 2 campaigns cannot show
+    balance and get pvalue 0.
+    """
+    group = units.index.get_level_values("group").astype(str)
+    x = (units["sx"] / units["n"]).groupby(group)
+    n, mean, var = x.count(), x.mean(), x.var()
+    out = {}
+    for g in n.index:
+        if g == control:
+            continue
+        diff = mean[g] - mean[control]
+        counts = {"campaigns": int(n[g]), "control_campaigns": int(n[control])}
+        if min(n[g], n[control]) < 2:
+            out[g] = {"diff": _num(diff), **counts, "pvalue": 0.0}
+            continue
+        va, vb = var[control] / n[control], var[g] / n[g]
+        se = np.sqrt(va + vb)
+        if se > 0:
+            dof = (va + vb) ** 2 / (va ** 2 / (n[control] - 1) + vb ** 2 / (n[g] - 1))
+            pvalue = float(2 * t_dist.sf(abs(diff / se), dof))
+        else:
+            pvalue = 1.0 if diff == 0 else 0.0
+        out[g] = {"diff": _num(diff), **counts, "pvalue": pvalue}
+    return out
+
+
+def variance_reduced_rpu(
+    df: pd.DataFrame,
+    revenue_col: Optional[str] = None,
+    covariate: Optional[str] = None,
+    pre_period_end: Optional[str] = None,
+    control: str = "A",
+    alpha: float = 0.05
+) -> Dict[str, Any]:
+    """
+    RPU difference of every group against the control under each of METHODS, all
+    from one moment_table:
+      - unadjusted               : difference of means (the Welch normal approximation)
+      - stratified_weekday/_date : post-stratified by day of week / calendar date; strata
+                                   with a single row in some group are merged with their
+                                   neighbours (strata vs strata_before_collapse)
+      - cuped                    : CUPED regression adjustment on the covariate
+    The cuped method needs a covariate (column or pre_period_end) that is balanced
+    across arms: 'covariate_balance' reports the arm differences of its mean, and
+    with any p-value below BALANCE_ALPHA it returns an error instead
+    of an estimate. Each method reports per-group means and, per group, diff / se /
+    ci_95 / pvalue (normal) plus variance_reduction = 1 - se^2 / se_unadjusted^2,
+    sample_size_factor = se^2 / se_unadjusted^2 (share of the days of spend needed
+    for the same precision) and shift_se = (diff - diff_unadjusted) / se_unadjusted.
+    best_method is the method with the smallest average sample_size_factor among
+    those whose |shift_se| stays within MAX_SHIFT_SE for every arm; a method that
+    moves the point estimate is never chosen for its smaller SE.
+    """
+    table, units, label = moment_table(df, revenue_col=revenue_col, covariate=covariate, pre_period_end=pre_period_end)
+    groups = sorted(table.index.get_level_values("group").astype(str).unique())
+    if control not in groups or len(groups) < 2:
+        return {"error": f"Variance reduction needs the control group {control!r} and at least one other group."}
+
+    z = norm.isf(alpha / 2)
+    out: Dict[str, Any] = {"metric": "rpu", "covariate": label, "control": control}
+    balanced = True
+    if label is not None:
+        out["covariate_balance"] = covariate_balance(units, control)
+        balanced = all(b["pvalue"] >= BALANCE_ALPHA for b in out["covariate_balance"].values())
+    methods = {name: spec for name, spec in METHODS.items() if label is not None or not spec[1]}
+    estimates = {name: _estimate(table, strata, cuped) for name, (strata, cuped) in methods.items()
+                 if balanced or not cuped}
+    base = estimates["unadjusted"]
+    ctrl = base["groups"].index(control)
+    base_var = base["var"] + base["var"][ctrl]
+    base_diff = base["mean"] - base["mean"][ctrl]
+
+    factors = {}
+    for name, (_, cuped) in methods.items():
+        if name not in estimates:
+            balance = out["covariate_balance"].values()
+            if min(min(b["campaigns"], b["control_campaigns"]) for b in balance) < 2:
+                reason = "fewer than 2 campaigns per arm, so covariate balance cannot be checked"
+            else:
+                reason = (f"covariate means differ between arms (p={min(b['pvalue'] for b in balance):.3g}), "
+                          "so the adjustment would absorb part of the treatment effect")
+            out[name] = {"error": f"CUPED skipped: {reason}."}
+            continue
+        est = estimates[name]
+        if not est["strata"]:
+            out[name] = {"error": "No stratum has at least 2 rows in every group."}
+            continue
+        c = est["groups"].index(control)
+        res: Dict[str, Any] = {"rows": est["rows"], "strata": est["strata"],
+                               "strata_before_collapse": est["collapsed_from"],
+                               "mean": {g: _num(m) for g, m in zip(est["groups"], est["mean"])},
+                               "vs_control": {}}
+        if est["theta"] is not None:
+            res["theta"] = est["theta"]
+        for i, g in enumerate(est["groups"]):
+            if i == c:
+                continue
+            diff = est["mean"][i] - est["mean"][c]
+            var = est["var"][i] + est["var"][c]
+            se = np.sqrt(var)
+            b = base["groups"].index(g)
+            factor = var / base_var[b]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                shift = (diff - base_diff[b]) / np.sqrt(base_var[b])
+            res["vs_control"][g] = {
+                "diff": _num(diff), "se": _num(se),
+                "ci_95": [_num(diff - z * se), _num(diff + z * se)],
+                "pvalue": _num(2 * norm.sf(abs(diff / se))) if se > 0 else None,
+                "variance_reduction": _num(1 - factor),
+                "sample_size_factor": _num(factor),
+                "shift_se": _num(shift),
+            }
+        out[name] = res
+        shifts = [v["shift_se"] for v in res["vs_control"].values()]
+        if all(s is not None and abs(s) <= MAX_SHIFT_SE for s in shifts):
+            factors[name] = np.nanmean([v["sample_size_factor"] if v["sample_size_factor"] is not None else np.nan
+                                        for v in res["vs_control"].values()])
+
+    finite = {k: v for k, v in factors.items() if np.isfinite(v)}
+    out["best_method"] = min(finite, key=finite.get) if finite else None
+    return out
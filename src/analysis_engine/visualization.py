@@ -42,14 +42,14 @@ def roi_comparison_chart(metrics: Dict[str, Any], save_path="reports/charts/roi_
 
 def revenue_distribution(df: pd.DataFrame, save_path="reports/charts/revenue_distribution.png", revenue_col=None):
     ensure_reports_dir()
+    # Plot the column itself; the caller's frame is not modified
     if revenue_col and revenue_col in df.columns:
-        col = revenue_col
+        values = df[revenue_col]
     else:
-        df['revenue_est'] = df['# of Purchase']  # fallback
-        col = 'revenue_est'
+        values = df['# of Purchase'].rename('revenue_est')  # fallback
 
     plt.figure(figsize=(8,4))
-    sns.histplot(df[col], kde=True)
+    sns.histplot(values, kde=True)
     plt.title("Revenue (or Purchase Proxy) Distribution")
     plt.tight_layout()
     plt.savefig(save_path)
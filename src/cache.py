@@ -0,0 +1,118 @@
+# src/cache.py
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+import hashlib
+import json
+import logging
+import os
+import pickle
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = Path(".cache/pipeline")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+_SRC_ROOT = Path(__file__).resolve().parent
+_code_version: Optional[str] = None
+
+
+def file_digest(path: str | Path, block_size: int = 1 << 20) -> str:
+    """
+    sha256 of a file's content, read in blocks; 'missing' if the file does not exist.
+    A directory (a partitioned dataset) hashes the relative path and content of every
+    file below it.
+    """
+    p = Path(path)
+    if not p.exists():
+        return "missing"
+    h = hashlib.sha256()
+    files = sorted(f for f in p.rglob("*") if f.is_file()) if p.is_dir() else [p]
+    for f in files:
+        if p.is_dir():
+            h.update(str(f.relative_to(p)).encode())
+        with open(f, "rb") as fh:
+            for block in iter(lambda: fh.read(block_size), b""):
+                h.update(block)
+    return h.hexdigest()
+
+
+def code_version() -> str:
+    """sha256 over every module of the src package, so any code change invalidates the cache."""
+    global _code_version
+    if _code_version is None:
+        h = hashlib.sha256()
+        for p in sorted(_SRC_ROOT.rglob("*.py")):
+            h.update(str(p.relative_to(_SRC_ROOT)).encode())
+            h.update(p.read_bytes())
+        _code_version = h.hexdigest()
+    return _code_version
+
+
+def _canonical(obj: Any) -> str:
+    return json.dumps(obj, sort_keys=True, default=str)
+
+
+class StageCache:
+    """
+    Content-addressed on-disk cache of pipeline stage outputs.
+      - Keys hash the stage name, the code version and the stage's inputs
+      - Values are pickled to <root>/<key>.pkl
+      - Total size is bounded by max_bytes with least-recently-used eviction
+        (reads refresh the file's mtime)
+    """
+
+    def __init__(self, root: str | Path = CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.hits: Dict[str, bool] = {}
+
+    def key(self, stage: str, *parts: Any) -> str:
+        h = hashlib.sha256()
+        h.update(stage.encode())
+        h.update(code_version().encode())
+        for part in parts:
+            h.update(_canonical(part).encode())
+        return h.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.root / f"{key}.pkl"
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        p = self._path(key)
+        try:
+            with open(p, "rb") as fh:
+                value = pickle.load(fh)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return False, None
+        os.utime(p)  # mark as recently used
+        return True, value
+
+    def put(self, key: str, value: Any) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        p = self._path(key)
+        tmp = p.with_suffix(".tmp")
+        with open(tmp, "wb") as fh:
+            pickle.dump(value, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, p)
+        self._evict()
+
+    def _evict(self) -> None:
+        entries = sorted(self.root.glob("*.pkl"), key=lambda p: p.stat().st_mtime)
+        total = sum(p.stat().st_size for p in entries)
+        while entries and total > self.max_bytes:
+            oldest = entries.pop(0)
+            total -= oldest.stat().st_size
+            oldest.unlink(missing_ok=True)
+
+    def cached(self, stage: str, parts: Tuple, compute: Callable[[], Any]) -> Tuple[Any, str]:
+        """Return (value, key) for a stage, computing and storing it only on a miss."""
+        key = self.key(stage, *parts)
+        hit, value = self.get(key)
+        self.hits[stage] = hit
+        if hit:
+            logger.info(f"Cache hit for stage '{stage}'.")
+            return value, key
+        value = compute()
+        self.put(key, value)
+        return value, key
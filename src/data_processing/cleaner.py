@@ -1,62 +1,190 @@
 # src/data_processing/cleaner.py
+import numpy as np
 import pandas as pd
 from pathlib import Path
+import shutil
+from typing import Callable, Iterable, List, Literal, Optional, Tuple
 
-def extract_group(campaign_name: str) -> str:
+from src.analysis_engine.aggregates import SufficientStats, aggregate_groups, as_numeric
+from src.data_processing.loader import DATA_PROCESSED
+from src.data_processing.grouping import (DEFAULT_GROUP_RULES, GroupRules, OnUnmatched, assign_groups,
+                                          classify_names, report_unmatched)
+from src.data_processing.schema import CAMPAIGN_SCHEMA, compact_column, compact_count
+from src.data_processing.storage import DATA_PROCESSED_DATASET, write_processed
+
+ProcessedFormat = Literal["csv", "parquet", "ipc"]
+
+def extract_group(campaign_name: str, rules: Optional[GroupRules] = None) -> str:
     """
-    Heuristic: if 'Control' in campaign_name => 'A' (control),
-    if 'Test' in campaign_name => 'B' (variant/test).
-    Returns 'unknown' if cannot determine.
+    Group of a single campaign name under rules (default: 'Control' => 'A',
+    'Test' / 'Variant' => 'B', else 'unknown'). Frames use assign_groups, which
+    classifies each distinct name once.
     """
-    name = str(campaign_name).lower()
-    if "control" in name:
-        return "A"
-    if "test" in name or "variant" in name:
-        return "B"
-    return "unknown"
+    groups, _ = classify_names(pd.Index([str(campaign_name)]), rules or DEFAULT_GROUP_RULES)
+    return groups[0]
+
+NUMERIC_COLS = ['Spend [USD]', '# of Impressions', 'Reach',
+                '# of Website Clicks', '# of Searches', '# of View Content',
+                '# of Add to Cart', '# of Purchase']
 
-def clean_data(df: pd.DataFrame, save_path: str = "data/processed/cleaned_campaign.csv") -> pd.DataFrame:
+def _parse_dates(s: pd.Series) -> pd.Series:
     """
-    Clean raw DataFrame:
-      - Normalize column names
-      - Convert numeric columns to numeric
-      - Parse date
-      - Extract group (A/B) from Campaign Name
-      - Drop rows where Reach is zero or NaN (can't compute CR)
-      - Save cleaned CSV
+    Parse the Date column once per distinct value: exports repeat each date on every
+    campaign row, so factorizing first avoids parsing (and allocating for) n strings.
+    Distinct values keep their order of appearance, so format inference sees the
+    same first value as parsing the full column would.
+    """
+    codes, uniques = pd.factorize(s)
+    try:
+        parsed = pd.to_datetime(pd.Series(uniques), dayfirst=True, errors='coerce')
+    except Exception:
+        parsed = pd.to_datetime(pd.Series(uniques), errors='coerce')
+    # code -1 (missing) picks the trailing NaT
+    values = np.append(parsed.to_numpy(), np.array(['NaT'], dtype=parsed.dtype))
+    return pd.Series(values[codes], index=s.index, name=s.name)
+
+def _clean_frame(df: pd.DataFrame, compact: bool = False,
+                 rules: Optional[GroupRules] = None) -> Tuple[pd.DataFrame, List[str]]:
+    """
+    Apply the cleaning rules of clean_data to one frame (or chunk) without modifying it.
+    Derived columns are computed as new Series and the Reach filter is applied once
+    while assembling the result, so peak memory is the input plus the cleaned output;
+    when no row is dropped, untouched columns are shared with the input, not copied.
+    compact=True keeps the frame in the compact dtypes of CAMPAIGN_SCHEMA; chunks are
+    cleaned with compact=False so their schema does not depend on the chunk's values.
+    Returns the cleaned frame and the campaign names no group rule matched.
     """
-    df = df.copy()
     # Normalize column names
-    df.columns = [c.strip() for c in df.columns]
+    cols = {c.strip(): df[c] for c in df.columns}
 
     # Parse date
-    try:
-        df['Date'] = pd.to_datetime(df['Date'], dayfirst=True, errors='coerce')
-    except Exception:
-        df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
+    cols['Date'] = _parse_dates(cols['Date'])
 
-    # Extract group
-    df['group'] = df['Campaign Name'].apply(extract_group)
+    # Extract group: once per distinct campaign name, broadcast through the codes
+    groups, unmatched = assign_groups(cols['Campaign Name'], rules)
+    cols['group'] = groups if compact else groups.astype(str)
 
     # Numeric conversions for measured columns
-    numeric_cols = ['Spend [USD]', '# of Impressions', 'Reach',
-                    '# of Website Clicks', '# of Searches', '# of View Content',
-                    '# of Add to Cart', '# of Purchase']
+    for col in NUMERIC_COLS:
+        if col in cols:
+            cols[col] = as_numeric(cols[col])
 
-    for col in numeric_cols:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-
-    # Basic cleaning: drop rows without Reach or purchases
-    df = df.dropna(subset=['Reach'])  # need reach to compute CR
-    df = df[df['Reach'] > 0]
+    # Basic cleaning: drop rows without Reach (need reach to compute CR) or with Reach 0
+    reach = cols['Reach']
+    keep = (reach.notna() & (reach > 0)).to_numpy(dtype=bool, na_value=False)
+    if not keep.all():
+        # One filtered index shared by every column: s[keep] would give each column
+        # its own copy of it, as large as an int64 column
+        index = df.index[keep]
+        cols = {name: pd.Series(s.array[keep], index=index, name=s.name) for name, s in cols.items()}
 
     # Fill NaN purchases with 0
-    if '# of Purchase' in df.columns:
-        df['# of Purchase'] = df['# of Purchase'].fillna(0).astype(int)
+    if '# of Purchase' in cols:
+        purchases = cols['# of Purchase'].fillna(0)
+        cols['# of Purchase'] = compact_count(purchases) if compact else purchases.astype(int)
+
+    if compact:
+        cols = {name: compact_column(s, CAMPAIGN_SCHEMA[name]) if name in CAMPAIGN_SCHEMA else s
+                for name, s in cols.items()}
+    return pd.DataFrame(cols, copy=False), unmatched
+
+def processed_path(save_format: ProcessedFormat) -> Path:
+    return DATA_PROCESSED if save_format == "csv" else DATA_PROCESSED_DATASET
+
+def save_processed(df: pd.DataFrame, save_path: Optional[str] = None,
+                   save_format: ProcessedFormat = "csv", append: bool = False) -> str:
+    """
+    Save a cleaned frame as CSV, or as a Date/group-partitioned Parquet / Arrow IPC
+    dataset when save_format is "parquet" / "ipc".
+    If save_path is None, uses DATA_PROCESSED (csv) or DATA_PROCESSED_DATASET.
+    append=True adds the rows to an existing CSV instead of overwriting it; for a
+    columnar dataset it keeps the partitions that df does not touch, which are
+    otherwise removed, so the output never mixes in rows of an earlier input.
+    """
+    save_path = Path(save_path) if save_path else processed_path(save_format)
+    if save_format == "csv":
+        save_path.parent.mkdir(parents=True, exist_ok=True)
+        if append and save_path.exists():
+            df.to_csv(save_path, index=False, mode="a", header=False)
+        else:
+            df.to_csv(save_path, index=False)
+    else:
+        if not append:
+            shutil.rmtree(save_path, ignore_errors=True)
+        write_processed(df, save_path, fmt=save_format)
+    return str(save_path)
+
+def clean_data(df: pd.DataFrame, save_path: Optional[str] = None,
+               save_format: ProcessedFormat = "csv", save: bool = True,
+               compact: bool = True, group_rules: Optional[GroupRules] = None,
+               on_unmatched: OnUnmatched = "warn") -> pd.DataFrame:
+    """
+    Clean raw DataFrame:
+      - Normalize column names
+      - Convert numeric columns to numeric
+      - Parse date
+      - Extract group from Campaign Name with group_rules (default A/B heuristic);
+        names no rule matches are reported per on_unmatched ("warn", "raise", "ignore")
+      - Drop rows where Reach is zero or NaN (can't compute CR)
+      - Keep compact dtypes (categorical names/group, signed int counts) unless compact=False
+      - Save cleaned CSV (or columnar dataset, see save_processed) unless save=False
+    The input frame is not modified, so no defensive copy of it is made.
+    """
+    df, unmatched = _clean_frame(df, compact=compact, rules=group_rules)
+    report_unmatched(unmatched, group_rules, on_unmatched)
 
     # Save processed file
-    Path(save_path).parent.mkdir(parents=True, exist_ok=True)
-    df.to_csv(save_path, index=False)
+    if save:
+        save_processed(df, save_path, save_format=save_format)
 
     return df
+
+def clean_data_stream(chunks: Iterable[pd.DataFrame], save_path: Optional[str] = None,
+                      save_format: ProcessedFormat = "csv", group_rules: Optional[GroupRules] = None,
+                      on_unmatched: OnUnmatched = "warn",
+                      on_chunk: Optional[Callable[[pd.DataFrame], None]] = None) -> SufficientStats:
+    """
+    Streaming variant of clean_data for exports too large to hold in memory:
+      - Cleans each chunk with the same rules as clean_data
+      - Appends cleaned chunks to save_path as they are produced
+        (CSV rows, or one file per chunk and partition for columnar formats)
+      - Folds per-chunk aggregate_groups partials into running sufficient statistics
+      - Passes each cleaned chunk to on_chunk, for other partials (e.g. chart_stats)
+      - Reports names no group rule matched once, after the last chunk
+
+    Returns the merged SufficientStats, which compute_kpis_from_stats and
+    run_ab_tests_from_stats consume directly.
+    """
+    save_path = Path(save_path) if save_path else processed_path(save_format)
+    if save_format == "csv":
+        save_path.parent.mkdir(parents=True, exist_ok=True)
+        fh = open(save_path, "w", newline="")
+    else:
+        # Chunks may share partitions, so start from an empty dataset and only add files.
+        shutil.rmtree(save_path, ignore_errors=True)
+        fh = None
+
+    agg = SufficientStats()
+    unmatched = set()
+    header = True
+    try:
+        for i, chunk in enumerate(chunks):
+            chunk, chunk_unmatched = _clean_frame(chunk, rules=group_rules)
+            unmatched.update(chunk_unmatched)
+            if fh is not None:
+                chunk.to_csv(fh, index=False, header=header)
+                header = False
+            else:
+                write_processed(chunk, save_path, fmt=save_format,
+                                basename_template=f"chunk-{i}-{{i}}.{save_format}",
+                                existing_data_behavior="overwrite_or_ignore")
+
+            agg = agg.merge(aggregate_groups(chunk))
+            if on_chunk is not None:
+                on_chunk(chunk)
+    finally:
+        if fh is not None:
+            fh.close()
+
+    report_unmatched(sorted(unmatched), group_rules, on_unmatched)
+    return agg
@@ -0,0 +1,301 @@
+# src/data_processing/database.py
+from __future__ import annotations
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+import sqlite3
+import pandas as pd
+
+from src.analysis_engine.aggregates import GroupStats, SufficientStats
+
+DB_PATH = Path("sql.db")
+
+# Connection pragmas for a single-writer analytics database:
+#   - WAL lets readers run while a load is writing
+#   - synchronous=NORMAL is durable under WAL except for the last commits on power loss
+#   - 64 MB page cache, temp tables in memory, 256 MB memory-mapped reads
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "temp_store": "MEMORY",
+    "cache_size": -64 * 1024,
+    "mmap_size": 256 * 1024 * 1024,
+    "foreign_keys": "ON",
+}
+
+# Cleaned frame column -> campaign_data column
+COLUMN_MAP = {
+    "Campaign Name": "campaign_name",
+    "Date": "date",
+    "Spend [USD]": "spend_usd",
+    "# of Impressions": "impressions",
+    "Reach": "reach",
+    "# of Website Clicks": "website_clicks",
+    "# of Searches": "searches",
+    "# of View Content": "view_content",
+    "# of Add to Cart": "add_to_cart",
+    "# of Purchase": "purchases",
+    "group": "group_name",
+}
+
+# Rollup column -> GroupStats attribute
+ROLLUP_STATS = {
+    "rows": "rows",
+    "spend_usd": "spend",
+    "impressions": "impressions",
+    "reach": "reach",
+    "website_clicks": "clicks",
+    "searches": "searches",
+    "view_content": "view_content",
+    "add_to_cart": "add_to_cart",
+    "purchases": "purchases",
+    "rpu_n": "rpu_n",
+    "rpu_sum": "rpu_sum",
+    "rpu_sumsq": "rpu_sumsq",
+}
+
+_ROLLUP_COLUMNS = """
+    rows            INTEGER NOT NULL,
+    spend_usd       REAL NOT NULL,
+    impressions     INTEGER NOT NULL,
+    reach           INTEGER NOT NULL,
+    website_clicks  INTEGER NOT NULL,
+    searches        INTEGER NOT NULL,
+    view_content    INTEGER NOT NULL,
+    add_to_cart     INTEGER NOT NULL,
+    purchases       INTEGER NOT NULL,
+    rpu_n           INTEGER NOT NULL,
+    rpu_sum         REAL NOT NULL,
+    rpu_sumsq       REAL NOT NULL"""
+
+SCHEMA_SQL = f"""
+CREATE TABLE IF NOT EXISTS campaign_data (
+    id                  INTEGER PRIMARY KEY AUTOINCREMENT,
+    campaign_name       TEXT NOT NULL,
+    date                DATE NOT NULL,
+    spend_usd           REAL NOT NULL,
+    impressions         INTEGER NOT NULL,
+    reach               INTEGER NOT NULL,
+    website_clicks      INTEGER NOT NULL,
+    searches            INTEGER NOT NULL,
+    view_content        INTEGER NOT NULL,
+    add_to_cart         INTEGER NOT NULL,
+    purchases           INTEGER NOT NULL,
+    group_name          TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_campaign_group_date ON campaign_data (group_name, date);
+
+-- Additive KPI rollups (sums plus row-level RPU moments, RPU = purchases / reach),
+-- refreshed per touched (date, group) partition after every load.
+CREATE TABLE IF NOT EXISTS daily_rollup (
+    date            DATE NOT NULL,
+    group_name      TEXT NOT NULL,{_ROLLUP_COLUMNS},
+    PRIMARY KEY (group_name, date)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS group_rollup (
+    group_name      TEXT PRIMARY KEY,{_ROLLUP_COLUMNS}
+) WITHOUT ROWID;
+"""
+
+_SUMS_SQL = """
+    COUNT(*), SUM(c.spend_usd), SUM(c.impressions), SUM(c.reach), SUM(c.website_clicks),
+    SUM(c.searches), SUM(c.view_content), SUM(c.add_to_cart), SUM(c.purchases),
+    SUM(c.reach <> 0),
+    TOTAL(1.0 * c.purchases / NULLIF(c.reach, 0)),
+    TOTAL((1.0 * c.purchases / NULLIF(c.reach, 0)) * (1.0 * c.purchases / NULLIF(c.reach, 0)))"""
+
+
+# Natural key of a campaign_data row: one row per campaign and day
+NATURAL_KEY = ("campaign_name", "date")
+MEASURE_COLUMNS = [c for c in COLUMN_MAP.values() if c not in NATURAL_KEY]
+
+
+def _ensure_natural_key(conn: sqlite3.Connection) -> None:
+    """
+    Create the unique (campaign_name, date) index. Tables loaded before the key
+    existed may hold duplicate keys; the newest row per key is kept and the
+    rollups are rebuilt.
+    """
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'ux_campaign_key'").fetchone()
+    if exists:
+        return
+    with conn:
+        removed = conn.execute("""
+            DELETE FROM campaign_data WHERE id NOT IN (
+                SELECT MAX(id) FROM campaign_data GROUP BY campaign_name, date)""").rowcount
+        conn.execute("CREATE UNIQUE INDEX ux_campaign_key ON campaign_data (campaign_name, date)")
+        if removed:
+            refresh_rollups(conn)
+
+
+def connect(db_path: str | Path = DB_PATH) -> sqlite3.Connection:
+    """Open the database with PRAGMAS applied and the schema (tables, indexes, rollups) ensured."""
+    conn = sqlite3.connect(str(db_path))
+    for name, value in PRAGMAS.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    conn.executescript(SCHEMA_SQL)
+    _ensure_natural_key(conn)
+    return conn
+
+
+def _frame_rows(df: pd.DataFrame) -> pd.DataFrame:
+    """Cleaned frame -> campaign_data columns; blanks become 0 as with the CSV import casts."""
+    out = df[[c for c in COLUMN_MAP if c in df.columns]].rename(columns=COLUMN_MAP)
+    out = out[out["date"].notna()]
+    out["date"] = pd.to_datetime(out["date"]).dt.strftime("%Y-%m-%d")
+    for col in COLUMN_MAP.values():
+        if col not in ("campaign_name", "date", "group_name"):
+            values = pd.to_numeric(out[col], errors="coerce")
+            if values.dtype == "float32":
+                # compact spend: float32 is exact to the cent (schema.MONEY_TOLERANCE)
+                values = values.astype("float64").round(2)
+            out[col] = values.fillna(0)
+            if col != "spend_usd":
+                out[col] = out[col].astype("int64")
+    return out[list(COLUMN_MAP.values())]
+
+
+def _batches(rows: pd.DataFrame, batch_size: int) -> Iterator[List[Tuple]]:
+    for start in range(0, len(rows), batch_size):
+        part = rows.iloc[start:start + batch_size]
+        yield list(zip(*(part[c].tolist() for c in part.columns)))
+
+
+def refresh_rollups(conn: sqlite3.Connection, partitions: Optional[List[Tuple[str, str]]] = None) -> None:
+    """
+    Recompute daily_rollup for the given (group_name, date) partitions (all if None)
+    from campaign_data via the (group_name, date) index, then group_rollup for the
+    affected groups from daily_rollup. Runs inside the caller's transaction.
+    """
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS _touched (group_name TEXT, date DATE, PRIMARY KEY (group_name, date))")
+    conn.execute("DELETE FROM _touched")
+    if partitions is None:
+        conn.execute("INSERT INTO _touched SELECT DISTINCT group_name, date FROM campaign_data")
+        conn.execute("DELETE FROM daily_rollup")
+        conn.execute("DELETE FROM group_rollup")
+    else:
+        conn.executemany("INSERT OR IGNORE INTO _touched VALUES (?, ?)", partitions)
+        conn.execute("DELETE FROM daily_rollup WHERE (group_name, date) IN (SELECT group_name, date FROM _touched)")
+
+    conn.execute(f"""
+        INSERT INTO daily_rollup
+        SELECT t.date, t.group_name, {_SUMS_SQL}
+        FROM _touched t JOIN campaign_data c ON c.group_name = t.group_name AND c.date = t.date
+        GROUP BY t.group_name, t.date""")
+
+    cols = ", ".join(ROLLUP_STATS)
+    sums = ", ".join(f"SUM({c})" for c in ROLLUP_STATS)
+    conn.execute("DELETE FROM group_rollup WHERE group_name IN (SELECT group_name FROM _touched)")
+    conn.execute(f"""
+        INSERT INTO group_rollup (group_name, {cols})
+        SELECT group_name, {sums} FROM daily_rollup
+        WHERE group_name IN (SELECT group_name FROM _touched)
+        GROUP BY group_name""")
+
+
+def load_frame(
+    df: pd.DataFrame,
+    db_path: str | Path = DB_PATH,
+    replace: bool = False,
+    batch_size: int = 50_000
+) -> Dict[str, Any]:
+    """
+    Idempotent bulk load of a cleaned frame into campaign_data, keyed on
+    (campaign_name, date), followed by a rollup refresh of the changed partitions.
+      - Rows are staged with executemany in batches of batch_size, all in one transaction
+      - Each staged row is classified against the table: new key -> inserted,
+        existing key with different values -> updated, identical -> skipped
+      - Inserts and updates go through INSERT ... ON CONFLICT DO UPDATE; skipped
+        rows are not written at all
+      - Only (group, date) partitions with an inserted or updated row are re-rolled
+        up, so a reload of unchanged history costs one keyed lookup per row
+      - Repeated keys within df count as duplicates; the last occurrence wins
+      - replace=True empties campaign_data first and rebuilds every rollup
+
+    Returns {'inserted', 'updated', 'skipped', 'duplicates', 'partitions'}.
+    """
+    rows = _frame_rows(df)
+    deduped = rows.drop_duplicates(subset=list(NATURAL_KEY), keep="last")
+    cols = list(COLUMN_MAP.values())
+    col_list = ", ".join(cols)
+    key_match = " AND ".join(f"c.{k} = s.{k}" for k in NATURAL_KEY)
+    same_values = (f"({', '.join('c.' + m for m in MEASURE_COLUMNS)}) IS "
+                   f"({', '.join('s.' + m for m in MEASURE_COLUMNS)})")
+
+    with closing(connect(db_path)) as conn, conn:
+        if replace:
+            conn.execute("DELETE FROM campaign_data")
+
+        conn.execute(f"""
+            CREATE TEMP TABLE IF NOT EXISTS _staging (
+                {", ".join(cols)}, action TEXT, PRIMARY KEY (campaign_name, date))""")
+        conn.execute("DELETE FROM _staging")
+        insert = f"INSERT INTO _staging ({col_list}) VALUES ({', '.join('?' * len(cols))})"
+        for batch in _batches(deduped, batch_size):
+            conn.executemany(insert, batch)
+
+        conn.execute(f"""
+            UPDATE _staging AS s SET action = COALESCE(
+                (SELECT CASE WHEN {same_values} THEN 'skip' ELSE 'update' END
+                 FROM campaign_data c WHERE {key_match}),
+                'insert')""")
+        counts = dict(conn.execute("SELECT action, COUNT(*) FROM _staging GROUP BY action").fetchall())
+
+        # Partitions to re-roll: those of written rows, plus the old partition of an
+        # updated row whose group changed.
+        partitions = conn.execute(f"""
+            SELECT group_name, date FROM _staging WHERE action <> 'skip'
+            UNION
+            SELECT c.group_name, c.date FROM _staging s JOIN campaign_data c ON {key_match}
+            WHERE s.action = 'update'""").fetchall()
+
+        updates = ", ".join(f"{m} = excluded.{m}" for m in MEASURE_COLUMNS)
+        conn.execute(f"""
+            INSERT INTO campaign_data ({col_list})
+            SELECT {col_list} FROM _staging WHERE action <> 'skip'
+            ON CONFLICT (campaign_name, date) DO UPDATE SET {updates}""")
+        refresh_rollups(conn, None if replace else partitions)
+
+    return {
+        "inserted": counts.get("insert", 0),
+        "updated": counts.get("update", 0),
+        "skipped": counts.get("skip", 0),
+        "duplicates": len(rows) - len(deduped),
+        "partitions": len(partitions),
+    }
+
+
+def read_group_stats(
+    db_path: str | Path = DB_PATH,
+    start: Optional[str] = None,
+    end: Optional[str] = None
+) -> SufficientStats:
+    """
+    Per-group sufficient statistics from the rollups, without scanning campaign_data.
+    An inclusive Date range sums daily_rollup; otherwise group_rollup is read directly.
+    RPU moments use the purchases / reach proxy (the database stores no revenue column).
+    """
+    cols = list(ROLLUP_STATS)
+    with closing(connect(db_path)) as conn:
+        if start is None and end is None:
+            query = f"SELECT group_name, {', '.join(cols)} FROM group_rollup ORDER BY group_name"
+            params: Tuple = ()
+        else:
+            query = (f"SELECT group_name, {', '.join(f'SUM({c})' for c in cols)} FROM daily_rollup "
+                     "WHERE date >= ? AND date <= ? GROUP BY group_name ORDER BY group_name")
+            params = (pd.Timestamp(start or pd.Timestamp.min).strftime("%Y-%m-%d"),
+                      pd.Timestamp(end or pd.Timestamp.max).strftime("%Y-%m-%d"))
+        rows = conn.execute(query, params).fetchall()
+
+    groups = {}
+    for g, *values in rows:
+        groups[g] = GroupStats(**{ROLLUP_STATS[c]: (int(v) if c in ("rows", "rpu_n") else float(v))
+                                  for c, v in zip(cols, values)})
+    return SufficientStats(groups=groups)
+
+
+def read_daily_rollup(db_path: str | Path = DB_PATH) -> pd.DataFrame:
+    """The daily (date, group) rollup as a DataFrame, ordered by date then group."""
+    with closing(connect(db_path)) as conn:
+        return pd.read_sql_query("SELECT * FROM daily_rollup ORDER BY date, group_name", conn, parse_dates=["date"])
@@ -0,0 +1,105 @@
+# src/data_processing/grouping.py
+from __future__ import annotations
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Literal, Optional, Tuple
+import json
+import logging
+import re
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+OnUnmatched = Literal["warn", "raise", "ignore"]
+
+
+@dataclass
+class GroupRules:
+    """
+    How campaign names map to experiment groups (arms).
+      - names   : exact campaign name -> group, checked first
+      - rules   : (group, regex) pairs searched case-insensitively, first match wins
+      - default : group of names no table entry or rule matches
+    Any number of arms is supported; the defaults reproduce the original heuristic
+    ('control' -> A, 'test' / 'variant' -> B).
+    """
+    rules: List[Tuple[str, str]] = field(default_factory=lambda: [("A", r"control"), ("B", r"test|variant")])
+    names: Dict[str, str] = field(default_factory=dict)
+    default: str = "unknown"
+
+    @classmethod
+    def from_dict(cls, d: Dict) -> GroupRules:
+        """{'rules': [[group, regex], ...], 'names': {name: group}, 'default': str}; keys optional."""
+        base = cls()
+        return cls(
+            rules=[tuple(r) for r in d["rules"]] if "rules" in d else base.rules,
+            names=dict(d.get("names", {})),
+            default=d.get("default", base.default),
+        )
+
+    @property
+    def groups(self) -> List[str]:
+        """Every group the rules can produce, in rule order, default last."""
+        out = list(dict.fromkeys([g for g, _ in self.rules] + list(self.names.values())))
+        return out + [self.default] if self.default not in out else out
+
+
+DEFAULT_GROUP_RULES = GroupRules()
+
+
+def load_group_rules(path: str | Path) -> GroupRules:
+    """Read GroupRules from a JSON file (see GroupRules.from_dict)."""
+    return GroupRules.from_dict(json.loads(Path(path).read_text()))
+
+
+def classify_names(names: pd.Index, rules: GroupRules = DEFAULT_GROUP_RULES) -> Tuple[np.ndarray, List[str]]:
+    """
+    Group of each distinct campaign name, vectorized over the names: one regex
+    search per rule over all names, then np.select for first-match-wins.
+    Returns (groups as an object array aligned with names, unmatched names).
+    """
+    text = pd.Series(names.astype(str), dtype=object)
+    conditions = [text.isin(list(rules.names)).to_numpy()]
+    choices = [text.map(rules.names).to_numpy(dtype=object)]
+    for group, pattern in rules.rules:
+        conditions.append(text.str.contains(pattern, flags=re.IGNORECASE, regex=True, na=False).to_numpy(dtype=bool))
+        choices.append(np.full(len(text), group, dtype=object))
+    matched = np.logical_or.reduce(conditions) if conditions else np.zeros(len(text), dtype=bool)
+    groups = np.select(conditions, choices, default=rules.default)
+    return groups.astype(object), text[~matched].tolist()
+
+
+def assign_groups(campaign_names: pd.Series, rules: Optional[GroupRules] = None) -> Tuple[pd.Series, List[str]]:
+    """
+    Categorical group column for campaign_names: each distinct name is classified
+    once (classify_names) and the result is broadcast through the categorical codes.
+    Missing names get rules.default. Returns (groups, unmatched distinct names).
+    """
+    rules = rules or DEFAULT_GROUP_RULES
+    names = campaign_names if isinstance(campaign_names.dtype, pd.CategoricalDtype) else campaign_names.astype("category")
+    categories = names.cat.categories
+    per_name, unmatched = classify_names(categories, rules)
+
+    labels = pd.Index(rules.groups)
+    label_codes = labels.get_indexer(per_name)
+    # code -1 (missing name) picks the trailing default
+    lookup = np.append(label_codes, labels.get_loc(rules.default))
+    codes = lookup[names.cat.codes.to_numpy()]
+    groups = pd.Series(pd.Categorical.from_codes(codes, categories=labels), index=campaign_names.index, name="group")
+    if names.isna().any():
+        unmatched.append("<missing>")
+    # Drop arms no row belongs to, so group listings only show observed arms
+    return groups.cat.remove_unused_categories(), unmatched
+
+
+def report_unmatched(unmatched: List[str], rules: Optional[GroupRules] = None, on_unmatched: OnUnmatched = "warn") -> None:
+    """Warn about (or raise on) campaign names that no table entry or rule matched."""
+    if not unmatched or on_unmatched == "ignore":
+        return
+    rules = rules or DEFAULT_GROUP_RULES
+    shown = ", ".join(repr(n) for n in sorted(unmatched)[:10]) + (" …" if len(unmatched) > 10 else "")
+    message = f"{len(unmatched)} campaign name(s) matched no group rule and were assigned {rules.default!r}: {shown}"
+    if on_unmatched == "raise":
+        raise ValueError(message)
+    logger.warning(message)
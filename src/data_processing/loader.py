@@ -1,14 +1,73 @@
 # src/data_processing/loader.py
 import pandas as pd
 from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Union
+
+from src.data_processing.schema import compact_dtypes
+from src.data_processing.storage import DATA_PROCESSED_DATASET, ColumnarFormat, read_processed
 
 DATA_RAW = Path("data/raw/campaign_data.csv")
+DATA_PROCESSED = Path("data/processed/cleaned_campaign.csv")
+
+# Explicit dtypes for the raw export. Counts are read as float64 so that blank
+# cells parse as NaN instead of failing the whole chunk; cleaning casts them.
+RAW_DTYPES: Dict[str, str] = {
+    "Campaign Name": "object",
+    "Date": "object",
+    "Spend [USD]": "float64",
+    "# of Impressions": "float64",
+    "Reach": "float64",
+    "# of Website Clicks": "float64",
+    "# of Searches": "float64",
+    "# of View Content": "float64",
+    "# of Add to Cart": "float64",
+    "# of Purchase": "float64",
+}
 
-def load_data(path: str = None) -> pd.DataFrame:
+def load_data(path: str = None, chunksize: Optional[int] = None,
+              dtype: Optional[Dict[str, str]] = None,
+              compact: bool = True) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
     """
     Load raw CSV to pandas DataFrame.
     If path is None, uses DATA_RAW constant.
+    If chunksize is given, returns an iterator of DataFrames of at most chunksize rows
+    (read with RAW_DTYPES unless dtype is given) instead of materializing the file.
+    compact=True casts a materialized frame to the compact dtypes of CAMPAIGN_SCHEMA
+    (categorical names, signed integer counts with headroom, float32 spend unless
+    whole dollars). Chunks keep RAW_DTYPES
+    so that every chunk of an export has the same schema.
     """
     p = Path(path) if path else DATA_RAW
-    df = pd.read_csv(p)
-    return df
+    if chunksize:
+        return pd.read_csv(p, chunksize=chunksize, dtype=dtype if dtype is not None else RAW_DTYPES)
+    df = pd.read_csv(p, dtype=dtype)
+    return compact_dtypes(df) if compact else df
+
+def load_processed(path: str = None, columns: Optional[List[str]] = None,
+                   start: Optional[str] = None, end: Optional[str] = None,
+                   groups: Optional[List[str]] = None,
+                   fmt: Optional[ColumnarFormat] = None) -> pd.DataFrame:
+    """
+    Load the processed dataset written by clean_data.
+    A directory is read as the partitioned Parquet / Arrow IPC dataset (fmt, detected
+    from the files when None) with column projection and Date/group predicates pushed
+    down to the scan; a CSV file is parsed and then filtered.
+    If path is None, uses DATA_PROCESSED_DATASET when it exists, else DATA_PROCESSED.
+    """
+    if path is None:
+        p = DATA_PROCESSED_DATASET if DATA_PROCESSED_DATASET.exists() else DATA_PROCESSED
+    else:
+        p = Path(path)
+
+    if p.is_dir():
+        return read_processed(p, columns=columns, start=start, end=end, groups=groups, fmt=fmt)
+
+    df = pd.read_csv(p, usecols=columns, parse_dates=['Date'] if columns is None or 'Date' in columns else None)
+    mask = pd.Series(True, index=df.index)
+    if start is not None:
+        mask &= df['Date'] >= pd.Timestamp(start)
+    if end is not None:
+        mask &= df['Date'] <= pd.Timestamp(end)
+    if groups:
+        mask &= df['group'].isin(groups)
+    return df if mask.all() else df[mask]
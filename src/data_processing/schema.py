@@ -0,0 +1,116 @@
+# src/data_processing/schema.py
+from __future__ import annotations
+from typing import Dict, Literal, Optional
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_integer_dtype, is_numeric_dtype
+
+ColumnKind = Literal["category", "count", "money"]
+
+# Logical type of each campaign column; compact_dtypes picks the physical dtype.
+#   - category : repeated labels -> pandas categorical
+#   - count    : integers -> smallest signed width with COUNT_HEADROOM (nullable if blanks)
+#   - money    : amounts -> kept as integers when integral, else float32 when every
+#                value survives the round trip
+CAMPAIGN_SCHEMA: Dict[str, ColumnKind] = {
+    "Campaign Name": "category",
+    "group": "category",
+    "Spend [USD]": "money",
+    "# of Impressions": "count",
+    "Reach": "count",
+    "# of Website Clicks": "count",
+    "# of Searches": "count",
+    "# of View Content": "count",
+    "# of Add to Cart": "count",
+    "# of Purchase": "count",
+}
+
+# Absolute error allowed when storing money as float32 (half a cent)
+MONEY_TOLERANCE = 0.005
+
+# Factor by which a compact count's range must fit its width, so that callers'
+# differences (Reach - Impressions) and scalings (Purchase * 100) do not wrap
+COUNT_HEADROOM = 1024
+
+# (numpy dtype, nullable pandas dtype), narrowest first. Signed only: unsigned
+# differences wrap around instead of going negative.
+_SIGNED = [(np.int32, "Int32"), (np.int64, "Int64")]
+
+
+def _int_dtype(lo: float, hi: float, nullable: bool):
+    """
+    Smallest signed integer dtype holding [lo, hi] scaled by COUNT_HEADROOM (int64
+    when only the unscaled range fits); pandas' masked dtype if nullable.
+    """
+    bound = max(abs(lo), abs(hi))
+    for i, (t, masked) in enumerate(_SIGNED):
+        info = np.iinfo(t)
+        if bound * COUNT_HEADROOM <= info.max or (i == len(_SIGNED) - 1 and bound <= info.max):
+            return masked if nullable else t
+    return None
+
+
+def compact_count(s: pd.Series) -> pd.Series:
+    """
+    Smallest signed integer dtype (see _int_dtype) for a count column. Blanks keep a
+    nullable (masked) dtype such as Int32; non-integral values leave the column as
+    float64.
+    """
+    values = s if is_numeric_dtype(s.dtype) else pd.to_numeric(s, errors="coerce")
+    if is_integer_dtype(values.dtype):
+        # Already integral (possibly masked): only the range matters
+        nullable = bool(values.hasnans)
+        lo, hi = (values.min(), values.max()) if values.notna().any() else (0, 0)
+    else:
+        arr = values.to_numpy(dtype="float64", na_value=np.nan)
+        missing = np.isnan(arr)
+        if missing.all():
+            lo, hi = 0, 0
+        else:
+            if np.any(np.mod(arr, 1, where=~missing, out=np.zeros_like(arr))):
+                return values.astype("float64")
+            lo, hi = np.nanmin(arr), np.nanmax(arr)
+        nullable = bool(missing.any())
+    dtype = _int_dtype(lo, hi, nullable=nullable)
+    return values.astype(dtype if dtype is not None else "float64")
+
+
+def compact_money(s: pd.Series, tolerance: float = MONEY_TOLERANCE) -> pd.Series:
+    """
+    float32 when every value round-trips within `tolerance`, else float64. Integer
+    columns (whole-dollar exports) are returned unchanged, so they are written back
+    as they were read.
+    """
+    if s.dtype == np.float32 or is_integer_dtype(s.dtype):
+        return s
+    arr = pd.to_numeric(s, errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    with np.errstate(over="ignore", invalid="ignore"):
+        arr32 = arr.astype(np.float32)
+        ok = np.all(np.isnan(arr) | (np.abs(arr32.astype(np.float64) - arr) <= tolerance))
+    return pd.Series(arr32 if ok else arr, index=s.index, name=s.name)
+
+
+def compact_column(s: pd.Series, kind: ColumnKind) -> pd.Series:
+    """Cast one column to the compact dtype of its schema kind."""
+    if kind == "category":
+        return s if isinstance(s.dtype, pd.CategoricalDtype) else s.astype("category")
+    if kind == "count":
+        return compact_count(s)
+    if kind == "money":
+        return compact_money(s)
+    raise ValueError(f"Unknown column kind {kind!r} for {s.name!r}")
+
+
+def compact_dtypes(df: pd.DataFrame, schema: Optional[Dict[str, ColumnKind]] = None) -> pd.DataFrame:
+    """
+    Cast the schema's columns of df to compact dtypes (columns not in df are ignored).
+    Other columns are shared with df, not copied. Aggregations upcast to float64
+    before summing (see aggregates._sum_by), so narrow widths never overflow and
+    float32 never accumulates rounding error; counts are signed with COUNT_HEADROOM
+    for arithmetic done by callers.
+    """
+    schema = CAMPAIGN_SCHEMA if schema is None else schema
+    return pd.DataFrame(
+        {c: compact_column(df[c], schema[c]) if c in schema else df[c] for c in df.columns},
+        copy=False,
+    )
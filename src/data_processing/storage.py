@@ -0,0 +1,106 @@
+# src/data_processing/storage.py
+from __future__ import annotations
+from pathlib import Path
+from typing import List, Literal, Optional, Sequence
+import datetime as dt
+import pandas as pd
+
+# Optional: pyarrow powers the columnar (Parquet / Arrow IPC) processed dataset
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    PYARROW_AVAILABLE = True
+except ImportError:  # pyarrow not installed
+    PYARROW_AVAILABLE = False
+
+DATA_PROCESSED_DATASET = Path("data/processed/campaign_dataset")
+
+ColumnarFormat = Literal["parquet", "ipc"]
+
+
+def _require_pyarrow():
+    if not PYARROW_AVAILABLE:
+        raise ImportError("pyarrow is required for columnar storage (pip install pyarrow).")
+
+
+def detect_format(root: str | Path) -> ColumnarFormat:
+    """
+    Format of an existing dataset from the magic bytes of its first data file
+    ("PAR1" Parquet, "ARROW1" Arrow IPC); an empty dataset reads as Parquet.
+    """
+    first = next((f for f in Path(root).rglob("*") if f.is_file()), None)
+    if first is None:
+        return "parquet"
+    with open(first, "rb") as fh:
+        magic = fh.read(6)
+    if magic.startswith(b"PAR1"):
+        return "parquet"
+    if magic == b"ARROW1":
+        return "ipc"
+    raise ValueError(f"{first} is neither a Parquet nor an Arrow IPC file.")
+
+
+def _partitioning():
+    """Hive-style partitioning by day, then group: <root>/Date=2019-08-01/group=A/part-0.parquet"""
+    return ds.partitioning(pa.schema([("Date", pa.date32()), ("group", pa.string())]), flavor="hive")
+
+
+def write_processed(
+    df: pd.DataFrame,
+    root: str | Path = DATA_PROCESSED_DATASET,
+    fmt: ColumnarFormat = "parquet",
+    basename_template: Optional[str] = None,
+    existing_data_behavior: str = "delete_matching",
+) -> str:
+    """
+    Write a cleaned frame as a typed columnar dataset partitioned by Date and group.
+    With the default existing_data_behavior, only the partitions present in df are
+    replaced, so appending a new day leaves the rest of the history untouched.
+    """
+    _require_pyarrow()
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.set_column(
+        table.schema.get_field_index("Date"), "Date", pc.cast(table["Date"], pa.date32())
+    )
+    kwargs = {"basename_template": basename_template} if basename_template else {}
+    ds.write_dataset(
+        table, str(root), format=fmt, partitioning=_partitioning(),
+        existing_data_behavior=existing_data_behavior, **kwargs
+    )
+    return str(root)
+
+
+def read_processed(
+    root: str | Path = DATA_PROCESSED_DATASET,
+    columns: Optional[Sequence[str]] = None,
+    start: Optional[str | dt.date] = None,
+    end: Optional[str | dt.date] = None,
+    groups: Optional[List[str]] = None,
+    fmt: Optional[ColumnarFormat] = None,
+) -> pd.DataFrame:
+    """
+    Read the processed dataset, pushing projection (columns) and predicates
+    (inclusive Date range, groups) down to the scan. Date/group filters prune whole
+    partition directories, so only the requested days are opened.
+    fmt=None detects Parquet or Arrow IPC from the files (detect_format).
+    """
+    _require_pyarrow()
+    fmt = fmt or detect_format(root)
+    dataset = ds.dataset(str(root), format=fmt, partitioning=_partitioning())
+
+    expr = None
+    def _and(e):
+        return e if expr is None else expr & e
+    if start is not None:
+        expr = _and(ds.field("Date") >= pd.Timestamp(start).date())
+    if end is not None:
+        expr = _and(ds.field("Date") <= pd.Timestamp(end).date())
+    if groups:
+        expr = _and(ds.field("group").isin(list(groups)))
+
+    table = dataset.to_table(columns=list(columns) if columns else None, filter=expr)
+    df = table.to_pandas()
+    if "Date" in df.columns:
+        df["Date"] = pd.to_datetime(df["Date"])
+    return df
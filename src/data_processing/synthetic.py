@@ -0,0 +1,153 @@
+# src/data_processing/synthetic.py
+from __future__ import annotations
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, Optional, Sequence
+import numpy as np
+import pandas as pd
+
+MAX_DAYS = 3650  # default date span cap (ten years)
+
+RAW_COLUMNS = ["Campaign Name", "Date", "Spend [USD]", "# of Impressions", "Reach",
+               "# of Website Clicks", "# of Searches", "# of View Content",
+               "# of Add to Cart", "# of Purchase"]
+
+@dataclass
+class FunnelRatios:
+    """
+    Mean stage-to-stage ratios of a campaign day (each stage is a binomial draw
+    from the previous one), plus delivery and cost parameters.
+    Defaults are in the range of data/raw/campaign_data.csv.
+    """
+    impressions_median: float = 100_000.0
+    impressions_sigma: float = 0.35      # lognormal spread of daily impressions
+    reach_ratio: float = 0.80            # reach / impressions
+    ctr: float = 0.05                    # clicks / impressions
+    search_rate: float = 0.35            # searches / clicks
+    view_rate: float = 0.33              # view content / clicks
+    cart_rate: float = 0.55              # add to cart / view content
+    purchase_rate: float = 0.45          # purchases / add to cart
+    cpm: float = 22.0                    # spend per 1000 impressions
+
+@dataclass
+class DirtyValues:
+    """Per-row probabilities of the defects seen in real exports."""
+    blank_rate: float = 0.0       # a numeric cell left empty
+    zero_reach_rate: float = 0.0  # Reach reported as 0
+    bad_date_rate: float = 0.0    # unparseable Date
+    duplicate_rate: float = 0.0   # row repeated (same campaign and date)
+
+def _campaign_names(n_campaigns: int, arms: Sequence[str]) -> list:
+    """Control arm first; names follow the raw export ('Control Campaign', 'Test Campaign')."""
+    names = []
+    for c in range(n_campaigns):
+        suffix = "" if n_campaigns == 1 else f" {c + 1}"
+        for i, arm in enumerate(arms):
+            if i == 0:
+                names.append(f"Control Campaign{suffix}")
+            elif len(arms) == 2:
+                names.append(f"Test Campaign{suffix}")
+            else:
+                names.append(f"Test Campaign {arm}{suffix}")
+    return names
+
+def _chunk(
+    start: int, stop: int, names: list, lifts: np.ndarray, n_days: int, start_date: pd.Timestamp,
+    funnel: FunnelRatios, dirty: DirtyValues, seed: int, chunk_index: int
+) -> pd.DataFrame:
+    rng = np.random.default_rng([seed, chunk_index])
+    idx = np.arange(start, stop)
+    n, n_series = len(idx), len(names)
+    series = idx % n_series
+    day = (idx // n_series) % n_days
+    lift = lifts[series]
+
+    impressions = np.maximum(rng.lognormal(np.log(funnel.impressions_median), funnel.impressions_sigma, n), 1).astype(np.int64)
+    reach = rng.binomial(impressions, funnel.reach_ratio)
+    clicks = rng.binomial(impressions, np.clip(funnel.ctr * lift, 0, 1))
+    searches = rng.binomial(clicks, funnel.search_rate)
+    view = rng.binomial(clicks, funnel.view_rate)
+    cart = rng.binomial(view, funnel.cart_rate)
+    purchases = rng.binomial(cart, np.clip(funnel.purchase_rate * lift, 0, 1))
+    spend = np.round(impressions * funnel.cpm / 1000 * rng.lognormal(0, 0.1, n))
+
+    # Dates as in the raw export (day.month.year); string table built once per chunk.
+    dates = pd.date_range(start_date, periods=n_days, freq="D")
+    labels = np.array([f"{d.day}.{d.month:02d}.{d.year}" for d in dates], dtype=object)
+
+    df = pd.DataFrame({
+        "Campaign Name": np.asarray(names, dtype=object)[series],
+        "Date": labels[day],
+        "Spend [USD]": spend,
+        "# of Impressions": impressions.astype(float),
+        "Reach": reach.astype(float),
+        "# of Website Clicks": clicks.astype(float),
+        "# of Searches": searches.astype(float),
+        "# of View Content": view.astype(float),
+        "# of Add to Cart": cart.astype(float),
+        "# of Purchase": purchases.astype(float),
+    })
+
+    if dirty.blank_rate:
+        counts = df.columns[2:]
+        mask = rng.random((n, len(counts))) < dirty.blank_rate
+        df[counts] = df[counts].mask(mask)
+    if dirty.zero_reach_rate:
+        df.loc[rng.random(n) < dirty.zero_reach_rate, "Reach"] = 0.0
+    if dirty.bad_date_rate:
+        df.loc[rng.random(n) < dirty.bad_date_rate, "Date"] = "not a date"
+    if dirty.duplicate_rate:
+        dup = df[rng.random(n) < dirty.duplicate_rate]
+        df = pd.concat([df, dup]).sort_index(kind="stable").reset_index(drop=True)
+    return df
+
+def iter_campaign_data(
+    n_rows: int,
+    n_campaigns: int = 1,
+    arms: Sequence[str] = ("A", "B"),
+    arm_lift: Optional[Sequence[float]] = None,
+    start_date: str = "2019-08-01",
+    n_days: Optional[int] = None,
+    funnel: Optional[FunnelRatios] = None,
+    dirty: Optional[DirtyValues] = None,
+    chunk_rows: int = 1_000_000,
+    seed: int = 42
+) -> Iterator[pd.DataFrame]:
+    """
+    Yield a synthetic raw campaign export in chunks of at most chunk_rows rows.
+      - Rows cycle through n_campaigns x arms series (one 'Control Campaign' per
+        campaign, the other arms named 'Test Campaign ...') and advance one day per cycle
+      - n_days=None spreads the rows so each (campaign name, date) occurs once, up
+        to MAX_DAYS; beyond that (or with a shorter span) days wrap around and keys
+        repeat, so raise n_campaigns for unique keys at large n_rows
+      - arm_lift multiplies CTR and purchase rate per arm (default 1.0 for control,
+        1.05 for every other arm)
+      - dirty adds blanks, zero reach, bad dates and duplicate rows (duplicates
+        come in addition to n_rows)
+    Output is deterministic for a given seed and chunk_rows; memory is bounded by
+    one chunk, so 1e8 rows can be streamed to disk with write_campaign_csv.
+    """
+    funnel = funnel or FunnelRatios()
+    dirty = dirty or DirtyValues()
+    names = _campaign_names(n_campaigns, arms)
+    if arm_lift is None:
+        arm_lift = [1.0] + [1.05] * (len(arms) - 1)
+    lifts = np.tile(np.asarray(arm_lift, dtype=float), n_campaigns)
+    n_days = n_days or min(max(1, -(-n_rows // len(names))), MAX_DAYS)
+
+    for i, start in enumerate(range(0, n_rows, chunk_rows)):
+        yield _chunk(start, min(start + chunk_rows, n_rows), names, lifts, n_days,
+                     pd.Timestamp(start_date), funnel, dirty, seed, i)
+
+def generate_campaign_data(n_rows: int, **kwargs) -> pd.DataFrame:
+    """Materialize iter_campaign_data as one frame (keep n_rows to what fits in memory)."""
+    chunks = list(iter_campaign_data(n_rows, **kwargs))
+    return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=RAW_COLUMNS)
+
+def write_campaign_csv(path: str | Path, n_rows: int, **kwargs) -> str:
+    """Stream a synthetic export to CSV chunk by chunk; returns the path."""
+    p = Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    for i, chunk in enumerate(iter_campaign_data(n_rows, **kwargs)):
+        chunk.to_csv(p, mode="w" if i == 0 else "a", header=i == 0, index=False)
+    return str(p)
@@ -0,0 +1,166 @@
+# src/data_processing/validation.py
+from __future__ import annotations
+from typing import Any, Dict, List, Optional
+import numpy as np
+import pandas as pd
+
+from src.analysis_engine.aggregates import as_numeric
+from src.data_processing.cleaner import NUMERIC_COLS, _parse_dates
+
+# Each stage of the funnel must not exceed the one before it
+FUNNEL_ORDER = ["# of Impressions", "Reach", "# of Website Clicks", "# of Purchase"]
+# Metrics screened for spikes, each against its own campaign's history
+SPIKE_METRICS = ["Spend [USD]", "# of Impressions", "Reach", "# of Website Clicks", "# of Purchase"]
+
+ROBUST_Z = 3.5          # |modified z| above this is a spike (Iglewicz & Hoaglin)
+MIN_SPIKE_POINTS = 8    # campaigns with fewer values are not screened
+MAX_EXAMPLES = 5        # example rows kept per check
+
+
+def _values(df: pd.DataFrame, columns: Dict[str, str], name: str) -> Optional[np.ndarray]:
+    """Column as float64 (NaN for blanks and unparseable cells), None if absent."""
+    if name not in columns:
+        return None
+    return as_numeric(df[columns[name]]).to_numpy(dtype="float64", na_value=np.nan)
+
+
+def _examples(df: pd.DataFrame, columns: Dict[str, str], dates: pd.Series, mask: np.ndarray,
+              detail: Optional[np.ndarray] = None, max_examples: int = MAX_EXAMPLES) -> List[Dict[str, Any]]:
+    """The first max_examples flagged rows as {'row', 'campaign', 'date'[, 'detail']}."""
+    idx = np.flatnonzero(mask)[:max_examples]
+    names = df[columns["Campaign Name"]].to_numpy()[idx] if "Campaign Name" in columns else [None] * len(idx)
+    out = []
+    for k, i in enumerate(idx):
+        d = dates.iloc[i]
+        ex = {"row": int(i), "campaign": None if pd.isna(names[k]) else str(names[k]),
+              "date": None if pd.isna(d) else d.date().isoformat()}
+        if detail is not None:
+            ex["detail"] = detail[i]
+        out.append(ex)
+    return out
+
+
+def _robust_z(values: np.ndarray, codes: np.ndarray, min_points: int) -> np.ndarray:
+    """
+    Modified z-score 0.6745 * (x - median) / MAD within each code (campaign), computed
+    with grouped transforms; NaN where the campaign has fewer than min_points values
+    or no spread (MAD 0).
+    """
+    s = pd.Series(values)
+    by = s.groupby(codes)
+    median = by.transform("median").to_numpy()
+    mad = (s - median).abs().groupby(codes).transform("median").to_numpy()
+    count = by.transform("count").to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = 0.6745 * (values - median) / mad
+    z[(count < min_points) | ~(mad > 0)] = np.nan
+    return z
+
+
+def validate_frame(
+    df: pd.DataFrame,
+    z_threshold: float = ROBUST_Z,
+    min_spike_points: int = MIN_SPIKE_POINTS,
+    max_examples: int = MAX_EXAMPLES
+) -> Dict[str, Any]:
+    """
+    Data quality checks over a raw (or cleaned) campaign frame, each one vectorized
+    over all rows:
+      - funnel_order    : Impressions >= Reach >= Clicks >= Purchases (blanks skipped)
+      - negative_values : any measure below zero
+      - missing_reach   : Reach blank or zero (rows clean_data drops)
+      - missing_dates   : Date blank or unparseable
+      - duplicate_keys  : rows repeating a (Campaign Name, Date) key
+      - spikes          : |robust z| > z_threshold against the campaign's own median/MAD
+
+    Returns a compact report: {'rows', 'flagged_rows', 'checks': {name: {'count',
+    'detail', 'examples'}}, 'anomalies': [one sentence per failing check]}, where
+    'anomalies' feeds the AI report and 'examples' holds at most max_examples rows.
+    The frame is not modified.
+    """
+    n = len(df)
+    columns = {str(c).strip(): c for c in df.columns}
+    if "Date" in columns:
+        raw_dates = df[columns["Date"]]
+        dates = raw_dates if pd.api.types.is_datetime64_any_dtype(raw_dates) else _parse_dates(raw_dates)
+    else:
+        dates = pd.Series(pd.NaT, index=df.index)
+    dates = dates.reset_index(drop=True)
+    flagged = np.zeros(n, dtype=bool)
+    checks: Dict[str, Dict[str, Any]] = {}
+    anomalies: List[str] = []
+
+    def record(name: str, mask: np.ndarray, detail: Dict[str, Any], sentence: str,
+               per_row: Optional[np.ndarray] = None) -> None:
+        count = int(mask.sum())
+        checks[name] = {"count": count, "detail": detail,
+                        "examples": _examples(df, columns, dates, mask, per_row, max_examples) if count else []}
+        if count:
+            flagged[:] |= mask
+            anomalies.append(sentence.format(count=count))
+
+    # Funnel monotonicity: one comparison per adjacent pair of stages
+    stages = [(c, _values(df, columns, c)) for c in FUNNEL_ORDER]
+    stages = [(c, v) for c, v in stages if v is not None]
+    mask = np.zeros(n, dtype=bool)
+    by_pair = {}
+    first_pair = np.full(n, None, dtype=object)
+    for (upper, u), (lower, l) in zip(stages, stages[1:]):
+        bad = l > u  # NaN compares False: blanks are not violations
+        by_pair[f"{lower} > {upper}"] = int(bad.sum())
+        first_pair[bad & ~mask] = f"{lower} > {upper}"
+        mask |= bad
+    record("funnel_order", mask, {k: v for k, v in by_pair.items() if v},
+           "{count} rows break the funnel order (Impressions >= Reach >= Clicks >= Purchases).", first_pair)
+
+    # Non-negative measures
+    mask = np.zeros(n, dtype=bool)
+    by_column = {}
+    for col in NUMERIC_COLS:
+        v = _values(df, columns, col)
+        if v is not None:
+            bad = v < 0
+            if bad.any():
+                by_column[col] = int(bad.sum())
+            mask |= bad
+    record("negative_values", mask, by_column, "{count} rows have negative values.")
+
+    # Rows without usable Reach are dropped by clean_data; report them instead of losing them silently
+    reach = _values(df, columns, "Reach")
+    if reach is not None:
+        mask = ~(reach > 0) & ~(reach < 0)  # blank or zero; negatives are reported above
+        record("missing_reach", mask, {"blank": int(np.isnan(reach).sum()), "zero": int((reach == 0).sum())},
+               "{count} rows have blank or zero Reach and are excluded from the analysis.")
+
+    # Missing / unparseable dates
+    no_date = dates.isna().to_numpy()
+    record("missing_dates", no_date, {}, "{count} rows have a blank or unparseable Date.")
+
+    # Duplicate (Campaign Name, Date) keys among rows with a date
+    if "Campaign Name" in columns:
+        keys = pd.DataFrame({"name": df[columns["Campaign Name"]].to_numpy(), "date": dates.to_numpy()})
+        dup = keys.duplicated(keep="first").to_numpy() & ~no_date
+        distinct = int(keys[dup].drop_duplicates().shape[0]) if dup.any() else 0
+        record("duplicate_keys", dup, {"keys": distinct},
+               "{count} rows repeat an earlier (Campaign Name, Date) key.")
+
+    # Spikes: robust z-score per metric within each campaign
+    codes = (pd.factorize(df[columns["Campaign Name"]])[0] if "Campaign Name" in columns
+             else np.zeros(n, dtype=np.int64))
+    mask = np.zeros(n, dtype=bool)
+    by_metric = {}
+    first_metric = np.full(n, None, dtype=object)
+    for col in SPIKE_METRICS:
+        v = _values(df, columns, col)
+        if v is None:
+            continue
+        z = _robust_z(v, codes, min_spike_points)
+        bad = np.abs(z) > z_threshold  # NaN compares False
+        if bad.any():
+            by_metric[col] = int(bad.sum())
+            first_metric[bad & ~mask] = col
+        mask |= bad
+    record("spikes", mask, {"threshold": z_threshold, "by_metric": by_metric},
+           "{count} rows are spikes (robust z-score above %g within their campaign)." % z_threshold, first_metric)
+
+    return {"rows": n, "flagged_rows": int(flagged.sum()), "checks": checks, "anomalies": anomalies}
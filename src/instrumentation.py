@@ -0,0 +1,131 @@
+# src/instrumentation.py
+from __future__ import annotations
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+import json
+import logging
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:  # Windows
+    RESOURCE_AVAILABLE = False
+
+try:
+    from opentelemetry import trace as otel_trace
+    OTEL_AVAILABLE = True
+except ImportError:
+    OTEL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process so far (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    if not RESOURCE_AVAILABLE:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1e6 if sys.platform == "darwin" else rss / 1024
+
+
+@dataclass
+class StageSpan:
+    """Measurements of one pipeline stage; emitted as one JSON line."""
+    name: str
+    run_id: str = ""
+    start: float = 0.0                    # epoch seconds
+    wall_s: float = 0.0
+    cpu_s: float = 0.0
+    peak_rss_mb: Optional[float] = None   # process peak RSS at stage end
+    rss_growth_mb: Optional[float] = None # growth of the process peak during the stage
+    alloc_peak_mb: Optional[float] = None # tracemalloc peak above the stage's start (trace_memory=True)
+    rows_in: Optional[int] = None
+    rows_out: Optional[int] = None
+    cache_hit: Optional[bool] = None
+    error: Optional[str] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+
+class Instrumentation:
+    """
+    Collects StageSpans for one pipeline run.
+      - span(name) measures wall/CPU time and peak RSS growth of the block; callers
+        fill rows_in / rows_out / cache_hit on the yielded span
+      - trace_memory=True also records the tracemalloc peak of each stage (exact
+        Python allocations, but slows allocation-heavy code noticeably)
+      - every finished span is appended to `sink` as a JSON line (if given) and
+        logged at DEBUG
+      - otel=True mirrors spans to OpenTelemetry when the SDK is installed
+    Spans are meant to be sequential; nested spans share the tracemalloc peak.
+    """
+
+    def __init__(self, sink: Optional[str | Path] = None, trace_memory: bool = False, otel: bool = False):
+        self.sink = Path(sink) if sink else None
+        self.trace_memory = trace_memory
+        self.tracer = otel_trace.get_tracer("campaign_pipeline") if otel and OTEL_AVAILABLE else None
+        if otel and not OTEL_AVAILABLE:
+            logger.warning("opentelemetry is not installed; spans are emitted as JSON lines only.")
+        self.run_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{id(self):x}"
+        self.spans: List[StageSpan] = []
+
+    @contextmanager
+    def span(self, name: str, rows_in: Optional[int] = None, **attributes) -> Iterator[StageSpan]:
+        span = StageSpan(name=name, run_id=self.run_id, start=time.time(), rows_in=rows_in, attributes=attributes)
+        started_tracing = False
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+            base, _ = tracemalloc.get_traced_memory()
+        rss0 = peak_rss_mb()
+        wall0, cpu0 = time.perf_counter(), time.process_time()
+
+        otel_cm = self.tracer.start_as_current_span(name) if self.tracer else None
+        otel_span = otel_cm.__enter__() if otel_cm else None
+        try:
+            yield span
+        except BaseException as e:
+            span.error = repr(e)
+            raise
+        finally:
+            span.wall_s = time.perf_counter() - wall0
+            span.cpu_s = time.process_time() - cpu0
+            span.peak_rss_mb = peak_rss_mb()
+            if rss0 is not None and span.peak_rss_mb is not None:
+                span.rss_growth_mb = span.peak_rss_mb - rss0
+            if self.trace_memory:
+                _, peak = tracemalloc.get_traced_memory()
+                span.alloc_peak_mb = max(peak - base, 0) / 1e6
+                if started_tracing:
+                    tracemalloc.stop()
+            if otel_span is not None:
+                for k, v in self._record(span).items():
+                    if v is not None and k not in ("name", "attributes"):
+                        otel_span.set_attribute(f"pipeline.{k}", v)
+                for k, v in span.attributes.items():
+                    otel_span.set_attribute(f"pipeline.{k}", v)
+                otel_cm.__exit__(*sys.exc_info())
+            self.spans.append(span)
+            self._emit(span)
+
+    @staticmethod
+    def _record(span: StageSpan) -> Dict[str, Any]:
+        return dict(span.__dict__)
+
+    def _emit(self, span: StageSpan) -> None:
+        line = json.dumps(self._record(span), default=str)
+        logger.debug(line)
+        if self.sink is not None:
+            self.sink.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.sink, "a") as fh:
+                fh.write(line + "\n")
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """All spans of the run as plain dicts (the JSON-lines records)."""
+        return [self._record(s) for s in self.spans]
@@ -3,74 +3,261 @@
 
 from pathlib import Path
 import logging
-from src.data_processing.loader import load_data
-from src.data_processing.cleaner import clean_data
-from src.analysis_engine.metrics import compute_kpis
-from src.analysis_engine.statistic_test import run_ab_tests
-from src.reporting.ai_report import generate_ai_report
-from src.reporting.export import export_to_ppt, export_to_pdf
+from src.cache import StageCache, file_digest
+from src.instrumentation import Instrumentation
+from src.data_processing.loader import DATA_RAW, load_data
+from src.data_processing.cleaner import clean_data, clean_data_stream, processed_path, save_processed
+from src.data_processing.grouping import load_group_rules
+from src.data_processing.validation import validate_frame
+from src.analysis_engine.aggregates import aggregate_groups
+from src.analysis_engine.charts import CHARTS_DIR, ChartStats, build_chart_specs, chart_stats, render_charts
+from src.analysis_engine.incremental import STATE_PATH, fold_new_rows, load_state, read_new_rows, reset_state
+from src.analysis_engine.power import plan_sample_size
+from src.analysis_engine.sequential import load_sequential_state, save_sequential_state
+from src.analysis_engine.metrics import compute_kpis_from_stats
+from src.analysis_engine.statistic_test import run_ab_tests, run_ab_tests_from_stats
+from src.reporting.ai_report import RESPONSE_CACHE_DIR, generate_ai_report
+from src.reporting.export import export_report
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def run_pipeline(csv_path: str | None = None):
-    logger.info("Loading data…")
-    df_raw = load_data(csv_path)
-
-    logger.info("Cleaning data…")
-    df = clean_data(df_raw)
-
-    logger.info("Computing KPIs…")
-    metrics = compute_kpis(df, avg_order_value=50.0)
-
-    logger.info("Running statistical tests (Clicks & Reach)…")
-    stats = run_ab_tests(df, conv_denominator="Both")
-
-    # ✅ Use EXISTING PNGs (no figure generation)
-    charts_dir = Path("reports") / "charts"
-    chart_paths = {
-        "Conversion Rate by Group": str(charts_dir / "conversion_rate_by_group.png"),
-        "Revenue Distribution":str(charts_dir / "revenue_distribution.png"),
-        "Return of Investment ":str(charts_dir / "roi_comparison.png"),
-        "Purchases Over Time":      str(charts_dir / "ts_purchases_by_group.png"),
-        "Impressions Over Time":    str(charts_dir / "ts_impressions_by_group.png"),
-        "Spend Over Time":          str(charts_dir / "ts_spend_by_group.png"),
-        "Website Clicks Over Time": str(charts_dir / "ts_clicks_by_group.png"),
-        "Conversion Funnel — Group A": str(charts_dir / "funnel_group_A.png"),
-        "Conversion Funnel — Group B": str(charts_dir / "funnel_group_B.png"),
-        "Spend vs Purchases — Group A": str(charts_dir / "pie_spend_vs_purchases_group_A.png"),
-        "Spend vs Purchases — Group B": str(charts_dir / "pie_spend_vs_purchases_group_B.png"),
-    }
-
-    # (Optional) validate files exist
-    missing = [p for p in chart_paths.values() if not Path(p).exists()]
-    if missing:
-        logger.warning("Some chart files are missing:\n- " + "\n- ".join(missing))
+def _agg_rows(agg) -> int:
+    return sum(s.rows for s in agg.groups.values())
+
+def run_pipeline(csv_path: str | None = None, chunksize: int | None = None,
+                 processed_format: str = "csv", incremental: bool = False,
+                 state_path: str = str(STATE_PATH), sequential: bool = False,
+                 avg_order_value: float = 50.0, conv_denominator: str = "Both",
+                 use_cache: bool = True, chart_workers: int | None = None,
+                 metrics_path: str | None = None, trace_memory: bool = False, otel: bool = False,
+                 group_rules_path: str | None = None, bayesian: bool = False,
+                 variance_reduction: bool = False, pre_period_end: str | None = None,
+                 plan_mde: float | None = None):
+    # Per-stage spans (wall/CPU time, memory, rows, cache hits): appended to metrics_path
+    # as JSON lines, optionally mirrored to OpenTelemetry, and returned as 'instrumentation'.
+    inst = Instrumentation(sink=metrics_path, trace_memory=trace_memory, otel=otel)
+
+    # Stage cache: stages whose inputs (file content, parameters, code version) are
+    # unchanged are loaded from .cache/pipeline instead of recomputed. parts=None
+    # marks a stage that is always computed.
+    cache = StageCache() if use_cache else None
+    def stage(name, parts, compute, rows_in=None, rows_out=None):
+        with inst.span(name, rows_in=rows_in) as span:
+            if cache is None or parts is None:
+                value, key = compute(), None
+            else:
+                value, key = cache.cached(name, parts, compute)
+                span.cache_hit = cache.hits[name]
+            if rows_out is not None:
+                span.rows_out = rows_out(value)
+        return value, key
+
+    # Campaign -> group rules (JSON, see GroupRules.from_dict); default A/B heuristic
+    group_rules = load_group_rules(group_rules_path) if group_rules_path else None
+    rules_key = file_digest(group_rules_path) if group_rules_path else None
+
+    # Sequential mode: always-valid p-values / confidence sequences across runs; the
+    # states remember which export their totals come from.
+    seq_states = load_sequential_state() if sequential else None
+    seq_source = str(Path(csv_path or DATA_RAW).resolve())
+
+    if incremental:
+        # Incremental mode: read only the raw lines past the byte offset stored in the
+        # state, validate and clean just those rows and fold them into the persisted
+        # aggregate state; KPIs and tests derive from the merged state. The state makes
+        # these stages stateful, so they bypass the stage cache.
+        logger.info("Loading new data…")
+        source = csv_path or DATA_RAW
+        (df_raw, offset, tail, restarted), _ = stage(
+            "load", None, lambda: read_new_rows(source, load_state(state_path)), rows_out=lambda r: len(r[0]))
+        if restarted:
+            logger.warning(f"{source} no longer extends the folded rows; rebuilding {state_path}.")
+
+        logger.info("Validating new rows…")
+        validation, _ = stage("validate", None, lambda: validate_frame(df_raw), rows_in=len(df_raw),
+                              rows_out=lambda r: r["flagged_rows"])
+
+        logger.info("Cleaning new rows…")
+        df, _ = stage("clean", None, lambda: clean_data(df_raw, save=False, group_rules=group_rules),
+                      rows_in=len(df_raw), rows_out=len)
+
+        logger.info(f"Folding new rows into {state_path}…")
+        def _fold():
+            first_run = restarted or not Path(state_path).exists()
+            state, df_new = fold_new_rows(df, path=state_path, rebuild=restarted, offset=offset, tail_digest=tail)
+            if len(df_new) or first_run:
+                # The first fold starts the processed output afresh; later folds extend it.
+                save_processed(df_new, save_format=processed_format, append=not first_run)
+            return state, df_new
+        (state, df_new), _ = stage("fold", None, _fold, rows_in=len(df), rows_out=lambda r: len(r[1]))
+        logger.info(f"Folded {len(df_new)} new rows.")
+        agg, charts = state.agg, state.charts
+        df = None  # only the new rows: charts come from the folded chart inputs
+
+        logger.info("Computing KPIs…")
+        metrics, _ = stage("kpis", None, lambda: compute_kpis_from_stats(agg, avg_order_value=avg_order_value),
+                           rows_in=_agg_rows(agg), rows_out=lambda m: len(m["groups"]))
+
+        logger.info("Running statistical tests (Clicks & Reach)…")
+        stats, _ = stage("stats", None, lambda: run_ab_tests_from_stats(
+            agg, conv_denominator=conv_denominator, sequential=seq_states, bayesian=bayesian,
+            sequential_source=seq_source), rows_out=len)
+    else:
+        data_key = (file_digest(csv_path or DATA_RAW), processed_format, chunksize, rules_key)
+
+        # Whenever this path rewrites the processed output, the incremental state no
+        # longer describes it: the next incremental run starts over from the first row
+        # instead of appending to rows the output no longer holds.
+        def rewrote_processed(value):
+            reset_state(state_path)
+            return value
+
+        if chunksize:
+            # Streaming mode: never materialize the full frame; analysis runs on group aggregates.
+            logger.info(f"Streaming data in chunks of {chunksize} rows…")
+            def _stream():
+                # Chart inputs are folded chunk by chunk alongside the group aggregates
+                parts = {"charts": ChartStats()}
+                def fold_charts(chunk):
+                    parts["charts"] = parts["charts"].merge(chart_stats(chunk))
+                agg = clean_data_stream(load_data(csv_path, chunksize=chunksize), save_format=processed_format,
+                                        group_rules=group_rules, on_chunk=fold_charts)
+                return rewrote_processed((agg, parts["charts"]))
+            (agg, charts), data_hash = stage("stream", data_key, _stream, rows_out=lambda r: _agg_rows(r[0]))
+            df = None
+            # Duplicate keys and per-campaign spikes need the whole frame at once.
+            logger.info("Validation skipped in streaming mode.")
+            validation = None
+        else:
+            # The raw frame is loaded at most once and only on a cache miss of either stage.
+            raw = {}
+            def raw_frame():
+                if "df" not in raw:
+                    raw["df"] = load_data(csv_path)
+                return raw["df"]
+
+            logger.info("Validating data…")
+            validation, _ = stage("validate", data_key, lambda: validate_frame(raw_frame()),
+                                  rows_out=lambda r: r["flagged_rows"])
+
+            logger.info("Loading & cleaning data…")
+            df, data_hash = stage("clean", data_key, lambda: rewrote_processed(clean_data(
+                raw_frame(), save_format=processed_format, group_rules=group_rules)), rows_out=len)
+            raw.clear()
+            # A run on other data may have overwritten the processed output since this
+            # frame was cached: its digest is kept next to the clean stage entry, and a
+            # hit whose output no longer matches rewrites it from the cached frame.
+            processed = processed_path(processed_format)
+            if cache is not None:
+                out_key = cache.key("processed", data_hash)
+                if cache.hits["clean"]:
+                    hit, digest = cache.get(out_key)
+                    if not hit or digest != file_digest(processed):
+                        rewrote_processed(save_processed(df, save_format=processed_format))
+                cache.put(out_key, file_digest(processed))
+            agg = None
+
+        logger.info("Computing KPIs…")
+        def _kpis():
+            a = agg if agg is not None else aggregate_groups(df)  # single scan shared by KPIs and tests
+            return a, compute_kpis_from_stats(a, avg_order_value=avg_order_value)
+        (agg, metrics), _ = stage("kpis", (data_hash, avg_order_value), _kpis,
+                                  rows_in=len(df) if df is not None else _agg_rows(agg),
+                                  rows_out=lambda r: len(r[1]["groups"]))
+
+        logger.info("Running statistical tests (Clicks & Reach)…")
+        def _stats():
+            # Variance reduction reads row-level RPU, so the streaming mode skips it.
+            if df is None:
+                return run_ab_tests_from_stats(agg, conv_denominator=conv_denominator, sequential=seq_states,
+                                               bayesian=bayesian, sequential_source=seq_source)
+            return run_ab_tests(df, conv_denominator=conv_denominator, agg=agg, sequential=seq_states,
+                                bayesian=bayesian, variance_reduction=variance_reduction,
+                                pre_period_end=pre_period_end, sequential_source=seq_source)
+        # Sequential state changes on every look, so that mode is never cached.
+        stats_key = (data_hash, conv_denominator, bayesian, variance_reduction, pre_period_end)
+        stats, _ = stage("stats", None if seq_states is not None else stats_key, _stats,
+                         rows_in=_agg_rows(agg), rows_out=len)
+
+    if seq_states is not None:
+        save_sequential_state(seq_states)
+
+    # Sample-size plan for a relative minimum detectable effect of plan_mde. The day
+    # span is known from the full frame; otherwise the planner assumes a row per day.
+    if plan_mde:
+        days = df["Date"].nunique() if df is not None and not incremental else None
+        plan = plan_sample_size(metrics, mde=plan_mde, days=days)
+    else:
+        plan = None
+
+    # Fresh charts on every run: specs are pre-aggregated here and drawn by worker
+    # processes; charts whose inputs are unchanged keep their existing PNG.
+    logger.info("Rendering charts…")
+    with inst.span("charts") as span:
+        # Streaming / incremental mode: the folded chart inputs stand in for the frame
+        span.rows_in = len(df) if df is not None else _agg_rows(agg)
+        specs = build_chart_specs(df if df is not None else charts, metrics, agg=agg, revenue_col=agg.revenue_col)
+        rendered = render_charts(specs, CHARTS_DIR, max_workers=chart_workers)
+        chart_paths = rendered["paths"]
+        span.rows_out = len(rendered["rendered"])
+        span.cache_hit = not rendered["rendered"]
+
+    sections = [
+        "Background and Hypothesis",
+        "Analysis Steps, Metrics, Anomalies",
+        "Statistical Significance and ROI",
+        "Blockers & Uncertainty",
+        "Recommendations",
+    ]
+    extra_notes = "Charts rendered from the current dataset into reports/charts."
+    chart_digests = {name: file_digest(p) for name, p in chart_paths.items()}
 
     logger.info("Generating AI report…")
-    ai_report = generate_ai_report(
+    # generate_ai_report keeps its own prompt -> response cache (.cache/ai_report), which
+    # stores only successful AI answers, so a transient API failure is retried next run.
+    ai_report, _ = stage("report", None, lambda: generate_ai_report(
         metrics=metrics,
         stats_results=stats,
         charts=chart_paths,
-        sections=[
-            "Background and Hypothesis",
-            "Analysis Steps, Metrics, Anomalies",
-            "Statistical Significance and ROI",
-            "Blockers & Uncertainty",
-            "Recommendations",
-        ],
-        extra_notes="Using pre-rendered PNG charts from reports/charts."
-    )
+        sections=sections,
+        extra_notes=extra_notes,
+        cache_dir=RESPONSE_CACHE_DIR if use_cache else None,
+        anomalies=validation,
+    ), rows_out=lambda r: len(r.get("slides", [])))
+    report_hash = cache.key("report", ai_report) if cache else None
 
     logger.info("Exporting to PDF and PPTX…")
-    pptx_path = export_to_ppt(ai_report, chart_paths, dest="reports/final_report.pptx")
-    pdf_path  = export_to_pdf(ai_report, chart_paths, dest="reports/final_report.pdf")
+    dests = {"pptx": "reports/final_report.pptx", "pdf": "reports/final_report.pdf"}
+    with inst.span("export", rows_in=len(chart_paths)) as span:
+        todo = dict(dests)
+        keys = {}
+        if cache is not None:
+            # Skip a writer when the same report + charts already produced an untouched dest.
+            for name, dest in dests.items():
+                keys[name] = cache.key(name, report_hash, chart_digests, dest)
+                hit, digest = cache.get(keys[name])
+                cache.hits[name] = hit and digest == file_digest(dest)
+                if cache.hits[name]:
+                    logger.info(f"Cache hit for stage '{name}'.")
+                    del todo[name]
+        if todo:
+            export_report(ai_report, chart_paths, todo)  # remaining formats written concurrently
+            if cache is not None:
+                for name, dest in todo.items():
+                    cache.put(keys[name], file_digest(dest))
+        span.rows_out = len(todo)
+        span.cache_hit = not todo
+    pptx_path, pdf_path = dests["pptx"], dests["pdf"]
 
     logger.info("Pipeline finished. Artifacts:")
     logger.info(f"PPTX: {pptx_path}")
     logger.info(f"PDF : {pdf_path}")
+    logger.info("Stage timings: " + ", ".join(f"{s.name}={s.wall_s:.3f}s" for s in inst.spans))
 
-    return {"metrics": metrics, "stats": stats, "charts": chart_paths, "pptx": pptx_path, "pdf": pdf_path}
+    return {"metrics": metrics, "stats": stats, "validation": validation, "plan": plan, "charts": chart_paths,
+            "pptx": pptx_path, "pdf": pdf_path,
+            "cache_hits": dict(cache.hits) if cache else {}, "instrumentation": inst.summary()}
 
 if __name__ == "__main__":
     # Run from repo root:  python -m src.pipeline
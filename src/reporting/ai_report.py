@@ -1,26 +1,60 @@
 # src/reporting/ai_report.py
 import os
 import json
-from typing import Dict, Any, List
+import asyncio
+import hashlib
+import random
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Optional
 from dotenv import load_dotenv
 
 # Load environment variables from .env
 load_dotenv()
 
 try:
-    from openai import OpenAI
-    client = OpenAI()
+    from openai import OpenAI, AsyncOpenAI
     OPENAI_AVAILABLE = True
 except ImportError:
     OPENAI_AVAILABLE = False
 
+MODEL = "gpt-4o-mini"
+SYSTEM_PROMPT = "You are an analytics report writer that outputs JSON."
+COMPLETION_PARAMS = {"max_tokens": 1200, "temperature": 0.3}
+RESPONSE_CACHE_DIR = Path(".cache/ai_report")
+RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Per-attempt timeout (seconds), retries after a failed attempt and base backoff (seconds)
+REQUEST_TIMEOUT = 60.0
+REQUEST_RETRIES = 3
+REQUEST_BACKOFF = 1.0
+
+_client = None
+
+def _get_client(base_url: Optional[str] = None):
+    """
+    Create the OpenAI client on first use, so importing this module never needs an API key.
+    Its own retries are disabled: callers retry with their own bound and backoff.
+    With base_url a new client is returned, which the caller closes.
+    """
+    global _client
+    if base_url is not None:
+        return OpenAI(base_url=base_url, api_key=os.getenv("OPENAI_API_KEY") or "local", max_retries=0)
+    if _client is None:
+        _client = OpenAI(max_retries=0)
+    return _client
+
+
+def _backoff_delay(attempt: int, backoff: float) -> float:
+    """Exponential backoff with jitter: backoff * 2**attempt seconds plus up to backoff."""
+    return backoff * 2 ** attempt + random.uniform(0, backoff)
+
 
 PROMPT_TEMPLATE = """
 You are a professional data analytics report writer and slide-writer for stakeholders.You need to give a detailed report starting from introduction
 till the very end in a clear concise and narrative manner make it as detailed as possible and ensure to to analyse all the JSON inputs given and 
 write down on impacts and whats better
 
-Input JSON (metrics, stats_results, charts, notes) is provided below.
+Input JSON (metrics, stats_results, charts, notes, anomalies) is provided below.
 
 Goal:
 - Produce a slide-by-slide output that can be used to auto-fill a PowerPoint.
@@ -31,10 +65,11 @@ Requirements:
 - Use stakeholder-friendly language (non-technical where possible).
 - Provide at least one sentence explaining the meaning of key metrics like CR, ROI, p-values.
 - For narrative, include summary, interpretation, limitations, and clear recommendations.
-- Mention data anomalies if present.
+- Mention data anomalies if present (the "anomalies" input lists data-quality findings with counts and examples).
 - Keep bullets concise (<18 words), but provide interpretation for each metric.
 - Distinguish clearly between post-click CR (Purchases/Clicks) and reach-based CR (Purchases/Reach). 
 - Prefer percentages for CR; show p-values and 95% CIs for differences.
+- If stats_results has "bayesian", also state the probability B beats A and the expected loss of choosing B.
 
 
 
@@ -66,7 +101,8 @@ Rules:
 - Output must be valid JSON with keys 'slides' and 'narrative'.
 """
 
-def generate_prompt_payload(metrics: Dict, stats_results: Dict, chart_paths: Dict, extra_notes: str = "") -> str:
+def _build_payload(metrics: Dict, stats_results: Dict, chart_paths: Dict, extra_notes: str = "",
+                   anomalies: Optional[Dict] = None) -> Dict[str, Any]:
     # Add human-friendly fields the AI can read directly
     def pct(x): 
         return None if x is None or (isinstance(x, float) and (x != x)) else f"{x*100:.2f}%"
@@ -97,6 +133,30 @@ def generate_prompt_payload(metrics: Dict, stats_results: Dict, chart_paths: Dic
             "pvalue": fmt(t.get("pvalue")),
             "ci_95": [fmt(t["ci_95"][0]), fmt(t["ci_95"][1])]
         }
+    if "steps" in stats_results.get("funnel", {}):
+        pretty["funnel"] = {
+            step["step"]: {
+                "rate": {g: pct(r) for g, r in step["rate"].items()},
+                "tests": {g: {"diff": pct(t["diff"]), "pvalue_adj": fmt(t["pvalue_adj"])}
+                          for g, t in step["tests"].items()},
+            }
+            for step in stats_results["funnel"]["steps"]
+        }
+    if "bayesian" in stats_results and "error" not in stats_results["bayesian"]:
+        pretty["bayesian"] = {
+            name: {g: {"prob_beats_A": pct(c["prob_better"]),
+                       "expected_loss": (fmt if name == "rpu" else pct)(c["expected_loss"])}
+                   for g, c in res["vs_control"].items()}
+            for name, res in stats_results["bayesian"].items()
+        }
+    vr = stats_results.get("rpu_variance_reduction", {})
+    if vr.get("best_method"):
+        pretty["rpu_variance_reduction"] = {
+            name: {g: {"diff": fmt(c["diff"]), "pvalue": fmt(c["pvalue"]),
+                       "variance_reduction": pct(c["variance_reduction"])}
+                   for g, c in vr[name]["vs_control"].items()}
+            for name in ("unadjusted", vr["best_method"])
+        }
 
     payload = {
         "metrics": metrics,
@@ -106,13 +166,95 @@ def generate_prompt_payload(metrics: Dict, stats_results: Dict, chart_paths: Dic
         "notes": extra_notes,
         "definitions": {
             "click_cr": "Conversion Rate (post-click) = Purchases / Website Clicks",
-            "reach_cr": "Conversion Rate (reach) = Purchases / Reach"
+            "reach_cr": "Conversion Rate (reach) = Purchases / Reach",
+            "funnel": "Step rate = next stage / previous stage; drop_off = 1 - rate; "
+                      "tests compare each group to A, pvalue_adj is Holm-corrected across steps and groups",
+            "bayesian": "prob_beats_A = posterior probability the group's rate/RPU exceeds A's; "
+                        "expected_loss = expected shortfall vs A if the group is chosen but is worse",
+            "rpu_variance_reduction": "RPU difference adjusted for weekday/date mix (post-stratification) and "
+                                      "pre-period levels (CUPED); variance_reduction = share of variance removed"
         }
     }
+    if anomalies is not None:
+        payload["anomalies"] = anomalies  # validate_frame report
+    return payload
+
+
+def generate_prompt_payload(metrics: Dict, stats_results: Dict, chart_paths: Dict, extra_notes: str = "",
+                            anomalies: Optional[Dict] = None) -> str:
+    payload = _build_payload(metrics, stats_results, chart_paths, extra_notes, anomalies)
     return PROMPT_TEMPLATE + "\n\nINPUT:\n" + json.dumps(payload, indent=2)
 
 
-def _build_fallback_slide_structure(metrics: Dict, stats_results: Dict, charts: Dict, notes: str = "") -> Dict[str, Any]:
+# ---------------------------------------------------------------------------
+# Prompt -> response cache
+# ---------------------------------------------------------------------------
+
+def response_cache_key(metrics: Dict, stats_results: Dict, charts: Dict, extra_notes: str = "",
+                       model: str = MODEL, anomalies: Optional[Dict] = None) -> str:
+    """
+    sha256 of the normalized request: the payload serialized with sorted keys plus the
+    model, system prompt, template and sampling parameters. Key order and formatting of
+    the inputs do not change the key; any change to what the model would see does.
+    """
+    payload = _build_payload(metrics, stats_results, charts, extra_notes, anomalies)
+    request = {"model": model, "system": SYSTEM_PROMPT, "template": PROMPT_TEMPLATE,
+               "params": COMPLETION_PARAMS, "payload": payload}
+    return hashlib.sha256(json.dumps(request, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _cache_get(key: str, cache_dir: Optional[Path]) -> Optional[Dict[str, Any]]:
+    if cache_dir is None:
+        return None
+    p = Path(cache_dir) / f"{key}.json"
+    try:
+        with open(p) as fh:
+            obj = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    os.utime(p)  # mark as recently used
+    return obj
+
+
+def _cache_put(key: str, obj: Dict[str, Any], cache_dir: Optional[Path],
+               max_bytes: int = RESPONSE_CACHE_MAX_BYTES) -> None:
+    """Store a response; the cache is then trimmed to max_bytes, least recently used first."""
+    if cache_dir is None:
+        return
+    p = Path(cache_dir) / f"{key}.json"
+    p.parent.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_suffix(".tmp")
+    with open(tmp, "w") as fh:
+        json.dump(obj, fh)
+    os.replace(tmp, p)
+
+    entries = sorted(Path(cache_dir).glob("*.json"), key=lambda e: e.stat().st_mtime)
+    total = sum(e.stat().st_size for e in entries)
+    while entries and total > max_bytes:
+        oldest = entries.pop(0)
+        total -= oldest.stat().st_size
+        oldest.unlink(missing_ok=True)
+
+
+def _parse_response(text: str) -> Optional[Dict[str, Any]]:
+    """Parse the model's JSON; None (after a warning) if it is unusable."""
+    try:
+        obj = json.loads(text)
+        if "slides" in obj and "narrative" in obj:
+            return obj
+        print("[WARN] AI response missing keys. Falling back.")
+    except Exception as e:
+        print("[ERROR] Failed to parse AI JSON:", e)
+        print("Raw AI response:\n", text)
+    return None
+
+
+def _ai_enabled(base_url: Optional[str]) -> bool:
+    return OPENAI_AVAILABLE and bool(os.getenv("OPENAI_API_KEY") or base_url)
+
+
+def _build_fallback_slide_structure(metrics: Dict, stats_results: Dict, charts: Dict, notes: str = "",
+                                    anomalies: Optional[Dict] = None) -> Dict[str, Any]:
     """Deterministic fallback structure if AI not available or fails."""
     slides = []
     groups = metrics.get("groups", {})
@@ -171,10 +313,28 @@ def _build_fallback_slide_structure(metrics: Dict, stats_results: Dict, charts:
         stat_bullets.append(
             f"RPU t-test p-value: {rpu_test.get('pvalue'):.3f}; mean diff: {rpu_test.get('mean_diff'):.4f}"
         )
+    bayes = stats_results.get("bayesian", {})
+    for name, label in (("cr_click_based", "click CR"), ("cr_reach_based", "reach CR"), ("rpu", "RPU")):
+        c = bayes.get(name, {}).get("vs_control", {}).get("B")
+        if c and c.get("prob_better") is not None:
+            stat_bullets.append(f"P(B beats A) on {label}: {c['prob_better']:.1%}; "
+                                f"expected loss of choosing B: {c['expected_loss']:.4g}")
+    vr = stats_results.get("rpu_variance_reduction", {})
+    best = vr.get(vr.get("best_method") or "", {}).get("vs_control", {}).get("B")
+    if best and best.get("pvalue") is not None:
+        stat_bullets.append(f"RPU with variance reduction ({vr['best_method']}): p-value {best['pvalue']:.3f}; "
+                            f"variance reduced by {best['variance_reduction']:.1%}")
     if not stat_bullets:
         stat_bullets.append("Statistical tests unavailable or failed.")
     slides.append({"title": "Statistical Significance", "bullets": stat_bullets})
 
+    # Data Quality & Anomalies (validate_frame report)
+    dq_bullets = []
+    if anomalies is not None:
+        dq_bullets = list(anomalies.get("anomalies", [])) or [
+            f"No data quality issues found in {anomalies.get('rows', 0)} rows."]
+        slides.append({"title": "Data Quality & Anomalies", "bullets": dq_bullets})
+
     # Blockers & Assumptions
     blockers = [
         "Revenue column missing; used avg_order_value fallback.",
@@ -214,6 +374,9 @@ def _build_fallback_slide_structure(metrics: Dict, stats_results: Dict, charts:
     narrative_lines.extend(["- " + l for l in km])
     narrative_lines.append("\nStatistical Significance:")
     narrative_lines.extend(["- " + s for s in stat_bullets])
+    if dq_bullets:
+        narrative_lines.append("\nData Quality & Anomalies:")
+        narrative_lines.extend(["- " + d for d in dq_bullets])
     narrative_lines.append("\nRecommendations:")
     narrative_lines.extend(["- " + r for r in recs])
 
@@ -222,34 +385,132 @@ def _build_fallback_slide_structure(metrics: Dict, stats_results: Dict, charts:
     return {"slides": slides, "narrative": narrative}
 
 
-def generate_ai_report(metrics: Dict, stats_results: Dict, charts: Dict, sections: List[str] = None, extra_notes: str = "") -> Dict[str, Any]:
+def generate_ai_report(metrics: Dict, stats_results: Dict, charts: Dict, sections: List[str] = None, extra_notes: str = "",
+                       cache_dir: Optional[Path] = RESPONSE_CACHE_DIR, base_url: Optional[str] = None,
+                       anomalies: Optional[Dict] = None, timeout: float = REQUEST_TIMEOUT,
+                       retries: int = REQUEST_RETRIES, backoff: float = REQUEST_BACKOFF) -> Dict[str, Any]:
     """
     Returns structured report dict with 'slides' and 'narrative'.
     Prefers AI output, falls back to deterministic builder if API fails.
+      - anomalies (a validate_frame report) feeds the data-quality / anomalies section
+      - Valid AI responses are cached on disk under cache_dir (None disables),
+        keyed by response_cache_key and capped at RESPONSE_CACHE_MAX_BYTES;
+        fallback reports are never cached
+      - base_url points a client created for this call, and closed before returning,
+        at another endpoint (e.g. a local stub server)
+      - Each attempt is bounded by `timeout` seconds; failed attempts are retried up
+        to `retries` times with exponential backoff, as in agenerate_ai_report
     """
-    prompt = generate_prompt_payload(metrics, stats_results, charts, extra_notes)
-
-    if OPENAI_AVAILABLE and os.getenv("OPENAI_API_KEY"):
+    key = response_cache_key(metrics, stats_results, charts, extra_notes, anomalies=anomalies)
+    cached = _cache_get(key, cache_dir)
+    if cached is not None:
+        return cached
+
+    if _ai_enabled(base_url):
+        prompt = generate_prompt_payload(metrics, stats_results, charts, extra_notes, anomalies)
+        messages = [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}]
+        client = _get_client(base_url)  # one client for every attempt of this call
         try:
-            completion = client.chat.completions.create(model="gpt-4o-mini",
-            messages=[{"role": "system", "content": "You are an analytics report writer that outputs JSON."},
-                      {"role": "user", "content": prompt},],
-                      max_tokens=1200,temperature=0.3,)
-            text = completion.choices[0].message.content.strip()
-
-            # Try parsing JSON
-            try:
-                obj = json.loads(text)
-                if "slides" in obj and "narrative" in obj:
-                    return obj
-                else:
-                    print("[WARN] AI response missing keys. Falling back.")
-            except Exception as e:
-                print("[ERROR] Failed to parse AI JSON:", e)
-                print("Raw AI response:\n", text)
-
-        except Exception as e:
-            print("[ERROR] OpenAI API call failed:", e)
+            for attempt in range(retries + 1):
+                try:
+                    completion = client.chat.completions.create(
+                        model=MODEL, messages=messages, timeout=timeout, **COMPLETION_PARAMS)
+                    obj = _parse_response(completion.choices[0].message.content.strip())
+                    if obj is not None:
+                        _cache_put(key, obj, cache_dir)
+                        return obj
+                    break  # a well-formed but unusable answer is not retried
+                except Exception as e:
+                    print(f"[ERROR] OpenAI API call failed (attempt {attempt + 1}/{retries + 1}):", repr(e))
+                    if attempt < retries:
+                        time.sleep(_backoff_delay(attempt, backoff))
+        finally:
+            if base_url is not None:
+                client.close()
 
     # Fallback deterministic builder
-    return _build_fallback_slide_structure(metrics, stats_results, charts, extra_notes)
\ No newline at end of file
+    return _build_fallback_slide_structure(metrics, stats_results, charts, extra_notes, anomalies)
+
+
+# ---------------------------------------------------------------------------
+# Async path: many reports with bounded concurrency
+# ---------------------------------------------------------------------------
+
+async def agenerate_ai_report(metrics: Dict, stats_results: Dict, charts: Dict, sections: List[str] = None,
+                              extra_notes: str = "", cache_dir: Optional[Path] = RESPONSE_CACHE_DIR,
+                              client=None, semaphore: Optional[asyncio.Semaphore] = None,
+                              timeout: float = REQUEST_TIMEOUT, retries: int = REQUEST_RETRIES,
+                              backoff: float = REQUEST_BACKOFF,
+                              base_url: Optional[str] = None, anomalies: Optional[Dict] = None) -> Dict[str, Any]:
+    """
+    Async generate_ai_report sharing the same response cache and fallback.
+      - Each attempt is bounded by `timeout` seconds
+      - Failed attempts are retried up to `retries` times with exponential backoff
+        (backoff * 2**attempt seconds, plus jitter)
+      - `semaphore` bounds how many requests are in flight across concurrent calls
+      - `client` is shared when given (agenerate_ai_reports); otherwise one is
+        created for this call and closed before returning
+    """
+    key = response_cache_key(metrics, stats_results, charts, extra_notes, anomalies=anomalies)
+    cached = _cache_get(key, cache_dir)
+    if cached is not None:
+        return cached
+
+    if _ai_enabled(base_url):
+        own_client = client is None
+        if own_client:
+            client = AsyncOpenAI(base_url=base_url, api_key=os.getenv("OPENAI_API_KEY") or "local",
+                                 max_retries=0)
+        prompt = generate_prompt_payload(metrics, stats_results, charts, extra_notes, anomalies)
+        messages = [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}]
+        semaphore = semaphore or asyncio.Semaphore(1)
+
+        try:
+            for attempt in range(retries + 1):
+                try:
+                    async with semaphore:
+                        completion = await asyncio.wait_for(
+                            client.chat.completions.create(model=MODEL, messages=messages, **COMPLETION_PARAMS),
+                            timeout=timeout)
+                    obj = _parse_response(completion.choices[0].message.content.strip())
+                    if obj is not None:
+                        _cache_put(key, obj, cache_dir)
+                        return obj
+                    break  # a well-formed but unusable answer is not retried
+                except Exception as e:
+                    print(f"[ERROR] OpenAI API call failed (attempt {attempt + 1}/{retries + 1}):", repr(e))
+                    if attempt < retries:
+                        await asyncio.sleep(_backoff_delay(attempt, backoff))
+        finally:
+            if own_client:
+                await client.close()
+
+    return _build_fallback_slide_structure(metrics, stats_results, charts, extra_notes, anomalies)
+
+
+async def agenerate_ai_reports(jobs: List[Dict[str, Any]], max_concurrency: int = 4,
+                               **kwargs) -> List[Dict[str, Any]]:
+    """
+    Generate one report per job (a dict of agenerate_ai_report keyword arguments:
+    metrics, stats_results, charts, ...), with at most max_concurrency requests in
+    flight. Results are returned in job order. All jobs share one client: the given
+    one, or one created for the batch and closed when the batch is done.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    client = kwargs.pop("client", None)
+    own_client = client is None and _ai_enabled(kwargs.get("base_url"))
+    if own_client:
+        client = AsyncOpenAI(base_url=kwargs.get("base_url"),
+                             api_key=os.getenv("OPENAI_API_KEY") or "local", max_retries=0)
+    try:
+        return await asyncio.gather(*[
+            agenerate_ai_report(**job, client=client, semaphore=semaphore, **kwargs) for job in jobs
+        ])
+    finally:
+        if own_client:
+            await client.close()
+
+
+def generate_ai_reports(jobs: List[Dict[str, Any]], max_concurrency: int = 4, **kwargs) -> List[Dict[str, Any]]:
+    """Synchronous entry point for agenerate_ai_reports."""
+    return asyncio.run(agenerate_ai_reports(jobs, max_concurrency=max_concurrency, **kwargs))
@@ -1,8 +1,12 @@
 # src/reporting/exporter.py
 from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from io import BytesIO
 from pathlib import Path
-from typing import Dict, Any, Tuple
+from typing import BinaryIO, Dict, Any, Optional, Tuple, Union
+import struct
 
 from pptx import Presentation
 from pptx.util import Inches, Pt
@@ -24,8 +28,30 @@ except Exception:  # Pillow not installed
     PILImage = None
 
 
+# Where a writer puts its output: a file path or a writable binary buffer
+Destination = Union[str, Path, BinaryIO]
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
 # -------------- Helpers --------------
 
+@dataclass
+class ImageAsset:
+    """Chart bytes and pixel size, read once and shared by every export format."""
+    path: str
+    data: bytes
+    size: Optional[Tuple[int, int]]  # (width_px, height_px); None if unknown
+
+    def stream(self) -> BytesIO:
+        return BytesIO(self.data)
+
+def _png_size(data: bytes) -> Tuple[int, int] | None:
+    """Width/height from the PNG IHDR chunk, without decoding the image."""
+    if data[:8] == _PNG_SIGNATURE and data[12:16] == b"IHDR":
+        return struct.unpack(">II", data[16:24])
+    return None
+
 def _img_size_pixels(img_path: Path) -> Tuple[int, int] | None:
     if PILImage is None:
         return None
@@ -35,6 +61,28 @@ def _img_size_pixels(img_path: Path) -> Tuple[int, int] | None:
     except Exception:
         return None
 
+def load_images(chart_paths: Dict[str, str]) -> Dict[str, Optional[ImageAsset]]:
+    """
+    Read every chart once: bytes plus pixel size (PNG header, else Pillow).
+    Missing files map to None so writers can add their placeholder.
+    """
+    images: Dict[str, Optional[ImageAsset]] = {}
+    for name, path in chart_paths.items():
+        p = Path(path)
+        if not p.exists():
+            images[name] = None
+            continue
+        data = p.read_bytes()
+        size = _png_size(data) or _img_size_pixels(BytesIO(data))
+        images[name] = ImageAsset(path=str(p), data=data, size=size)
+    return images
+
+def _prepare_dest(dest: Destination) -> Destination:
+    if isinstance(dest, (str, Path)):
+        Path(dest).parent.mkdir(parents=True, exist_ok=True)
+        return str(dest)
+    return dest
+
 def _scale_to_fit(w_px: int, h_px: int, max_w_in: float, max_h_in: float, dpi: int = 96) -> Tuple[float, float]:
     """
     Scale pixel image to fit within max inches, preserving aspect ratio.
@@ -49,14 +97,17 @@ def _scale_to_fit(w_px: int, h_px: int, max_w_in: float, max_h_in: float, dpi: i
 
 # -------------- PowerPoint Export --------------
 
-def export_to_ppt(report: Dict[str, Any], chart_paths: Dict[str, str], dest: str = "reports/final_report.pptx"):
+def export_to_ppt(report: Dict[str, Any], chart_paths: Dict[str, str], dest: Destination = "reports/final_report.pptx",
+                  images: Optional[Dict[str, Optional[ImageAsset]]] = None):
     """
     Export AI-generated report (slides + narrative) to PowerPoint.
     - Adds text slides from 'report["slides"]'
     - Appends one image-only slide per chart in 'chart_paths'
+    - dest may be a path or a writable binary buffer (e.g. BytesIO)
+    - images: pre-loaded charts from load_images (read here if not given)
     """
-    dest_path = Path(dest)
-    dest_path.parent.mkdir(parents=True, exist_ok=True)
+    dest = _prepare_dest(dest)
+    images = images if images is not None else load_images(chart_paths)
     prs = Presentation()
 
     # Slide 1: Title
@@ -83,14 +134,14 @@ def export_to_ppt(report: Dict[str, Any], chart_paths: Dict[str, str], dest: str
 
     # Chart slides (Title Only layout so we have a title placeholder)
     for name, path in chart_paths.items():
-        p = Path(path)
-        if not p.exists():
+        asset = images.get(name)
+        if asset is None:
             # Add a text-only slide noting missing asset
             slide = prs.slides.add_slide(prs.slide_layouts[5])
             slide.shapes.title.text = name
             tb = slide.shapes.add_textbox(Inches(1), Inches(2.5), Inches(8), Inches(1))
             tf = tb.text_frame
-            tf.text = f"[Missing chart file] {p}"
+            tf.text = f"[Missing chart file] {Path(path)}"
             continue
 
         slide = prs.slides.add_slide(prs.slide_layouts[5])  # Title Only
@@ -102,18 +153,18 @@ def export_to_ppt(report: Dict[str, Any], chart_paths: Dict[str, str], dest: str
         max_w_in = 10.0                # leave margins
         max_h_in = 5.6                 # keep under title area
 
-        size_px = _img_size_pixels(p)
+        size_px = asset.size
         if size_px:
             w_in, h_in = _scale_to_fit(size_px[0], size_px[1], max_w_in, max_h_in, dpi=96)
         else:
-            # Fallback fixed size if Pillow isn't available
+            # Fallback fixed size if the image size is unknown
             w_in, h_in = 9.5, 5.3
 
         # Center the picture
         left = Inches((max(0.0, (slide_w / 914400)) - w_in) / 2.0)  # 914400 EMU = 1 inch
         top = Inches(1.2 + (max_h_in - h_in) / 2.0)
 
-        slide.shapes.add_picture(str(p), left, top, width=Inches(w_in), height=Inches(h_in))
+        slide.shapes.add_picture(asset.stream(), left, top, width=Inches(w_in), height=Inches(h_in))
 
     prs.save(dest)
     return dest
@@ -121,16 +172,19 @@ def export_to_ppt(report: Dict[str, Any], chart_paths: Dict[str, str], dest: str
 
 # -------------- PDF Export (ReportLab) --------------
 
-def export_to_pdf(report: Dict[str, Any], chart_paths: Dict[str, str], dest: str = "reports/final_report.pdf"):
+def export_to_pdf(report: Dict[str, Any], chart_paths: Dict[str, str], dest: Destination = "reports/final_report.pdf",
+                  images: Optional[Dict[str, Optional[ImageAsset]]] = None):
     """
     Export AI-generated report (narrative + slides summary + charts) to PDF via ReportLab.
     - Creates/ensures a 'Caption' style
     - Scales images to fit page while preserving aspect ratio
+    - dest may be a path or a writable binary buffer (e.g. BytesIO)
+    - images: pre-loaded charts from load_images (read here if not given)
     """
-    dest_path = Path(dest)
-    dest_path.parent.mkdir(parents=True, exist_ok=True)
+    dest = _prepare_dest(dest)
+    images = images if images is not None else load_images(chart_paths)
 
-    doc = SimpleDocTemplate(str(dest_path), pagesize=letter, rightMargin=36, leftMargin=36, topMargin=36, bottomMargin=36)
+    doc = SimpleDocTemplate(dest, pagesize=letter, rightMargin=36, leftMargin=36, topMargin=36, bottomMargin=36)
     styles = getSampleStyleSheet()
 
     # Ensure we have a 'Caption' style (safe default)
@@ -185,19 +239,19 @@ def export_to_pdf(report: Dict[str, Any], chart_paths: Dict[str, str], dest: str
 
         max_w_in, max_h_in = 6.5, 4.6  # safe printable area
         for name, path in chart_paths.items():
-            p = Path(path)
-            if not p.exists():
-                story.append(Paragraph(f"[Missing chart file] {p}", styles["BodyText"]))
+            asset = images.get(name)
+            if asset is None:
+                story.append(Paragraph(f"[Missing chart file] {Path(path)}", styles["BodyText"]))
                 story.append(Spacer(1, 6))
                 continue
 
             # Read size and scale
             w_in, h_in = 6.0, 4.0
-            size_px = _img_size_pixels(p)
+            size_px = asset.size
             if size_px:
                 w_in, h_in = _scale_to_fit(size_px[0], size_px[1], max_w_in, max_h_in, dpi=96)
 
-            img = RLImage(str(p), width=w_in * 72, height=h_in * 72)  # 72 pt = 1 inch
+            img = RLImage(asset.stream(), width=w_in * 72, height=h_in * 72)  # 72 pt = 1 inch
             caption = Paragraph(name, styles["Caption"])
 
             # Keep image+caption together
@@ -206,3 +260,34 @@ def export_to_pdf(report: Dict[str, Any], chart_paths: Dict[str, str], dest: str
 
     doc.build(story)
     return dest
+
+
+# -------------- Concurrent Export --------------
+
+WRITERS = {"pptx": export_to_ppt, "pdf": export_to_pdf}
+
+def export_report(report: Dict[str, Any], chart_paths: Dict[str, str],
+                  dests: Dict[str, Optional[Destination]], max_workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Write several formats of the same report concurrently.
+    - dests maps a format ("pptx", "pdf") to a path, a writable binary buffer,
+      or None to render in memory
+    - Charts are read once (load_images) and shared by every writer
+    - Writers run on a thread pool; both libraries spend much of their time in
+      zlib / file I/O, which release the GIL
+
+    Returns {format: dest} for path/buffer destinations and {format: bytes} for None.
+    """
+    unknown = set(dests) - set(WRITERS)
+    if unknown:
+        raise ValueError(f"Unknown export format(s): {sorted(unknown)}")
+
+    images = load_images(chart_paths)
+    targets = {fmt: BytesIO() if dest is None else dest for fmt, dest in dests.items()}
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(targets) or 1) as pool:
+        futures = {fmt: pool.submit(WRITERS[fmt], report, chart_paths, dest=target, images=images)
+                   for fmt, target in targets.items()}
+        results = {fmt: f.result() for fmt, f in futures.items()}
+
+    return {fmt: targets[fmt].getvalue() if dests[fmt] is None else results[fmt] for fmt in dests}
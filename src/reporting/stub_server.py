@@ -0,0 +1,87 @@
+# src/reporting/stub_server.py
+from __future__ import annotations
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, Optional
+import json
+import threading
+import time
+
+STUB_REPORT = {
+    "slides": [{"title": "Stub Report", "bullets": ["Generated by the local stub server."]}],
+    "narrative": "Stub narrative.",
+}
+
+
+class _StubState:
+    def __init__(self, response: Dict[str, Any], delay: float, fail_first: int):
+        self.response = response
+        self.delay = delay
+        self.fail_first = fail_first
+        self.requests = 0
+        self.lock = threading.Lock()
+
+
+def _handler(state: _StubState):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            with state.lock:
+                state.requests += 1
+                n = state.requests
+            time.sleep(state.delay)
+
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+            elif n <= state.fail_first:
+                self._send(500, {"error": {"message": "stub failure", "type": "server_error"}})
+            else:
+                self._send(200, {
+                    "id": f"stub-{n}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "stub"),
+                    "choices": [{
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": json.dumps(state.response)},
+                    }],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                })
+
+        def _send(self, status: int, obj: Dict[str, Any]):
+            data = json.dumps(obj).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):  # keep test output quiet
+            pass
+
+    return Handler
+
+
+@contextmanager
+def serve_stub(response: Optional[Dict[str, Any]] = None, delay: float = 0.0,
+               fail_first: int = 0) -> Iterator[Dict[str, Any]]:
+    """
+    Run an OpenAI-compatible chat completions endpoint on localhost for tests.
+      - response  : JSON object returned as the message content (default STUB_REPORT)
+      - delay     : seconds to sleep per request (exercises timeouts / concurrency)
+      - fail_first: answer the first N requests with HTTP 500 (exercises retries)
+
+    Yields {'base_url': ..., 'state': ...}; pass base_url to generate_ai_report /
+    agenerate_ai_report, and read state.requests for the number of calls served.
+    """
+    state = _StubState(response or STUB_REPORT, delay, fail_first)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _handler(state))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield {"base_url": f"http://127.0.0.1:{server.server_port}/v1", "state": state}
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,102 @@
+# tests/test_batch.py
+"""
+run_experiments against run_ab_tests / compute_kpis evaluated experiment by
+experiment, on the serial path and on the process pool.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.analysis_engine.batch import run_experiments
+from src.analysis_engine.metrics import compute_kpis
+from src.analysis_engine.statistic_test import run_ab_tests
+from src.data_processing.cleaner import clean_data
+from src.data_processing.synthetic import iter_campaign_data
+
+N_EXPERIMENTS = 7
+AOV = 40.0
+
+
+@pytest.fixture(scope="module")
+def experiments():
+    raw = pd.concat(iter_campaign_data(1_400, n_campaigns=2), ignore_index=True)
+    df = clean_data(raw, save=False)
+    df["experiment"] = np.arange(len(df)) % N_EXPERIMENTS
+    # One experiment without a B arm
+    return df[~((df["experiment"] == 3) & (df["group"] == "B"))].reset_index(drop=True)
+
+
+@pytest.fixture(scope="module")
+def serial(experiments):
+    return run_experiments(experiments, "experiment", avg_order_value=AOV, max_workers=1)
+
+
+@pytest.fixture(scope="module")
+def pooled(experiments):
+    return run_experiments(experiments, "experiment", avg_order_value=AOV, max_workers=2, chunk_size=2)
+
+
+def _expected(sub: pd.DataFrame, alpha: float = 0.05) -> pd.DataFrame:
+    """The batch result rows of one experiment, from run_ab_tests / compute_kpis."""
+    tests = run_ab_tests(sub, alpha=alpha, conv_denominator="Both", bootstrap_rpu=False, funnel=False)
+    kpis = compute_kpis(sub, avg_order_value=AOV)
+    rows = []
+    for name in ("cr_click_based", "cr_reach_based"):
+        t = tests[name]
+        rows.append({"test": name, "metric_A": t["cr_A"], "metric_B": t["cr_B"], "diff": t["diff"],
+                     "ci_low": t["diff_ci_95"][0], "ci_high": t["diff_ci_95"][1],
+                     "statistic": t["statistic"], "pvalue": t["pvalue"]})
+    t = tests["rpu_ttest"]
+    rows.append({"test": "rpu_ttest", "metric_A": t["rpu_A_mean"], "metric_B": t["rpu_B_mean"],
+                 "diff": t["mean_diff"], "ci_low": t["ci_95"][0], "ci_high": t["ci_95"][1],
+                 "statistic": t["tstatistic"], "pvalue": t["pvalue"]})
+    roi_a, roi_b = kpis["groups"]["A"]["roi"], kpis["groups"]["B"]["roi"]
+    rows.append({"test": "roi", "metric_A": roi_a, "metric_B": roi_b, "diff": roi_b - roi_a})
+    return pd.DataFrame(rows)
+
+
+@pytest.mark.parametrize("mode", ["serial", "pooled"])
+def test_results_match_per_experiment_tests(request, experiments, mode):
+    out = request.getfixturevalue(mode)
+    results = out["results"]
+    assert out["n_experiments"] == N_EXPERIMENTS
+    assert results["experiment"].is_monotonic_increasing
+
+    for exp, sub in experiments.groupby("experiment"):
+        got = results[results["experiment"] == exp].reset_index(drop=True)
+        if exp == 3:
+            assert got["test"].isna().all()
+            assert got["error"].str.contains("Both groups A and B").all()
+            continue
+        expected = _expected(sub)
+        assert got["test"].tolist() == expected["test"].tolist()
+        got = got[expected.columns]
+        pd.testing.assert_frame_equal(got, expected, check_dtype=False, rtol=1e-9)
+
+
+def test_intervals_follow_alpha(experiments):
+    results = run_experiments(experiments, "experiment", avg_order_value=AOV, alpha=0.2, max_workers=1)["results"]
+    sub = experiments[experiments["experiment"] == 0]
+    got = results[results["experiment"] == 0].reset_index(drop=True)
+    expected = _expected(sub, alpha=0.2)
+    pd.testing.assert_frame_equal(got[expected.columns], expected, check_dtype=False, rtol=1e-9)
+    # Narrower than the 95% intervals
+    default = _expected(sub)
+    assert ((expected["ci_high"] - expected["ci_low"]) < (default["ci_high"] - default["ci_low"])).iloc[:3].all()
+
+
+@pytest.mark.parametrize("mode", ["serial", "pooled"])
+def test_kpis_match_compute_kpis(request, experiments, mode):
+    kpis = request.getfixturevalue(mode)["kpis"]
+    assert list(kpis) == [(e,) for e in range(N_EXPERIMENTS)]
+    for exp, sub in experiments.groupby("experiment"):
+        expected = pd.json_normalize(compute_kpis(sub, avg_order_value=AOV)).iloc[0]
+        got = pd.json_normalize(kpis[(exp,)]).iloc[0]
+        pd.testing.assert_series_equal(got, expected, rtol=1e-9)
+
+
+def test_pool_matches_serial(serial, pooled):
+    pd.testing.assert_frame_equal(pooled["results"], serial["results"])
+    assert pooled["kpis"].keys() == serial["kpis"].keys()
+    pd.testing.assert_frame_equal(pd.json_normalize(list(pooled["kpis"].values())),
+                                  pd.json_normalize(list(serial["kpis"].values())))
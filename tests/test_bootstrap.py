@@ -0,0 +1,32 @@
+# tests/test_bootstrap.py
+"""Bootstrap RPU intervals on degenerate input."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.analysis_engine.bootstrap import bootstrap_mean_diff_ci
+from src.analysis_engine.statistic_test import run_ab_tests
+from src.data_processing.cleaner import clean_data
+from src.data_processing.synthetic import iter_campaign_data
+
+
+@pytest.mark.parametrize("values", [np.zeros(20), np.full(20, 3.5)])
+def test_studentized_constant_groups_give_nan_interval(values):
+    lo, hi = bootstrap_mean_diff_ci(values, values, n_iter=200, method="studentized")
+    assert np.isnan(lo) and np.isnan(hi)
+
+
+def test_studentized_interval_covers_estimate():
+    rng = np.random.default_rng(0)
+    a, b = rng.normal(1.0, 1.0, 200), rng.normal(1.3, 1.0, 200)
+    lo, hi = bootstrap_mean_diff_ci(a, b, n_iter=500, method="studentized")
+    assert lo < b.mean() - a.mean() < hi
+
+
+def test_run_ab_tests_notes_undefined_studentized_interval():
+    df = clean_data(pd.concat(iter_campaign_data(200), ignore_index=True), save=False)
+    df["Revenue"] = 0.0
+    rpu = run_ab_tests(df, revenue_col="Revenue", bootstrap_method="studentized", bootstrap_iter=200,
+                       funnel=False)["rpu_ttest"]
+    assert np.isnan(rpu["ci_95"]).all()
+    assert "undefined" in rpu["note"]
@@ -0,0 +1,54 @@
+# tests/test_charts.py
+"""
+Chart specs built from ChartStats folded chunk by chunk (streaming / incremental
+modes) against the specs of the full frame.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.analysis_engine.aggregates import aggregate_groups
+from src.analysis_engine.charts import ChartStats, build_chart_specs, chart_stats
+from src.analysis_engine.incremental import fold_new_rows, load_state
+from src.analysis_engine.metrics import compute_kpis_from_stats
+from src.data_processing.cleaner import clean_data
+from src.data_processing.synthetic import iter_campaign_data
+
+
+@pytest.fixture(scope="module")
+def clean():
+    df = clean_data(pd.concat(iter_campaign_data(3_000, n_campaigns=4), ignore_index=True), save=False)
+    rng = np.random.default_rng(1)
+    df["Revenue"] = np.round(rng.gamma(2.0, 400.0, len(df)), 2)
+    return df
+
+
+def _specs(data, agg):
+    return build_chart_specs(data, compute_kpis_from_stats(agg), agg=agg, revenue_col=agg.revenue_col)
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 97, 1_000])
+def test_folded_chunks_match_full_frame(clean, chunk_rows):
+    stats = ChartStats()
+    for lo in range(0, len(clean), chunk_rows):
+        stats = stats.merge(chart_stats(clean.iloc[lo:lo + chunk_rows]))
+    agg = aggregate_groups(clean)
+    assert _specs(stats, agg) == _specs(clean, agg)
+
+
+def test_revenue_column_is_charted(clean):
+    agg = aggregate_groups(clean)
+    hist = next(s for s in _specs(chart_stats(clean), agg) if s["name"] == "Revenue Distribution")
+    assert hist["xlabel"] == "Revenue"
+    assert sum(hist["data"]["counts"]) == len(clean)
+    assert hist["data"]["edges"][0] <= clean["Revenue"].min()
+    assert hist["data"]["edges"][-1] > clean["Revenue"].max()
+
+
+def test_incremental_state_keeps_chart_inputs(tmp_path, clean):
+    path = tmp_path / "state.json"
+    for lo in range(0, len(clean), 700):
+        fold_new_rows(clean.iloc[lo:lo + 700], path=path)
+    state = load_state(path)
+    agg = aggregate_groups(clean)
+    assert _specs(state.charts, agg) == _specs(clean, agg)
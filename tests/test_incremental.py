@@ -0,0 +1,118 @@
+# tests/test_incremental.py
+"""
+Incremental folds of a growing raw export against the full mode, which cleans and
+aggregates every row at once.
+"""
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from src.analysis_engine.aggregates import aggregate_groups
+from src.analysis_engine.incremental import (KEY_WINDOW_DAYS, fold_new_rows, load_state, read_new_rows,
+                                             reset_state)
+from src.data_processing.cleaner import clean_data
+from src.data_processing.loader import DATA_RAW
+from src.data_processing.synthetic import iter_campaign_data
+
+SHIPPED = Path(__file__).resolve().parents[1] / DATA_RAW
+
+
+def _fold(csv, state_path, **kwargs):
+    df_raw, offset, tail, restarted = read_new_rows(csv, load_state(state_path))
+    df = clean_data(df_raw, save=False)
+    return fold_new_rows(df, path=state_path, rebuild=restarted, offset=offset, tail_digest=tail, **kwargs)
+
+
+def _full(csv):
+    return aggregate_groups(clean_data(pd.read_csv(csv), save=False))
+
+
+def _assert_same(agg, expected):
+    assert agg.groups.keys() == expected.groups.keys()
+    for g in expected.groups:
+        assert agg.groups[g].rows == expected.groups[g].rows
+        assert agg.groups[g].purchases == expected.groups[g].purchases
+        assert agg.groups[g].reach == expected.groups[g].reach
+
+
+def test_unterminated_last_line_is_folded(tmp_path):
+    csv = tmp_path / "campaign.csv"
+    text = SHIPPED.read_text()
+    assert not text.endswith("\n")
+    head, last = text.rsplit("\n", 1)
+    csv.write_text(head + "\n")
+    state = tmp_path / "state.json"
+
+    _fold(csv, state)
+    csv.write_text(text)  # the last row arrives without a trailing newline
+    folded, new = _fold(csv, state)
+    assert len(new) == 1
+    _assert_same(folded.agg, _full(csv))
+
+    # A later append starts with the newline the last row was missing
+    with open(csv, "a") as fh:
+        fh.write("\n" + last.replace("30.08.2019", "31.08.2019"))
+    folded, new = _fold(csv, state)
+    assert len(new) == 1
+    _assert_same(folded.agg, _full(csv))
+    assert load_state(state).offset == csv.stat().st_size
+
+
+def test_repeated_keys_are_summed_like_the_full_mode(tmp_path, caplog):
+    rows = pd.concat(iter_campaign_data(120, n_campaigns=2), ignore_index=True)
+    csv = tmp_path / "campaign.csv"
+    rows.iloc[:80].to_csv(csv, index=False)
+    state = tmp_path / "state.json"
+    _fold(csv, state)
+
+    # Re-sent rows (same campaign and date) plus new ones
+    pd.concat([rows.iloc[80:], rows.iloc[70:80]]).to_csv(csv, mode="a", header=False, index=False)
+    folded, new = _fold(csv, state)
+    assert len(new) == 50
+    assert "10 row(s) repeat" in caplog.text
+    _assert_same(folded.agg, _full(csv))
+    assert load_state(state).rows_repeated == 10
+
+    with open(csv, "a") as fh:
+        rows.iloc[:1].to_csv(fh, header=False, index=False)
+    with pytest.raises(ValueError, match="repeat"):
+        _fold(csv, state, on_duplicate="raise")
+
+
+def test_key_window_is_bounded(tmp_path):
+    rows = pd.concat(iter_campaign_data(400, n_campaigns=2), ignore_index=True)
+    csv = tmp_path / "campaign.csv"
+    state = tmp_path / "state.json"
+    for lo in range(0, len(rows), 100):
+        rows.iloc[lo:lo + 100].to_csv(csv, mode="a", header=lo == 0, index=False)
+        _fold(csv, state)
+    st = load_state(state)
+    cutoff = (pd.Timestamp(st.watermark) - pd.Timedelta(days=KEY_WINDOW_DAYS)).date().isoformat()
+    assert min(st.recent_keys) >= cutoff
+    assert len(st.recent_keys) <= KEY_WINDOW_DAYS + 1
+    assert st.rows_folded == len(rows)
+
+    reset_state(state)
+    assert not state.exists()
+
+
+def test_full_run_resets_the_incremental_state(tmp_path, monkeypatch):
+    from src.pipe import run_pipeline
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    raw = tmp_path / "campaign.csv"
+    text = SHIPPED.read_text()
+    head, last = text.rsplit("\n", 1)
+    raw.write_text(head + "\n")
+    state = str(tmp_path / "state.json")
+    processed = tmp_path / "data" / "processed" / "cleaned_campaign.csv"
+
+    run_pipeline(csv_path=str(raw), incremental=True, state_path=state)
+    raw.write_text(text)
+    full = run_pipeline(csv_path=str(raw), state_path=state)
+    n_full = len(pd.read_csv(processed))
+    incr = run_pipeline(csv_path=str(raw), incremental=True, state_path=state)
+    assert len(pd.read_csv(processed)) == n_full
+    assert incr["metrics"]["groups"] == full["metrics"]["groups"]
@@ -0,0 +1,70 @@
+# tests/test_memory.py
+"""
+Peak allocation of the in-memory analysis path, as checked by
+benchmarks.run_benchmarks, on a synthetic export large enough for the cleaned
+frame to dominate the fixed budgets.
+"""
+import tracemalloc
+
+import pytest
+
+from benchmarks.run_benchmarks import DIRTY, _analysis_path, frame_limit_mb
+from src.analysis_engine.aggregates import aggregate_groups
+from src.analysis_engine.charts import build_chart_specs
+from src.analysis_engine.metrics import compute_kpis
+from src.analysis_engine.statistic_test import run_ab_tests
+from src.data_processing.cleaner import clean_data
+from src.data_processing.loader import load_data
+from src.data_processing.synthetic import write_campaign_csv
+
+ROWS = 300_000
+
+
+@pytest.fixture(scope="module")
+def raw(tmp_path_factory):
+    path = tmp_path_factory.mktemp("memory") / "campaign.csv"
+    write_campaign_csv(path, ROWS, n_campaigns=ROWS // 2000, dirty=DIRTY)
+    return load_data(str(path))
+
+
+@pytest.fixture(scope="module")
+def clean(raw):
+    return clean_data(raw, save=False)
+
+
+def _frame_mb(df) -> float:
+    return df.memory_usage(deep=True).sum() / 1e6
+
+
+def _peak_mb(fn) -> float:
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 1e6
+
+
+def test_analysis_path_peak_within_frame_budget(raw, clean):
+    frame_mb = _frame_mb(clean)
+    peak_mb = _peak_mb(lambda: _analysis_path(raw))
+    assert peak_mb <= frame_limit_mb(frame_mb), f"peak {peak_mb:.1f} MB for a {frame_mb:.1f} MB frame"
+
+
+def test_cleaning_does_not_copy_the_frame(raw, clean):
+    # The cleaned output itself plus the parsed dates and group codes, not a second frame
+    assert _peak_mb(lambda: clean_data(raw, save=False)) <= 1.5 * _frame_mb(clean)
+
+
+@pytest.mark.parametrize("stage", ["aggregate_groups", "compute_kpis", "run_ab_tests", "build_chart_specs"])
+def test_stage_temporaries_below_one_frame(clean, stage):
+    agg = aggregate_groups(clean)
+    metrics = compute_kpis(clean)
+    run = {
+        "aggregate_groups": lambda: aggregate_groups(clean),
+        "compute_kpis": lambda: compute_kpis(clean),
+        "run_ab_tests": lambda: run_ab_tests(clean, agg=agg, bootstrap_rpu=False),
+        "build_chart_specs": lambda: build_chart_specs(clean, metrics, agg=agg),
+    }[stage]
+    assert _peak_mb(run) <= _frame_mb(clean)
@@ -0,0 +1,46 @@
+# tests/test_storage.py
+"""Processed output written by save_processed and read back by load_processed."""
+import pandas as pd
+import pytest
+
+from src.data_processing.cleaner import clean_data, save_processed
+from src.data_processing.loader import load_processed
+from src.data_processing.storage import detect_format
+from src.data_processing.synthetic import iter_campaign_data
+
+
+@pytest.fixture(scope="module")
+def clean():
+    return clean_data(pd.concat(iter_campaign_data(300, n_campaigns=3), ignore_index=True), save=False)
+
+
+def _normalized(df: pd.DataFrame, columns) -> pd.DataFrame:
+    """Comparable form: same column order, plain dtypes, rows sorted by their key."""
+    out = df[list(columns)].astype({c: str for c in ("Campaign Name", "group")})
+    out = out.astype({c: "float64" for c in out.columns if c not in ("Campaign Name", "group", "Date")})
+    out["Date"] = pd.to_datetime(out["Date"]).astype("datetime64[ns]")
+    return out.sort_values(["Date", "group", "Campaign Name"]).reset_index(drop=True)
+
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet", "ipc"])
+def test_round_trip(tmp_path, clean, fmt):
+    path = tmp_path / ("cleaned.csv" if fmt == "csv" else "dataset")
+    save_processed(clean, save_path=str(path), save_format=fmt)
+    if fmt != "csv":
+        assert detect_format(path) == fmt
+    back = load_processed(str(path))
+    assert set(back.columns) == set(clean.columns)
+    pd.testing.assert_frame_equal(_normalized(back, clean.columns), _normalized(clean, clean.columns))
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "ipc"])
+def test_projection_and_filters(tmp_path, clean, fmt):
+    path = tmp_path / "dataset"
+    save_processed(clean, save_path=str(path), save_format=fmt)
+    start = clean["Date"].min() + pd.Timedelta(days=2)
+    back = load_processed(str(path), columns=["Date", "group", "Reach"], start=str(start.date()), groups=["B"],
+                          fmt=fmt)
+    expected = clean[(clean["Date"] >= start) & (clean["group"] == "B")]
+    assert sorted(back.columns) == ["Date", "Reach", "group"]
+    assert len(back) == len(expected)
+    assert back["Reach"].sum() == expected["Reach"].sum()